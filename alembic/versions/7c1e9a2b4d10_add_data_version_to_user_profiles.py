@@ -0,0 +1,36 @@
+"""add data_version to user_profiles
+
+Revision ID: 7c1e9a2b4d10
+Revises: 65b3c4e8a1f2
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e9a2b4d10'
+down_revision: Union[str, None] = '65b3c4e8a1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Версия данных пользователя - часть ключа кэша графиков.
+    """
+    op.add_column(
+        'user_profiles',
+        sa.Column('data_version', sa.Integer(), nullable=False, server_default='0')
+    )
+
+
+def downgrade() -> None:
+    """
+    Удалить data_version.
+    """
+    with op.batch_alter_table('user_profiles') as batch_op:
+        batch_op.drop_column('data_version')
@@ -0,0 +1,40 @@
+"""add chart_files table
+
+Revision ID: a4f2d8c61e35
+Revises: 7c1e9a2b4d10
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4f2d8c61e35'
+down_revision: Union[str, None] = '7c1e9a2b4d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Telegram file_id последних отправленных графиков.
+    """
+    op.create_table(
+        'chart_files',
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('period_days', sa.Integer(), nullable=False),
+        sa.Column('series_hash', sa.String(length=64), nullable=False),
+        sa.Column('file_id', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'period_days')
+    )
+
+
+def downgrade() -> None:
+    """
+    Удалить chart_files.
+    """
+    op.drop_table('chart_files')
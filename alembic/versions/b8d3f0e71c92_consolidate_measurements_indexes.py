@@ -0,0 +1,87 @@
+"""consolidate measurements indexes into composite (user_id, date)
+
+Revision ID: b8d3f0e71c92
+Revises: a4f2d8c61e35
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d3f0e71c92'
+down_revision: Union[str, None] = 'a4f2d8c61e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Заменить ix_measurements_user_id, ix_measurements_date и _user_date_uc
+    одним уникальным индексом (user_id, date).
+    SQLite не удаляет UNIQUE-ограничение без recreation таблицы.
+    """
+    op.drop_index('ix_measurements_date', table_name='measurements')
+    op.drop_index('ix_measurements_user_id', table_name='measurements')
+
+    op.create_table(
+        'measurements_new',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=True),
+        sa.Column('waist', sa.Float(), nullable=True),
+        sa.Column('neck', sa.Float(), nullable=True),
+        sa.Column('calories', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    op.execute('''
+        INSERT INTO measurements_new (id, user_id, date, weight, waist, neck, calories, created_at, updated_at)
+        SELECT id, user_id, date, weight, waist, neck, calories, created_at, updated_at
+        FROM measurements
+    ''')
+
+    op.drop_table('measurements')
+    op.rename_table('measurements_new', 'measurements')
+
+    op.create_index('uix_measurements_user_date', 'measurements', ['user_id', 'date'], unique=True)
+
+
+def downgrade() -> None:
+    """
+    Вернуть отдельные индексы и ограничение _user_date_uc.
+    """
+    op.drop_index('uix_measurements_user_date', table_name='measurements')
+
+    op.create_table(
+        'measurements_new',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=True),
+        sa.Column('waist', sa.Float(), nullable=True),
+        sa.Column('neck', sa.Float(), nullable=True),
+        sa.Column('calories', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'date', name='_user_date_uc')
+    )
+
+    op.execute('''
+        INSERT INTO measurements_new (id, user_id, date, weight, waist, neck, calories, created_at, updated_at)
+        SELECT id, user_id, date, weight, waist, neck, calories, created_at, updated_at
+        FROM measurements
+    ''')
+
+    op.drop_table('measurements')
+    op.rename_table('measurements_new', 'measurements')
+
+    op.create_index('ix_measurements_user_id', 'measurements', ['user_id'])
+    op.create_index('ix_measurements_date', 'measurements', ['date'])
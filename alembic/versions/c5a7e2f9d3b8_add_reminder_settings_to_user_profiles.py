@@ -0,0 +1,51 @@
+"""add reminder settings to user_profiles
+
+Revision ID: c5a7e2f9d3b8
+Revises: b8d3f0e71c92
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a7e2f9d3b8'
+down_revision: Union[str, None] = 'b8d3f0e71c92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Персональные напоминания: время, часовой пояс и момент следующей отправки.
+
+    Существующим пользователям напоминание не включается (reminder_time = NULL):
+    раньше напоминания получал только владелец (ему включаются при запуске бота),
+    остальные включают их сами через /start или /remind.
+    """
+    op.add_column(
+        'user_profiles',
+        sa.Column('reminder_enabled', sa.Boolean(), nullable=False, server_default='0')
+    )
+    op.add_column('user_profiles', sa.Column('reminder_time', sa.Time(), nullable=True))
+    op.add_column(
+        'user_profiles',
+        sa.Column('timezone', sa.String(length=64), nullable=False, server_default='Europe/Moscow')
+    )
+    op.add_column('user_profiles', sa.Column('next_reminder_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_user_profiles_next_reminder_at', 'user_profiles', ['next_reminder_at'])
+
+
+def downgrade() -> None:
+    """
+    Удалить настройки напоминаний.
+    """
+    op.drop_index('ix_user_profiles_next_reminder_at', table_name='user_profiles')
+    with op.batch_alter_table('user_profiles') as batch_op:
+        batch_op.drop_column('next_reminder_at')
+        batch_op.drop_column('timezone')
+        batch_op.drop_column('reminder_time')
+        batch_op.drop_column('reminder_enabled')
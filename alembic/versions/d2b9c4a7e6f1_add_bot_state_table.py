@@ -0,0 +1,39 @@
+"""add bot_state table
+
+Revision ID: d2b9c4a7e6f1
+Revises: c5a7e2f9d3b8
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b9c4a7e6f1'
+down_revision: Union[str, None] = 'c5a7e2f9d3b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Состояние бота (user_data, состояния диалогов) для BasePersistence.
+    """
+    op.create_table(
+        'bot_state',
+        sa.Column('namespace', sa.String(length=64), nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('namespace', 'key')
+    )
+
+
+def downgrade() -> None:
+    """
+    Удалить bot_state.
+    """
+    op.drop_table('bot_state')
@@ -0,0 +1,72 @@
+"""add user_stats table
+
+Revision ID: e7f1a3c9b5d2
+Revises: d2b9c4a7e6f1
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7f1a3c9b5d2'
+down_revision: Union[str, None] = 'd2b9c4a7e6f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+METRICS = ('weight', 'waist', 'neck', 'calories')
+
+
+def upgrade() -> None:
+    """
+    Агрегаты по замерам пользователя (см. models.UserStats) и их заполнение из measurements.
+    """
+    columns = [sa.Column('user_id', sa.BigInteger(), nullable=False)]
+    for name in METRICS:
+        columns += [
+            sa.Column(f'{name}_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column(f'{name}_sum', sa.Float(), nullable=False, server_default='0'),
+            sa.Column(f'{name}_min', sa.Float(), nullable=True),
+            sa.Column(f'{name}_max', sa.Float(), nullable=True),
+            sa.Column(f'{name}_first', sa.Float(), nullable=True),
+            sa.Column(f'{name}_first_date', sa.Date(), nullable=True),
+            sa.Column(f'{name}_last', sa.Float(), nullable=True),
+            sa.Column(f'{name}_last_date', sa.Date(), nullable=True),
+        ]
+    columns.append(sa.Column('updated_at', sa.DateTime(), nullable=False))
+    op.create_table('user_stats', *columns, sa.PrimaryKeyConstraint('user_id'))
+
+    # Заполнить по существующим записям (то же, что queries.rebuild_user_stats)
+    names = ['user_id']
+    values = ['u.user_id']
+    for name in METRICS:
+        user_values = f"m.user_id = u.user_id AND m.{name} IS NOT NULL"
+        names += [f'{name}_{suffix}' for suffix in
+                  ('count', 'sum', 'min', 'max', 'first', 'first_date', 'last', 'last_date')]
+        values += [
+            f"(SELECT count(m.{name}) FROM measurements m WHERE {user_values})",
+            f"(SELECT coalesce(sum(m.{name}), 0) FROM measurements m WHERE {user_values})",
+            f"(SELECT min(m.{name}) FROM measurements m WHERE {user_values})",
+            f"(SELECT max(m.{name}) FROM measurements m WHERE {user_values})",
+            f"(SELECT m.{name} FROM measurements m WHERE {user_values} ORDER BY m.date ASC LIMIT 1)",
+            f"(SELECT m.date FROM measurements m WHERE {user_values} ORDER BY m.date ASC LIMIT 1)",
+            f"(SELECT m.{name} FROM measurements m WHERE {user_values} ORDER BY m.date DESC LIMIT 1)",
+            f"(SELECT m.date FROM measurements m WHERE {user_values} ORDER BY m.date DESC LIMIT 1)",
+        ]
+    names.append('updated_at')
+    values.append('CURRENT_TIMESTAMP')
+
+    op.execute(
+        f"INSERT INTO user_stats ({', '.join(names)}) "
+        f"SELECT {', '.join(values)} FROM (SELECT DISTINCT user_id FROM measurements) u"
+    )
+
+
+def downgrade() -> None:
+    """
+    Удалить user_stats.
+    """
+    op.drop_table('user_stats')
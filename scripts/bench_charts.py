@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк рендеринга графика прогресса по этапам.
+
+Для рядов из 7/30/60/365/1825 точек (ежедневные взвешивания, талия/шея
+раз в неделю, калории с пропусками) отдельно измеряются этапы рендеринга
+(visualization/charts.py):
+- columns  - строки → колонки NumPy и метрики прогресса
+- populate - подстановка данных в шаблон фигуры
+- layout   - tight_layout
+- encode   - PNG (dpi=CHART_DPI, bbox_inches='tight')
+- template - построение шаблона фигуры (один раз на процесс рендеринга)
+
+Дополнительно encode измеряется для разных DPI и с bbox_inches='tight'/без
+него (время и размер PNG). Пиковая память этапов (tracemalloc, только
+Python-аллокации) меряется отдельным проходом, чтобы не искажать время.
+
+Регрессии:
+- --save FILE сохраняет результат (с коммитом git), --baseline FILE
+  сравнивает с ним и падает (код 1), если медиана этапа выросла больше
+  чем на --max-regression (по умолчанию 25%)
+- --budget FILE - абсолютные лимиты, например
+  {"total_ms": {"30": 150, "1825": 400}, "png_kb": {"30": 120}, "peak_kb": {"1825": 4096}}
+
+Использование:
+    python scripts/bench_charts.py
+    python scripts/bench_charts.py --points 30,365 --repeat 50 --save before.json
+    python scripts/bench_charts.py --baseline before.json --max-regression 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from random import Random
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bench_handlers import git_commit  # noqa: E402
+from visualization.charts import CHART_DPI, CHART_SIZE, ChartTemplate  # noqa: E402
+from visualization.series import compute_progress_metrics, rows_to_columns  # noqa: E402
+
+DEFAULT_POINTS = (7, 30, 60, 365, 1825)
+DEFAULT_DPIS = (72, 100, 150)
+STAGES = ('columns', 'populate', 'layout', 'encode')
+
+
+def synthetic_rows(points: int, seed: int = 1) -> List[tuple]:
+    """
+    Строки (date, weight, waist, neck, calories) за points дней до сегодня, как из БД.
+    """
+    rng = Random(seed)
+    today = date.today()
+    weight = 95.0
+    rows = []
+    for offset in range(points - 1, -1, -1):
+        weight += rng.gauss(-0.05, 0.3)
+        weekly = offset % 7 == 0
+        rows.append((
+            today - timedelta(days=offset),
+            round(weight, 1),
+            round(weight + 5, 1) if weekly else None,
+            41.0 if weekly else None,
+            rng.randint(1600, 2600) if rng.random() < 0.9 else None,
+        ))
+    return rows
+
+
+def time_stages(template: ChartTemplate, rows: List[tuple], repeat: int, warmup: int) -> Dict[str, List[float]]:
+    """
+    Время этапов рендеринга, мс (этапы выполняются по порядку, как в ChartTemplate.render).
+
+    Returns:
+        stage → список замеров
+    """
+    samples = {stage: [] for stage in STAGES + ('total',)}
+    for i in range(warmup + repeat):
+        timings = {}
+
+        started = time.perf_counter()
+        columns = rows_to_columns(rows)
+        compute_progress_metrics(columns)
+        timings['columns'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        template.populate(columns, len(rows))
+        timings['populate'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        template.layout()
+        timings['layout'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        template.encode()
+        timings['encode'] = time.perf_counter() - started
+
+        if i >= warmup:
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds * 1000)
+            samples['total'].append(sum(timings.values()) * 1000)
+    return samples
+
+
+def peak_memory(stages: Dict[str, Callable[[], object]]) -> Dict[str, float]:
+    """
+    Пиковая память Python-аллокаций каждого этапа (КБ), этапы выполняются по порядку.
+    """
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for stage, run in stages.items():
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            run()
+            peaks[stage] = round((tracemalloc.get_traced_memory()[1] - baseline) / 1024, 1)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def summary(values: List[float]) -> dict:
+    ordered = sorted(values)
+    p95 = statistics.quantiles(ordered, n=20, method='inclusive')[18] if len(ordered) > 1 else ordered[0]
+    return {
+        'median': round(statistics.median(ordered), 3),
+        'p95': round(p95, 3),
+        'min': round(ordered[0], 3),
+    }
+
+
+def bench_points(points: int, dpis: List[int], repeat: int, warmup: int) -> dict:
+    """Все замеры для ряда из points точек."""
+    rows = synthetic_rows(points)
+    template = ChartTemplate(CHART_SIZE)
+    stages = {stage: summary(values) for stage, values in time_stages(template, rows, repeat, warmup).items()}
+
+    holder = {}
+    memory = peak_memory({
+        'columns': lambda: holder.update(columns=rows_to_columns(rows)),
+        'populate': lambda: template.populate(holder['columns'], points),
+        'layout': template.layout,
+        'encode': template.encode,
+    })
+
+    # Варианты кодирования на уже скомпонованной фигуре
+    encode = {}
+    for dpi in dpis:
+        for bbox_inches in ('tight', None):
+            timings, png = [], b''
+            for i in range(warmup + repeat):
+                started = time.perf_counter()
+                png = template.encode(dpi=dpi, bbox_inches=bbox_inches)
+                if i >= warmup:
+                    timings.append((time.perf_counter() - started) * 1000)
+            encode[f"dpi{dpi}{'-tight' if bbox_inches else ''}"] = dict(
+                summary(timings), png_kb=round(len(png) / 1024, 1)
+            )
+
+    return {
+        'stages': stages,
+        'peak_kb': memory,
+        'png_kb': encode[f'dpi{CHART_DPI}-tight']['png_kb'] if CHART_DPI in dpis else None,
+        'encode': encode,
+    }
+
+
+def measure_template(repeat: int) -> dict:
+    """Время построения шаблона фигуры (холодный старт процесса рендеринга не учитывается)."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        ChartTemplate(CHART_SIZE)
+        timings.append((time.perf_counter() - started) * 1000)
+    return summary(timings)
+
+
+def check_regressions(results: dict, baseline: dict, max_regression: float, min_delta_ms: float) -> List[str]:
+    """
+    Этапы, медиана которых выросла больше чем на max_regression относительно baseline.
+
+    Рост меньше min_delta_ms не считается (шум этапов короче миллисекунды).
+    """
+    failures = []
+    for points, current in results['points'].items():
+        previous = baseline.get('points', {}).get(points)
+        if previous is None:
+            continue
+        for stage, values in current['stages'].items():
+            before = previous['stages'].get(stage, {}).get('median')
+            if (before and values['median'] > before * (1 + max_regression)
+                    and values['median'] - before >= min_delta_ms):
+                failures.append(
+                    f"{points} points, {stage}: {before:.2f} → {values['median']:.2f} ms "
+                    f"(+{(values['median'] / before - 1) * 100:.0f}%)"
+                )
+    return failures
+
+
+def check_budget(results: dict, budget: dict) -> List[str]:
+    """
+    Нарушения абсолютных лимитов (total_ms - медиана полного рендеринга,
+    png_kb - размер PNG, peak_kb - максимальная пиковая память этапа).
+    """
+    failures = []
+    for points, current in results['points'].items():
+        actual = {
+            'total_ms': current['stages']['total']['median'],
+            'png_kb': current['png_kb'],
+            'peak_kb': max(current['peak_kb'].values()),
+        }
+        for metric, limits in budget.items():
+            limit = limits.get(points)
+            if limit is not None and actual.get(metric) is not None and actual[metric] > limit:
+                failures.append(f"{points} points, {metric}: {actual[metric]} > {limit}")
+    return failures
+
+
+def print_results(results: dict, baseline: dict = None):
+    header = f"{'points':>7}" + ''.join(f'{stage:>13}' for stage in STAGES + ('total',)) + f"{'png KB':>9}{'peak KB':>9}"
+    print(f"Stage medians, ms (template build: {results['template']['median']:.1f} ms)")
+    print(header)
+    for points, current in results['points'].items():
+        row = f'{points:>7}'
+        for stage in STAGES + ('total',):
+            value = current['stages'][stage]['median']
+            before = (baseline or {}).get('points', {}).get(points, {}).get('stages', {}).get(stage, {}).get('median')
+            delta = f'{(value / before - 1) * 100:+.0f}%' if before else ''
+            row += f'{value:>8.2f}{delta:>5}' if delta else f'{value:>13.2f}'
+        row += f"{current['png_kb'] or 0:>9.1f}{max(current['peak_kb'].values()):>9.0f}"
+        print(row)
+
+    print("\nEncode variants, median ms / PNG KB")
+    variants = list(next(iter(results['points'].values()))['encode'])
+    print(f"{'points':>7}" + ''.join(f'{name:>18}' for name in variants))
+    for points, current in results['points'].items():
+        print(f'{points:>7}' + ''.join(
+            f"{current['encode'][name]['median']:>9.1f} /{current['encode'][name]['png_kb']:>6.1f}"
+            for name in variants
+        ))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', default=','.join(map(str, DEFAULT_POINTS)), help='размеры рядов через запятую')
+    parser.add_argument('--dpi', default=','.join(map(str, DEFAULT_DPIS)), help='DPI вариантов кодирования')
+    parser.add_argument('--repeat', type=int, default=20, help='замеров на этап')
+    parser.add_argument('--warmup', type=int, default=3, help='прогревочных рендеров')
+    parser.add_argument('--save', help='сохранить результат в файл')
+    parser.add_argument('--baseline', help='сравнить с сохраненным результатом')
+    parser.add_argument('--max-regression', type=float, default=0.25, help='допустимый рост медианы этапа')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='минимальный учитываемый рост, мс')
+    parser.add_argument('--budget', help='JSON с абсолютными лимитами')
+    args = parser.parse_args()
+
+    points_list = [int(value) for value in args.points.split(',')]
+    dpis = [int(value) for value in args.dpi.split(',')]
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'repeat': args.repeat,
+            'chart_size': CHART_SIZE,
+            'chart_dpi': CHART_DPI,
+        },
+        'template': measure_template(max(3, args.repeat // 4)),
+        # Ключи - строки, как после загрузки из JSON
+        'points': {str(points): bench_points(points, dpis, args.repeat, args.warmup) for points in points_list},
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if baseline:
+        failures += check_regressions(results, baseline, args.max_regression, args.min_delta_ms)
+    if args.budget:
+        with open(args.budget) as f:
+            failures += check_budget(results, json.load(f))
+
+    if failures:
+        print("\n❌ Regression budget exceeded:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    if baseline or args.budget:
+        print("\n✅ Within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк обработчиков бота на синтетических пользователях.
+
+Через настоящий Application (те же обработчики, что в main.add_handlers,
+SQLitePersistence, пул рендеринга) прогоняются синтетические Update:
+/graph, смена периода графика, удаление записи и полный диалог /add.
+Сеть не нужна: запросы бота к Bot API обслуживает заглушка внутри
+процесса (make_stub_request), БД - временный файл SQLite с историей заданного
+размера (от недели до нескольких лет, от 1 до 100k пользователей).
+
+Для каждого обработчика печатаются p50/p95/p99, среднее, максимум и
+пропускная способность; --json сохраняет результат (с коммитом git)
+для сравнения между коммитами.
+
+Использование:
+    python scripts/bench_handlers.py
+    python scripts/bench_handlers.py --users 1000 --days 1825 -n 300 -c 16 --json bench.json
+    python scripts/bench_handlers.py --scenarios graph,add --cold
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import count
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+SCENARIOS = ('graph', 'graph_period', 'delete', 'add')
+PERIOD_CALLBACKS = ('graph_week', 'graph_month', 'graph_two_months')
+
+# Шаги диалога /add: (имя, текст сообщения или callback_data)
+ADD_STEPS = (
+    ('add:start', '/add'),
+    ('add:date', 'selectdate_0'),
+    ('add:weight', '81.5'),
+    ('add:waist', '90'),
+    ('add:neck', 'skip'),
+    ('add:calories', '2100'),
+)
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+def make_stub_request():
+    """
+    Создать экземпляр заглушки telegram.request.BaseRequest.
+
+    Отправленные сообщения и фото получают правдоподобный ответ
+    (Message с file_id), остальные методы - True. Тексты, начинающиеся
+    с "❌", считаются ошибками обработчиков.
+    """
+    from telegram.request import BaseRequest
+
+    class _StubRequest(BaseRequest):
+        def __init__(self):
+            self.calls = {}
+            self.errors = 0
+            self._message_ids = count(1)
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None):
+            api_method = url.rsplit('/', 1)[-1]
+            self.calls[api_method] = self.calls.get(api_method, 0) + 1
+            params = request_data.parameters if request_data is not None else {}
+            return 200, json.dumps({'ok': True, 'result': self._result(api_method, params)}).encode()
+
+        def _result(self, api_method, params):
+            if api_method == 'getMe':
+                return BOT_USER
+            if api_method not in ('sendMessage', 'sendPhoto'):
+                return True
+
+            chat_id = int(params.get('chat_id', 0))
+            message = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+            }
+            if api_method == 'sendMessage':
+                text = str(params.get('text', ''))
+                if text.startswith('❌'):
+                    self.errors += 1
+                message['text'] = text
+            else:
+                file_id = f"photo-{message['message_id']}"
+                message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1200, 'height': 700}]
+            return message
+
+    return _StubRequest()
+
+
+def seed_database(users: int, days: int, seed: int):
+    """
+    Заполнить БД историей: days дней до вчерашнего включительно для каждого пользователя.
+
+    Сегодняшний день остается свободным для диалога /add.
+    """
+    from database import queries
+    from database.models import SessionLocal, engine
+
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow().isoformat(sep=' ')
+    batch = []
+
+    def flush(connection):
+        connection.exec_driver_sql(
+            "INSERT INTO measurements (user_id, date, weight, waist, neck, calories, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            batch
+        )
+        batch.clear()
+
+    with engine.begin() as connection:
+        for user_id in user_ids(users):
+            weight = rng.uniform(70, 110)
+            for offset in range(days, 0, -1):
+                weight += rng.gauss(-0.05, 0.3)
+                batch.append((
+                    user_id,
+                    (today - timedelta(days=offset)).isoformat(),
+                    round(weight, 1),
+                    round(weight + 10, 1) if offset % 7 == 0 else None,
+                    40.0 if offset % 7 == 0 else None,
+                    rng.randint(1600, 2600),
+                    now,
+                    now,
+                ))
+                if len(batch) >= 50000:
+                    flush(connection)
+        if batch:
+            flush(connection)
+
+    db = SessionLocal()
+    try:
+        queries.rebuild_user_stats(db)
+    finally:
+        db.close()
+
+
+def user_ids(users: int) -> range:
+    """ID синтетических пользователей."""
+    return range(100000, 100000 + users)
+
+
+class Bench:
+    """
+    Прогон сценариев на одном Application.
+
+    Args:
+        application: Инициализированный Application
+        stub: Заглушка Bot API (make_stub_request)
+        users: Количество пользователей в БД
+        days: Дней истории
+        concurrency: Одновременно обрабатываемых пользователей
+        cold: Сбрасывать кэш графиков перед каждым /graph
+        seed: Seed генератора
+    """
+
+    def __init__(self, application, stub, users: int, days: int, concurrency: int, cold: bool, seed: int):
+        self.application = application
+        self.stub = stub
+        self.users = list(user_ids(users))
+        self.days = days
+        self.concurrency = concurrency
+        self.cold = cold
+        self.rng = random.Random(seed)
+        self.samples = {}
+        self._update_ids = count(1)
+
+    def _update(self, user_id: int, text: str = None, callback_data: str = None):
+        from telegram import Update
+
+        update_id = next(self._update_ids)
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+        chat = {'id': user_id, 'type': 'private', 'first_name': user['first_name']}
+        message = {'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user}
+
+        if callback_data is not None:
+            data = {
+                'update_id': update_id,
+                'callback_query': {
+                    'id': str(update_id),
+                    'from': user,
+                    'chat_instance': str(user_id),
+                    'data': callback_data,
+                    'message': dict(message, text='...', **{'from': BOT_USER}),
+                }
+            }
+        else:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+            data = {'update_id': update_id, 'message': message}
+        return Update.de_json(data, self.application.bot)
+
+    async def _timed(self, name: str, update) -> float:
+        started = time.perf_counter()
+        await self.application.process_update(update)
+        elapsed = time.perf_counter() - started
+        self.samples.setdefault(name, []).append(elapsed * 1000)
+        return elapsed
+
+    async def _run(self, name: str, jobs: list):
+        """Выполнить корутины не более чем по concurrency одновременно и записать время фазы."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(job):
+            async with semaphore:
+                await job()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_one(job) for job in jobs))
+        self.samples.setdefault(f'{name}:wall', []).append(time.perf_counter() - started)
+
+    async def graph(self, iterations: int):
+        from database.async_queries import delete_chart_file
+        from visualization.chart_cache import chart_cache
+
+        async def job():
+            user_id = self.rng.choice(self.users)
+            if self.cold:
+                chart_cache.discard_user(user_id)
+                await delete_chart_file(user_id, 30)
+            await self._timed('graph', self._update(user_id, '/graph'))
+
+        await self._run('graph', [job for _ in range(iterations)])
+
+    async def graph_period(self, iterations: int):
+        async def job():
+            user_id = self.rng.choice(self.users)
+            await self._timed('graph_period', self._update(user_id, callback_data=self.rng.choice(PERIOD_CALLBACKS)))
+
+        await self._run('graph_period', [job for _ in range(iterations)])
+
+    async def delete(self, iterations: int):
+        from database.async_queries import get_measurement_by_date
+
+        # Разные (пользователь, дата), чтобы каждое удаление находило запись
+        targets = set()
+        while len(targets) < min(iterations, len(self.users) * self.days):
+            targets.add((self.rng.choice(self.users), self.rng.randint(1, self.days)))
+
+        measurement_ids = []
+        for user_id, offset in targets:
+            measurement = await get_measurement_by_date(user_id, date.today() - timedelta(days=offset))
+            measurement_ids.append((user_id, measurement.id))
+
+        def job_for(user_id, measurement_id):
+            async def job():
+                await self._timed('delete', self._update(user_id, callback_data=f'delete_{measurement_id}'))
+            return job
+
+        await self._run('delete', [job_for(*target) for target in measurement_ids])
+
+    async def add(self, iterations: int):
+        # Сначала пользователи без записи за сегодня: первые len(users) диалогов пишут в БД
+        order = self.users[:]
+        self.rng.shuffle(order)
+
+        def job_for(user_id):
+            async def job():
+                total = 0.0
+                for name, value in ADD_STEPS:
+                    if value.startswith('selectdate_'):
+                        update = self._update(user_id, callback_data=value)
+                    else:
+                        update = self._update(user_id, value)
+                    total += await self._timed(name, update)
+                self.samples.setdefault('add', []).append(total * 1000)
+            return job
+
+        # Один пользователь не ведет два диалога одновременно
+        for start in range(0, iterations, len(order)):
+            batch = [order[i % len(order)] for i in range(start, min(iterations, start + len(order)))]
+            await self._run('add', [job_for(user_id) for user_id in batch])
+
+
+def summarize(samples: dict) -> dict:
+    """
+    Сводка по обработчикам.
+
+    Returns:
+        name → count, p50, p95, p99, mean, max (мс), throughput (в секунду)
+    """
+    results = {}
+    for name, values in samples.items():
+        if name.endswith(':wall'):
+            continue
+        ordered = sorted(values)
+        quantiles = statistics.quantiles(ordered, n=100, method='inclusive') if len(ordered) > 1 else ordered * 99
+        scenario = name.split(':')[0]
+        wall = sum(samples.get(f'{scenario}:wall', [0.0]))
+        results[name] = {
+            'count': len(ordered),
+            'p50': round(quantiles[49], 3),
+            'p95': round(quantiles[94], 3),
+            'p99': round(quantiles[98], 3),
+            'mean': round(statistics.fmean(ordered), 3),
+            'max': round(ordered[-1], 3),
+            'throughput': round(len(ordered) / wall, 2) if wall else None,
+        }
+    return results
+
+
+def git_commit() -> str:
+    """Текущий коммит (для сравнения результатов), пустая строка вне git."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+async def run(args) -> dict:
+    from telegram.ext import Application
+
+    from main import add_handlers
+    from bot.persistence import SQLitePersistence
+    from database.async_queries import shutdown_db_executor
+    from visualization.chart_warmup import chart_warmup
+    from visualization.render_pool import render_pool
+
+    stub = make_stub_request()
+    application = (
+        Application.builder()
+        .token('123456:BENCH')
+        .request(stub)
+        .get_updates_request(make_stub_request())
+        .persistence(SQLitePersistence())
+        .build()
+    )
+    add_handlers(application)
+
+    errors = []
+
+    async def count_errors(update, context):
+        errors.append(repr(context.error))
+
+    application.add_error_handler(count_errors)
+
+    # Прогрев графиков после записи мешал бы измерению /graph
+    chart_warmup.enabled = args.warmup
+    render_pool.start()
+    await application.initialize()
+
+    bench = Bench(application, stub, args.users, args.days, args.concurrency, args.cold, args.seed)
+    try:
+        for scenario in args.scenarios:
+            started = time.perf_counter()
+            await getattr(bench, scenario)(args.iterations)
+            print(f"   {scenario}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        await chart_warmup.stop()
+    finally:
+        await application.shutdown()
+        render_pool.shutdown()
+        shutdown_db_executor()
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'users': args.users,
+            'days': args.days,
+            'iterations': args.iterations,
+            'concurrency': args.concurrency,
+            'cold': args.cold,
+            'seed': args.seed,
+            'handler_errors': len(errors) + stub.errors,
+            'api_calls': stub.calls,
+        },
+        'results': summarize(bench.samples),
+    }
+
+
+def print_table(report: dict):
+    meta = report['meta']
+    print(f"commit={meta['commit'] or '-'} users={meta['users']} days={meta['days']} "
+          f"concurrency={meta['concurrency']} cold={meta['cold']} errors={meta['handler_errors']}")
+    print(f"{'handler':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>9}")
+    for name, row in report['results'].items():
+        throughput = f"{row['throughput']:.1f}" if row['throughput'] else '-'
+        print(f"{name:<14}{row['count']:>7}{row['p50']:>10.1f}{row['p95']:>10.1f}"
+              f"{row['p99']:>10.1f}{row['max']:>10.1f}{throughput:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='пользователей в БД (1-100000)')
+    parser.add_argument('--days', type=int, default=365, help='дней истории у каждого (7-1825)')
+    parser.add_argument('-n', '--iterations', type=int, default=200, help='запросов на сценарий')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='одновременных пользователей')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"через запятую из {', '.join(SCENARIOS)}")
+    parser.add_argument('--cold', action='store_true', help='сбрасывать кэш графика перед каждым /graph')
+    parser.add_argument('--warmup', action='store_true', help='не отключать прогрев графика после /add')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='файл БД (по умолчанию временный)')
+    parser.add_argument('--json', help='сохранить результат в файл')
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Настройки БД читаются при импорте database.models
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='deficit-bench-'), 'bench.db')
+    fresh = not os.path.exists(db_path)
+    os.environ['DB_PATH'] = db_path
+    os.environ.pop('CHART_CACHE_DIR', None)
+
+    from migrate import run_migrations
+    if run_migrations() != 0:
+        return 1
+    if fresh:
+        started = time.perf_counter()
+        seed_database(args.users, args.days, args.seed)
+        print(f"   seeded {args.users} users × {args.days} days in {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+
+    report = asyncio.run(run(args))
+    print_table(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
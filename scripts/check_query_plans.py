@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Проверка планов запросов к measurements.
+
+Запускает tests/test_query_plans.py: временная БД по миграциям Alembic,
+реальные функции из database.queries и EXPLAIN QUERY PLAN - каждый запрос
+должен искать по индексу uix_measurements_user_date (без полного
+сканирования таблицы и без сортировки во временном B-tree).
+
+Использование:
+    python scripts/check_query_plans.py
+    python scripts/check_query_plans.py -v
+"""
+import argparse
+import os
+import sys
+
+import pytest
+
+TEST_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'test_query_plans.py'
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-v', '--verbose', action='store_true', help='показать каждую проверку')
+    args = parser.parse_args()
+
+    return int(pytest.main([TEST_FILE, '-v' if args.verbose else '-q']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
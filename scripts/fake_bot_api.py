@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка Telegram Bot API для end-to-end и soak-тестов.
+
+HTTP-сервер (aiohttp) с тем же протоколом, что api.telegram.org:
+POST/GET /bot<token>/<method>. Бот подключается к нему через
+TELEGRAM_API_URL=http://127.0.0.1:<port> и работает как с настоящим Telegram:
+- getUpdates (long polling с offset/timeout) или setWebhook (заглушка сама
+  отправляет обновления на webhook бота, как Telegram)
+- sendMessage, sendPhoto (загрузка PNG или повторная отправка по file_id),
+  answerCallbackQuery, editMessageText и служебные методы (getMe, deleteWebhook...)
+
+Поведение сети настраивается:
+- latency / jitter - задержка ответа на каждый вызов
+- fail_rate - доля отправок, на которые отвечает 429 Too Many Requests
+- chat_rate / global_rate - лимиты отправки в секунду (в чат и всего), при
+  превышении - 429 с retry_after, как у Telegram
+
+Обновления подаются методом FakeBotApi.inject (или POST /_updates), ответы
+бота складываются в журнал чата - по нему нагрузочный скрипт
+(scripts/soak_test.py) ждет ответа и нажимает кнопки. GET /_stats - счетчики.
+
+Использование (отдельно от soak_test.py):
+    python scripts/fake_bot_api.py --port 8081 --latency 50 --fail-rate 0.01
+    TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=123:TEST python src/main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Deque, Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Deficit', 'username': 'deficit_test_bot'}
+
+# Методы, отправляющие сообщения в чат (к ним применяются лимиты и 429)
+SEND_METHODS = frozenset({'sendMessage', 'sendPhoto', 'editMessageText', 'editMessageReplyMarkup'})
+# Служебные методы, на которые достаточно ответить True
+TRUE_METHODS = frozenset({
+    'answerCallbackQuery', 'deleteMyCommands', 'setMyCommands', 'deleteWebhook',
+    'deleteMessage', 'sendChatAction', 'close', 'logOut',
+})
+# Сколько последних сообщений хранить в журнале чата
+CHAT_LOG_SIZE = 50
+
+
+@dataclass
+class SentMessage:
+    """Сообщение, отправленное ботом в чат."""
+    message_id: int
+    method: str
+    text: str
+    reply_markup: Optional[dict]
+    sent_at: float
+
+    def buttons(self) -> List[str]:
+        """callback_data всех inline-кнопок сообщения."""
+        if not self.reply_markup:
+            return []
+        return [
+            button['callback_data']
+            for row in self.reply_markup.get('inline_keyboard', [])
+            for button in row
+            if 'callback_data' in button
+        ]
+
+
+@dataclass
+class ChatLog:
+    """Последние сообщения бота в чате и общий счетчик (номер следующего сообщения)."""
+    total: int = 0
+    messages: Deque[SentMessage] = field(default_factory=lambda: deque(maxlen=CHAT_LOG_SIZE))
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+    send_times: Deque[float] = field(default_factory=deque)
+
+
+@dataclass
+class ApiStats:
+    """Счетчики заглушки."""
+    calls: Dict[str, int] = field(default_factory=dict)
+    too_many_requests: int = 0
+    bad_requests: int = 0
+    updates_injected: int = 0
+    updates_delivered: int = 0
+    webhook_errors: int = 0
+
+
+class TelegramError(Exception):
+    """Ошибка Bot API: превращается в ответ {"ok": false, ...}."""
+
+    def __init__(self, status: int, description: str, retry_after: Optional[int] = None):
+        super().__init__(description)
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+    def payload(self) -> dict:
+        payload = {'ok': False, 'error_code': self.status, 'description': self.description}
+        if self.retry_after is not None:
+            payload['parameters'] = {'retry_after': self.retry_after}
+        return payload
+
+
+class FakeBotApi:
+    """
+    Заглушка Bot API: состояние (очередь обновлений, журналы чатов) и HTTP-обработчики.
+
+    Args:
+        latency_ms: Задержка ответа на каждый вызов (мс)
+        jitter_ms: Дополнительная случайная задержка 0..jitter_ms (мс)
+        fail_rate: Доля отправок, на которые отвечает 429 (0..1)
+        chat_rate: Максимум отправок в один чат в секунду (0 - без лимита)
+        global_rate: Максимум отправок в секунду всего (0 - без лимита)
+        retry_after: retry_after для случайных 429 (сек)
+        seed: Seed генератора случайных задержек и ошибок
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        fail_rate: float = 0.0,
+        chat_rate: float = 0,
+        global_rate: float = 0,
+        retry_after: int = 1,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.stats = ApiStats()
+
+        # Бот подключился (первый getUpdates или setWebhook)
+        self.connected = asyncio.Event()
+        self.webhook_url = ''
+        self.webhook_secret = ''
+        self.webhook_max_connections = 40
+
+        self._chats: Dict[int, ChatLog] = {}
+        self._updates: Deque[dict] = deque()
+        self._updates_changed = asyncio.Event()
+        self._update_ids = count(1)
+        self._message_ids = count(1)
+        self._file_ids = set()
+        self._global_send_times: Deque[float] = deque()
+        self._webhook_session: Optional[ClientSession] = None
+        self._webhook_slots: Optional[asyncio.Semaphore] = None
+        self._webhook_tasks = set()
+
+    # Обновления
+
+    def inject(self, update: dict) -> int:
+        """
+        Подать обновление боту (update_id назначается здесь).
+
+        Args:
+            update: Update без update_id (message или callback_query)
+
+        Returns:
+            Назначенный update_id
+        """
+        update = dict(update, update_id=next(self._update_ids))
+        self.stats.updates_injected += 1
+
+        if self.webhook_url:
+            task = asyncio.create_task(self._push_webhook(update))
+            self._webhook_tasks.add(task)
+            task.add_done_callback(self._webhook_tasks.discard)
+        else:
+            self._updates.append(update)
+            self._updates_changed.set()
+        return update['update_id']
+
+    async def _push_webhook(self, update: dict):
+        """Отправить обновление на webhook бота (с повторами, как Telegram)."""
+        async with self._webhook_slots:
+            for attempt in range(5):
+                try:
+                    async with self._webhook_session.post(
+                        self.webhook_url, json=update,
+                        headers={'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret}
+                    ) as response:
+                        if response.status == 200:
+                            self.stats.updates_delivered += 1
+                            return
+                except Exception:
+                    pass
+                self.stats.webhook_errors += 1
+                await asyncio.sleep(0.5 * (attempt + 1))
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        # offset подтверждает все обновления с меньшим update_id
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+
+        if not self._updates and timeout > 0:
+            self._updates_changed.clear()
+            try:
+                await asyncio.wait_for(self._updates_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        batch = list(self._updates)[:limit]
+        self.stats.updates_delivered += len(batch)
+        return batch
+
+    # Журнал чатов
+
+    def chat(self, chat_id: int) -> ChatLog:
+        log = self._chats.get(chat_id)
+        if log is None:
+            log = self._chats[chat_id] = ChatLog()
+        return log
+
+    def mark(self, chat_id: int) -> int:
+        """Номер следующего сообщения бота в чате (для wait_reply)."""
+        return self.chat(chat_id).total
+
+    async def wait_reply(self, chat_id: int, after: int, timeout: float) -> SentMessage:
+        """
+        Дождаться сообщения бота в чате с номером after (отправленного после mark).
+
+        Raises:
+            asyncio.TimeoutError: Если бот не ответил за timeout секунд
+        """
+        log = self.chat(chat_id)
+        deadline = time.monotonic() + timeout
+        while log.total <= after:
+            log.changed.clear()
+            await asyncio.wait_for(log.changed.wait(), max(0.0, deadline - time.monotonic()))
+
+        # Сообщение могло вытесниться из журнала - тогда самое старое из оставшихся
+        index = len(log.messages) - (log.total - after)
+        return log.messages[max(0, index)]
+
+    def _record(self, chat_id: int, method: str, text: str, reply_markup: Optional[dict]) -> SentMessage:
+        message = SentMessage(next(self._message_ids), method, text, reply_markup, time.monotonic())
+        log = self.chat(chat_id)
+        log.messages.append(message)
+        log.total += 1
+        log.changed.set()
+        return message
+
+    # Лимиты
+
+    def _check_limits(self, chat_id: int):
+        """Ответить 429, если отправка превышает лимит или выпала случайная ошибка."""
+        now = time.monotonic()
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            raise TelegramError(429, f'Too Many Requests: retry after {self.retry_after}', self.retry_after)
+
+        for times, rate in ((self.chat(chat_id).send_times, self.chat_rate), (self._global_send_times, self.global_rate)):
+            if not rate:
+                continue
+            while times and now - times[0] >= 1.0:
+                times.popleft()
+            if len(times) >= rate:
+                retry_after = max(1, int(1.0 - (now - times[0])) + 1)
+                raise TelegramError(429, f'Too Many Requests: retry after {retry_after}', retry_after)
+
+        for times, rate in ((self.chat(chat_id).send_times, self.chat_rate), (self._global_send_times, self.global_rate)):
+            if rate:
+                times.append(now)
+
+    # HTTP
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """POST/GET /bot<token>/<method>."""
+        method = request.match_info['method']
+        self.stats.calls[method] = self.stats.calls.get(method, 0) + 1
+
+        delay = self.latency_ms + (self.rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        try:
+            params = await self._read_params(request)
+            result = await self._call(method, params)
+        except TelegramError as e:
+            if e.status == 429:
+                self.stats.too_many_requests += 1
+            else:
+                self.stats.bad_requests += 1
+            return web.json_response(e.payload(), status=e.status)
+        return web.json_response({'ok': True, 'result': result})
+
+    @staticmethod
+    async def _read_params(request: web.Request) -> dict:
+        """Параметры из query, JSON, формы или multipart (сложные значения - JSON-строки)."""
+        params = dict(request.query)
+        if request.content_type == 'application/json':
+            params.update(await request.json())
+        elif request.can_read_body:
+            # Файлы (sendPhoto) приходят как web.FileField
+            params.update(await request.post())
+        return params
+
+    async def _call(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            self.connected.set()
+            return await self._get_updates(params)
+        if method == 'setWebhook':
+            return await self._set_webhook(params)
+        if method == 'getWebhookInfo':
+            return {'url': self.webhook_url, 'has_custom_certificate': False,
+                    'pending_update_count': len(self._updates)}
+        if method in SEND_METHODS:
+            return self._send(method, params)
+        if method in TRUE_METHODS:
+            if method == 'deleteWebhook':
+                self.webhook_url = ''
+            return True
+        raise TelegramError(404, 'Not Found: method not found')
+
+    async def _set_webhook(self, params: dict) -> bool:
+        self.webhook_url = params.get('url', '')
+        self.webhook_secret = params.get('secret_token', '')
+        self.webhook_max_connections = int(params.get('max_connections') or 40)
+        if self.webhook_url:
+            if self._webhook_session is None:
+                self._webhook_session = ClientSession(timeout=ClientTimeout(total=30))
+            self._webhook_slots = asyncio.Semaphore(self.webhook_max_connections)
+            # Обновления, накопленные до setWebhook, уходят на webhook
+            while self._updates:
+                update = self._updates.popleft()
+                task = asyncio.create_task(self._push_webhook(update))
+                self._webhook_tasks.add(task)
+                task.add_done_callback(self._webhook_tasks.discard)
+            self.connected.set()
+        return True
+
+    def _send(self, method: str, params: dict) -> dict:
+        try:
+            chat_id = int(params['chat_id'])
+        except (KeyError, ValueError):
+            raise TelegramError(400, 'Bad Request: chat not found')
+        self._check_limits(chat_id)
+
+        reply_markup = params.get('reply_markup')
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+
+        message = {
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if reply_markup and 'inline_keyboard' in reply_markup:
+            message['reply_markup'] = reply_markup
+
+        if method == 'sendPhoto':
+            photo = params.get('photo')
+            if isinstance(photo, web.FileField):
+                file_id = f'photo-{len(self._file_ids) + 1}'
+                self._file_ids.add(file_id)
+            elif photo in self._file_ids:
+                file_id = photo
+            else:
+                raise TelegramError(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+            text = params.get('caption', '')
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1200, 'height': 700}]
+            if text:
+                message['caption'] = text
+        else:
+            text = params.get('text', '')
+            message['text'] = text
+
+        sent = self._record(chat_id, method, text, reply_markup)
+        message['message_id'] = sent.message_id
+        return message
+
+    async def handle_inject(self, request: web.Request) -> web.Response:
+        """POST /_updates: подать обновление (или список) из внешнего скрипта."""
+        payload = await request.json()
+        updates = payload if isinstance(payload, list) else [payload]
+        return web.json_response({'update_ids': [self.inject(update) for update in updates]})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        """GET /_stats: счетчики заглушки."""
+        return web.json_response(self.stats.__dict__)
+
+    def create_app(self) -> web.Application:
+        """aiohttp-приложение с маршрутами Bot API и служебными /_updates, /_stats."""
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        app.router.add_post('/_updates', self.handle_inject)
+        app.router.add_get('/_stats', self.handle_stats)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def _cleanup(self, app: web.Application):
+        for task in list(self._webhook_tasks):
+            task.cancel()
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        if self._webhook_session is not None:
+            await self._webhook_session.close()
+
+
+async def start_server(api: FakeBotApi, host: str, port: int) -> web.AppRunner:
+    """
+    Запустить заглушку в текущем event loop.
+
+    Returns:
+        AppRunner (для остановки - await runner.cleanup())
+    """
+    runner = web.AppRunner(api.create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def add_network_arguments(parser: argparse.ArgumentParser):
+    """Общие параметры поведения сети (для этого скрипта и soak_test.py)."""
+    parser.add_argument('--latency', type=float, default=0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--jitter', type=float, default=0, help='случайная добавка к задержке, мс')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='доля отправок с ответом 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after случайных 429, сек')
+    parser.add_argument('--chat-rate', type=float, default=0, help='лимит отправок в чат в секунду (0 - нет)')
+    parser.add_argument('--global-rate', type=float, default=0, help='лимит отправок в секунду всего (0 - нет)')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def api_from_arguments(args) -> FakeBotApi:
+    return FakeBotApi(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        fail_rate=args.fail_rate,
+        chat_rate=args.chat_rate,
+        global_rate=args.global_rate,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    add_network_arguments(parser)
+    args = parser.parse_args()
+
+    async def serve():
+        api = api_from_arguments(args)
+        runner = await start_server(api, args.host, args.port)
+        print(f"Fake Bot API listening on http://{args.host}:{args.port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
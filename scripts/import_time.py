@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Время импорта модулей при старте бота (на основе python -X importtime).
+
+Импортирует модуль (по умолчанию main) в отдельном процессе несколько раз
+и печатает медиану общего времени и самые дорогие модули по суммарному
+(cumulative) времени. Тяжелые модули, которые не должны загружаться
+при старте (matplotlib, numpy, aiohttp), отмечаются отдельно.
+
+Использование:
+    python scripts/import_time.py
+    python scripts/import_time.py --module bot.handlers --top 30 --runs 5
+    python scripts/import_time.py --json > import_time.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Модули, которые должны загружаться лениво
+LAZY_MODULES = ('matplotlib', 'numpy', 'pandas', 'aiohttp')
+
+
+def measure(module: str) -> dict:
+    """
+    Импортировать модуль в новом процессе и разобрать вывод -X importtime.
+
+    Args:
+        module: Имя модуля
+
+    Returns:
+        dict {модуль: (self_us, cumulative_us)} для модулей верхнего уровня импорта
+        и ключ '__total__' с общим временем
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONWARNINGS='ignore')
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        timings[name] = (int(self_us), int(cumulative_us), depth)
+
+    timings['__total__'] = (0, timings[module][1], 0)
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='main', help='модуль для импорта (из src/)')
+    parser.add_argument('--runs', type=int, default=3, help='количество замеров')
+    parser.add_argument('--top', type=int, default=20, help='сколько модулей показать')
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    # Медиана по каждому модулю (модули, найденные во всех замерах)
+    names = set.intersection(*(set(run) for run in runs))
+    cumulative = {name: statistics.median(run[name][1] for run in runs) for name in names}
+    self_time = {name: statistics.median(run[name][0] for run in runs) for name in names}
+    depth = {name: runs[0][name][2] for name in names}
+
+    total_ms = cumulative.pop('__total__') / 1000
+    loaded_lazy = sorted({name.split('.')[0] for name in names if name.split('.')[0] in LAZY_MODULES})
+    top = sorted(cumulative, key=cumulative.get, reverse=True)[:args.top]
+
+    if args.json:
+        print(json.dumps({
+            'module': args.module,
+            'runs': args.runs,
+            'total_ms': round(total_ms, 1),
+            'heavy_modules_loaded': loaded_lazy,
+            'modules': [
+                {'name': name, 'cumulative_ms': round(cumulative[name] / 1000, 1), 'self_ms': round(self_time[name] / 1000, 1)}
+                for name in top
+            ]
+        }, indent=2))
+        return 0
+
+    print(f"import {args.module}: {total_ms:.0f} ms (median of {args.runs})")
+    print(f"{'cumulative':>12} {'self':>8}  module")
+    for name in top:
+        print(f"{cumulative[name] / 1000:10.1f}ms {self_time[name] / 1000:6.1f}ms  {'  ' * depth[name]}{name}")
+
+    if loaded_lazy:
+        print(f"\n⚠️  Heavy modules loaded at import: {', '.join(loaded_lazy)}")
+    else:
+        print(f"\n✅ None of {', '.join(LAZY_MODULES)} loaded at import")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Пересчет агрегатов user_stats по таблице measurements.
+
+Агрегаты обновляются каждой записью бота, а при миграции заполняются
+автоматически. Пересчет нужен после восстановления БД из бэкапа или
+ручных правок measurements. С --check ничего не записывается: текущие
+агрегаты сравниваются с пересчитанными, при расхождении код выхода 1.
+
+Использование:
+    python scripts/rebuild_user_stats.py [--user USER_ID] [--check]
+"""
+import argparse
+import math
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(os.path.join(BASE_DIR, '.env'))
+
+from sqlalchemy import select  # noqa: E402
+
+from database import queries  # noqa: E402
+from database.models import DB_PATH, SessionLocal, UserStats  # noqa: E402
+
+# Допустимое расхождение сумм (накопленная ошибка float при инкрементальных обновлениях)
+SUM_TOLERANCE = 1e-6
+
+STAT_COLUMNS = [column for column in UserStats.__table__.columns if column.name != 'updated_at']
+
+
+def snapshot(db, user_id=None) -> dict:
+    """
+    Текущие агрегаты.
+
+    Returns:
+        user_id → dict значений колонок (без updated_at)
+    """
+    stmt = select(*STAT_COLUMNS)
+    if user_id is not None:
+        stmt = stmt.where(UserStats.user_id == user_id)
+    return {row.user_id: row._asdict() for row in db.execute(stmt)}
+
+
+def differences(expected: dict, actual: dict) -> list:
+    """
+    Сравнить два снимка агрегатов.
+
+    Returns:
+        Список строк с описанием расхождений
+    """
+    problems = []
+    for user_id in sorted(expected.keys() | actual.keys()):
+        if user_id not in actual:
+            problems.append(f"user {user_id}: missing")
+            continue
+        if user_id not in expected:
+            problems.append(f"user {user_id}: no measurements, stale stats")
+            continue
+        for name, value in expected[user_id].items():
+            current = actual[user_id][name]
+            if name.endswith('_sum'):
+                same = math.isclose(value, current, rel_tol=SUM_TOLERANCE, abs_tol=SUM_TOLERANCE)
+            else:
+                same = value == current
+            if not same:
+                problems.append(f"user {user_id}: {name} = {current!r}, expected {value!r}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Пересчитать user_stats по measurements")
+    parser.add_argument('--user', type=int, default=None, help="Только для одного пользователя")
+    parser.add_argument('--check', action='store_true', help="Только сравнить, ничего не записывать")
+    args = parser.parse_args()
+
+    print(f"   Database: {DB_PATH}")
+    db = SessionLocal()
+    try:
+        if not args.check:
+            users = queries.rebuild_user_stats(db, args.user)
+            print(f"✅ User stats rebuilt for {users} users")
+            return 0
+
+        actual = snapshot(db, args.user)
+        queries.rebuild_user_stats(db, args.user, commit=False)
+        expected = snapshot(db, args.user)
+        db.rollback()
+    finally:
+        db.close()
+
+    problems = differences(expected, actual)
+    for problem in problems:
+        print(f"   {problem}")
+    if problems:
+        print(f"❌ User stats differ from measurements ({len(problems)} mismatches)")
+        return 1
+    print(f"✅ User stats match measurements ({len(expected)} users)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
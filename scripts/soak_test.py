@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Soak-тест всего бота без сети: src/main.py против локальной заглушки Bot API.
+
+Скрипт поднимает заглушку (scripts/fake_bot_api.py), запускает бота
+отдельным процессом (временная БД, TELEGRAM_API_URL на заглушку, режим
+polling или webhook) и моделирует пользователей, которые одновременно
+проходят сценарии как живые люди:
+- /add: выбор даты кнопкой, вес, талия, шея (или пропуск), калории
+- /graph: график и переключение периода кнопкой
+- /delete: список записей и удаление выбранной кнопкой
+
+Каждый шаг - обновление от пользователя и ожидание ответа бота в его чате;
+следующий шаг выбирается по кнопкам из ответа. Печатаются задержки шагов
+(p50/p95/p99), успешные и сорванные сценарии, ответы с ошибками, вызовы
+Bot API и полученные ботом 429, а также память процесса бота (RSS) во
+времени - рост памяти за длинный прогон виден как наклон в МБ/мин.
+
+Использование:
+    python scripts/soak_test.py --users 200 --duration 60
+    python scripts/soak_test.py --users 2000 --duration 600 --mode webhook --latency 40 --jitter 60 \\
+        --fail-rate 0.01 --global-rate 30 --json soak.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from fake_bot_api import FakeBotApi, SentMessage, add_network_arguments, api_from_arguments, start_server
+from bench_handlers import git_commit, summarize
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOT_TOKEN = '123456:SOAK'
+WEBHOOK_SECRET = 'soak-secret'
+# Доли сценариев
+FLOW_WEIGHTS = {'add': 0.5, 'graph': 0.35, 'delete': 0.15}
+# Ответ бота с ошибкой и с предупреждением (некорректный ввод, запись уже есть)
+ERROR_PREFIX = '❌'
+WARNING_PREFIX = '⚠️'
+
+
+class FlowFailed(Exception):
+    """Сценарий прерван: нет ответа, ответ с ошибкой или нет нужной кнопки."""
+
+
+@dataclass
+class SoakStats:
+    """Результаты прогона."""
+    samples: Dict[str, List[float]] = field(default_factory=dict)
+    flows: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    timeouts: int = 0
+    error_replies: int = 0
+    warning_replies: int = 0
+    error_examples: List[str] = field(default_factory=list)
+    # (секунды от старта, RSS бота, RSS бота с дочерними процессами), МБ
+    memory: List[Tuple[float, float, float]] = field(default_factory=list)
+
+    def flow_result(self, flow: str, ok: bool):
+        counters = self.flows.setdefault(flow, {'ok': 0, 'failed': 0})
+        counters['ok' if ok else 'failed'] += 1
+
+
+class VirtualUser:
+    """
+    Синтетический пользователь: проходит сценарии по ответам бота.
+
+    Args:
+        api: Заглушка Bot API
+        user_id: Telegram ID (он же chat_id)
+        stats: Общие результаты
+        rng: Генератор случайных чисел
+        think_time: Средняя пауза между шагами (сек)
+        reply_timeout: Сколько ждать ответа бота (сек)
+    """
+
+    def __init__(self, api: FakeBotApi, user_id: int, stats: SoakStats, rng: random.Random,
+                 think_time: float, reply_timeout: float):
+        self.api = api
+        self.user_id = user_id
+        self.stats = stats
+        self.rng = rng
+        self.think_time = think_time
+        self.reply_timeout = reply_timeout
+        self.weight = rng.uniform(70, 110)
+
+    def _user(self) -> dict:
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f'User{self.user_id}'}
+
+    def _message(self, text: str) -> dict:
+        chat = {'id': self.user_id, 'type': 'private', 'first_name': f'User{self.user_id}'}
+        message = {'message_id': 0, 'date': int(time.time()), 'chat': chat, 'from': self._user(), 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'message': message}
+
+    def _callback(self, data: str, reply_to: SentMessage) -> dict:
+        chat = {'id': self.user_id, 'type': 'private'}
+        message = {'message_id': reply_to.message_id, 'date': int(time.time()), 'chat': chat,
+                   'from': {'id': 1, 'is_bot': True, 'first_name': 'Deficit'}, 'text': reply_to.text}
+        return {'callback_query': {
+            'id': f'{self.user_id}-{time.monotonic_ns()}',
+            'from': self._user(),
+            'chat_instance': str(self.user_id),
+            'data': data,
+            'message': message,
+        }}
+
+    async def step(self, name: str, update: dict, allow_warning: bool = False, check: bool = True) -> SentMessage:
+        """
+        Отправить обновление и дождаться первого ответа бота.
+
+        Предупреждение прерывает сценарий, если только это не его последний
+        шаг (allow_warning): например, запись за выбранную дату уже есть.
+        check=False - не проверять текст ответа (/cancel отвечает "❌ ... отменен").
+        """
+        mark = self.api.mark(self.user_id)
+        started = time.perf_counter()
+        self.api.inject(update)
+        try:
+            reply = await self.api.wait_reply(self.user_id, mark, self.reply_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            raise FlowFailed(f'{name}: timeout')
+        self.stats.samples.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+
+        if not check:
+            return reply
+        if reply.text.startswith(ERROR_PREFIX):
+            self.stats.error_replies += 1
+            if len(self.stats.error_examples) < 10:
+                self.stats.error_examples.append(f'{name}: {reply.text[:120]}')
+            raise FlowFailed(f'{name}: {reply.text[:40]}')
+        if reply.text.startswith(WARNING_PREFIX):
+            self.stats.warning_replies += 1
+            if not allow_warning:
+                raise FlowFailed(f'{name}: {reply.text[:40]}')
+        return reply
+
+    async def think(self):
+        if self.think_time:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think_time))
+
+    def _press(self, reply: SentMessage, prefix: str) -> str:
+        buttons = [data for data in reply.buttons() if data.startswith(prefix)]
+        if not buttons:
+            raise FlowFailed(f'no {prefix} button')
+        return self.rng.choice(buttons)
+
+    async def add_flow(self):
+        reply = await self.step('add:start', self._message('/add'))
+        await self.think()
+        await self.step('add:date', self._callback(self._press(reply, 'selectdate_'), reply))
+        await self.think()
+        self.weight += self.rng.gauss(-0.05, 0.3)
+        await self.step('add:weight', self._message(f'{self.weight:.1f}'))
+        await self.think()
+        await self.step('add:waist', self._message(f'{self.weight + 10:.1f}' if self.rng.random() < 0.3 else 'skip'))
+        await self.think()
+        await self.step('add:neck', self._message('40' if self.rng.random() < 0.3 else '-'))
+        await self.think()
+        await self.step('add:calories', self._message(str(self.rng.randint(1600, 2600))), allow_warning=True)
+
+    async def graph_flow(self):
+        reply = await self.step('graph:open', self._message('/graph'))
+        if not reply.buttons():
+            return  # Нет данных - график не строится
+        await self.think()
+        await self.step('graph:period', self._callback(self._press(reply, 'graph_'), reply))
+
+    async def delete_flow(self):
+        reply = await self.step('delete:list', self._message('/delete'))
+        if not reply.buttons():
+            return  # Нечего удалять
+        await self.think()
+        await self.step('delete:confirm', self._callback(self._press(reply, 'delete_'), reply))
+
+    async def run(self, deadline: float):
+        """Проходить случайные сценарии до deadline (time.monotonic)."""
+        flows = list(FLOW_WEIGHTS)
+        weights = list(FLOW_WEIGHTS.values())
+        while time.monotonic() < deadline:
+            flow = self.rng.choices(flows, weights)[0]
+            try:
+                await getattr(self, f'{flow}_flow')()
+                self.stats.flow_result(flow, True)
+            except FlowFailed:
+                self.stats.flow_result(flow, False)
+                if flow == 'add':
+                    # Не оставлять диалог /add незавершенным
+                    try:
+                        await self.step('add:cancel', self._message('/cancel'), check=False)
+                    except FlowFailed:
+                        pass
+            await self.think()
+
+
+def process_tree_rss(pid: int) -> Tuple[Optional[float], Optional[float]]:
+    """
+    RSS процесса и всех его потомков (пул рендеринга) по /proc, МБ.
+
+    Returns:
+        (RSS процесса, RSS с потомками); (None, None) без /proc
+    """
+    def rss(process: int) -> float:
+        try:
+            with open(f'/proc/{process}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    if not os.path.exists(f'/proc/{pid}'):
+        return None, None
+
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Имя процесса в скобках может содержать пробелы
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    own = rss(pid)
+    total, stack = 0.0, [pid]
+    while stack:
+        process = stack.pop()
+        total += rss(process)
+        stack.extend(children.get(process, []))
+    return own, total
+
+
+def growth_per_minute(points: List[Tuple[float, float]]) -> Optional[float]:
+    """Наклон линейной регрессии (МБ/мин) по точкам (секунды, МБ)."""
+    if len(points) < 3:
+        return None
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if not variance:
+        return None
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / variance * 60
+
+
+def bot_environment(args, workdir: str) -> dict:
+    """Окружение процесса бота: заглушка вместо Telegram, временная БД."""
+    env = dict(os.environ)
+    env.update({
+        'TELEGRAM_BOT_TOKEN': BOT_TOKEN,
+        'TELEGRAM_API_URL': f'http://127.0.0.1:{args.api_port}',
+        'OWNER_USER_ID': '',
+        'DB_PATH': os.path.join(workdir, 'soak.db'),
+        'CHART_CACHE_DIR': os.path.join(workdir, 'chart_cache'),
+        'BOT_MODE': args.mode,
+        'PYTHONUNBUFFERED': '1',
+    })
+    if args.mode == 'webhook':
+        env.update({
+            'WEBHOOK_URL': f'http://127.0.0.1:{args.webhook_port}',
+            'WEBHOOK_PATH': '/telegram',
+            'WEBHOOK_SECRET': WEBHOOK_SECRET,
+            'WEBHOOK_HOST': '127.0.0.1',
+            'WEBHOOK_PORT': str(args.webhook_port),
+        })
+    return env
+
+
+async def sample_memory(pid: int, stats: SoakStats, started: float, interval: float):
+    while True:
+        own, total = process_tree_rss(pid)
+        if own is None:
+            return
+        stats.memory.append((time.monotonic() - started, own, total))
+        await asyncio.sleep(interval)
+
+
+async def soak(args, workdir: str) -> Tuple[dict, int]:
+    """
+    Прогон: заглушка, бот, пользователи.
+
+    Returns:
+        (отчет, код выхода бота)
+    """
+    api = api_from_arguments(args)
+    runner = await start_server(api, '127.0.0.1', args.api_port)
+    env = bot_environment(args, workdir)
+    log_path = os.path.join(workdir, 'bot.log')
+    stats = SoakStats()
+
+    migrate = subprocess.run([sys.executable, 'migrate.py'], cwd=BASE_DIR, env=env,
+                             capture_output=True, text=True)
+    if migrate.returncode != 0:
+        await runner.cleanup()
+        raise RuntimeError(f'migrations failed:\n{migrate.stdout}{migrate.stderr}')
+
+    with open(log_path, 'w') as log:
+        bot = subprocess.Popen([sys.executable, os.path.join('src', 'main.py')], cwd=BASE_DIR,
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+    exit_code = None
+    try:
+        # Бот готов, когда начал забирать обновления (или зарегистрировал webhook)
+        connect = asyncio.create_task(api.connected.wait())
+        while not connect.done():
+            if bot.poll() is not None:
+                raise RuntimeError(f'bot exited with code {bot.returncode}, see {log_path}')
+            await asyncio.wait([connect], timeout=0.2)
+        print(f"   bot connected ({args.mode}), pid {bot.pid}", file=sys.stderr)
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        sampler = asyncio.create_task(sample_memory(bot.pid, stats, started, args.sample_interval))
+
+        rng = random.Random(args.seed)
+        users = [
+            VirtualUser(api, 200000 + i, stats, random.Random(rng.random()), args.think, args.reply_timeout)
+            for i in range(args.users)
+        ]
+
+        async def start_user(index: int, user: VirtualUser):
+            # Пользователи подключаются равномерно за время разгона
+            await asyncio.sleep(args.ramp * index / max(1, len(users)))
+            await user.run(deadline)
+
+        tasks = [asyncio.create_task(start_user(i, user)) for i, user in enumerate(users)]
+        while not all(task.done() for task in tasks):
+            if bot.poll() is not None:
+                print(f"   bot exited during the run with code {bot.returncode}", file=sys.stderr)
+                for task in tasks:
+                    task.cancel()
+                break
+            await asyncio.wait(tasks, timeout=1.0)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.monotonic() - started
+        sampler.cancel()
+    finally:
+        if bot.poll() is None:
+            # Штатная остановка (как Ctrl+C): проверяет и корректное завершение под нагрузкой
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.to_thread(bot.wait, 60)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+                await asyncio.to_thread(bot.wait)
+        exit_code = bot.returncode
+        await runner.cleanup()
+
+    for flow in FLOW_WEIGHTS:
+        stats.samples[f'{flow}:wall'] = [elapsed]
+    results = summarize(stats.samples)
+
+    memory = {}
+    if stats.memory:
+        settled = [m for m in stats.memory if m[0] >= args.ramp] or stats.memory
+        memory = {
+            'rss_start_mb': round(stats.memory[0][1], 1),
+            'rss_peak_mb': round(max(m[1] for m in stats.memory), 1),
+            'rss_end_mb': round(stats.memory[-1][1], 1),
+            'rss_total_peak_mb': round(max(m[2] for m in stats.memory), 1),
+            'growth_mb_per_min': growth_per_minute([(t, own) for t, own, _ in settled]),
+            'samples': [(round(t, 1), round(own, 1), round(total, 1)) for t, own, total in stats.memory],
+        }
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'mode': args.mode,
+            'users': args.users,
+            'duration': round(elapsed, 1),
+            'think': args.think,
+            'latency_ms': args.latency,
+            'jitter_ms': args.jitter,
+            'fail_rate': args.fail_rate,
+            'chat_rate': args.chat_rate,
+            'global_rate': args.global_rate,
+            'bot_exit_code': exit_code,
+            'bot_log': log_path,
+        },
+        'flows': stats.flows,
+        'timeouts': stats.timeouts,
+        'error_replies': stats.error_replies,
+        'warning_replies': stats.warning_replies,
+        'error_examples': stats.error_examples,
+        'api': dict(api.stats.__dict__),
+        'results': results,
+        'memory': memory,
+    }
+    return report, exit_code
+
+
+def print_report(report: dict):
+    meta = report['meta']
+    print(f"commit={meta['commit'] or '-'} mode={meta['mode']} users={meta['users']} "
+          f"duration={meta['duration']}s bot_exit={meta['bot_exit_code']}")
+    for flow, counters in report['flows'].items():
+        print(f"  {flow:<8} ok={counters['ok']:<7} failed={counters['failed']}")
+    print(f"  timeouts={report['timeouts']} error_replies={report['error_replies']} "
+          f"warning_replies={report['warning_replies']}")
+    for example in report['error_examples']:
+        print(f"    {example}")
+
+    api = report['api']
+    calls = ', '.join(f'{method}={n}' for method, n in sorted(api['calls'].items()))
+    print(f"Bot API: {calls}")
+    print(f"  429 served={api['too_many_requests']} bad requests={api['bad_requests']} "
+          f"updates injected={api['updates_injected']} delivered={api['updates_delivered']}")
+
+    print(f"{'step':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>9}")
+    for name, row in sorted(report['results'].items()):
+        throughput = f"{row['throughput']:.1f}" if row['throughput'] else '-'
+        print(f"{name:<16}{row['count']:>7}{row['p50']:>10.1f}{row['p95']:>10.1f}"
+              f"{row['p99']:>10.1f}{row['max']:>10.1f}{throughput:>9}")
+
+    memory = report['memory']
+    if memory:
+        growth = memory['growth_mb_per_min']
+        print(f"Memory RSS MB: start={memory['rss_start_mb']} peak={memory['rss_peak_mb']} "
+              f"end={memory['rss_end_mb']} with children peak={memory['rss_total_peak_mb']} "
+              f"growth={'-' if growth is None else f'{growth:+.2f} MB/min'}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='одновременных пользователей')
+    parser.add_argument('--duration', type=float, default=60, help='длительность прогона, сек')
+    parser.add_argument('--ramp', type=float, default=10, help='время подключения всех пользователей, сек')
+    parser.add_argument('--think', type=float, default=1.0, help='средняя пауза пользователя между шагами, сек')
+    parser.add_argument('--reply-timeout', type=float, default=30, help='сколько ждать ответа бота, сек')
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling')
+    parser.add_argument('--api-port', type=int, default=18081, help='порт заглушки Bot API')
+    parser.add_argument('--webhook-port', type=int, default=18082, help='порт webhook бота')
+    parser.add_argument('--sample-interval', type=float, default=2.0, help='период замера памяти, сек')
+    parser.add_argument('--keep', action='store_true', help='не удалять временную БД и лог бота')
+    parser.add_argument('--json', help='сохранить отчет в файл')
+    add_network_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='deficit-soak-')
+    try:
+        report, exit_code = asyncio.run(soak(args, workdir))
+    except RuntimeError as e:
+        # Временный каталог с логом бота остается для разбора
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if exit_code == 0 and report['timeouts'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка webhook-сервера синтетическими обновлениями.
+
+Отправляет POST-запросы с JSON Update (сообщения и нажатия кнопок от
+разных пользователей) и печатает статусы ответов и задержки.
+
+Режимы:
+- по умолчанию - запросы к уже запущенному боту (BOT_MODE=webhook);
+  внимание: бот будет пытаться отвечать синтетическим user_id
+- --self-test - поднять webhook-сервер в этом процессе с Application
+  без сети и проверить прием обновлений, секретный токен и /healthz
+
+Использование:
+    python scripts/webhook_harness.py --self-test
+    python scripts/webhook_harness.py --url http://localhost:8080/telegram --secret $WEBHOOK_SECRET -n 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from itertools import count
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bot.webhook import SECRET_HEADER, create_webhook_app  # noqa: E402
+
+TEXTS = ['/start', '/graph', '/add', '82.4', '/remind', '📈 График']
+CALLBACKS = ['graph_week', 'graph_month', 'graph_two_months']
+
+_update_ids = count(1)
+
+
+def synthetic_update(user_id: int) -> dict:
+    """
+    Собрать JSON Update: сообщение или нажатие inline-кнопки.
+
+    Args:
+        user_id: ID синтетического пользователя
+
+    Returns:
+        dict в формате Bot API
+    """
+    update_id = next(_update_ids)
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    chat = {'id': user_id, 'type': 'private', 'first_name': user['first_name']}
+    message = {'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user}
+
+    if update_id % 4 == 0:
+        bot_message = dict(message, text='📈 Выбери период')
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': user,
+                'chat_instance': str(user_id),
+                'data': CALLBACKS[update_id % len(CALLBACKS)],
+                'message': bot_message
+            }
+        }
+
+    text = TEXTS[update_id % len(TEXTS)]
+    message['text'] = text
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+async def post_updates(url: str, secret: str, total: int, users: int, concurrency: int) -> list:
+    """
+    Отправить total обновлений не более чем concurrency запросами одновременно.
+
+    Returns:
+        Список (status, latency_ms)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async with ClientSession(headers={SECRET_HEADER: secret}) as session:
+        async def post_one(i: int):
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=synthetic_update(1000 + i % users)) as response:
+                    await response.read()
+                    results.append((response.status, (time.perf_counter() - started) * 1000))
+
+        await asyncio.gather(*(post_one(i) for i in range(total)))
+    return results
+
+
+def report(results: list):
+    """Напечатать распределение статусов и задержек."""
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(latency for _, latency in results)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+
+    print(f"Requests: {len(results)}  statuses: {statuses}")
+    print(f"Latency ms: p50={quantiles[49]:.1f} p95={quantiles[94]:.1f} p99={quantiles[98]:.1f} max={latencies[-1]:.1f}")
+
+
+async def self_test(total: int, users: int, concurrency: int) -> int:
+    """
+    Поднять webhook-сервер с Application без сети и проверить его.
+
+    Returns:
+        Код выхода (0 - успех)
+    """
+    from telegram.ext import Application
+
+    application = Application.builder().token('123456:TEST').build()
+    secret = 'harness-secret'
+    port = 18080
+    url = f'http://127.0.0.1:{port}/telegram'
+
+    runner = web.AppRunner(create_webhook_app(application, '/telegram', secret))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    ok = True
+    try:
+        async with ClientSession() as session:
+            async with session.post(url, json=synthetic_update(1), headers={SECRET_HEADER: 'wrong'}) as response:
+                ok &= response.status == 403
+                print(f"{'✅' if response.status == 403 else '❌'} wrong secret -> {response.status}")
+            async with session.post(url, data=b'not json', headers={SECRET_HEADER: secret}) as response:
+                ok &= response.status == 400
+                print(f"{'✅' if response.status == 400 else '❌'} invalid body -> {response.status}")
+            async with session.get(f'http://127.0.0.1:{port}/healthz') as response:
+                ok &= response.status == 503
+                print(f"{'✅' if response.status == 503 else '❌'} /healthz before start -> {response.status}")
+
+        results = await post_updates(url, secret, total, users, concurrency)
+        report(results)
+        accepted = application.update_queue.qsize()
+        ok &= accepted == total and all(status == 200 for status, _ in results)
+        print(f"{'✅' if accepted == total else '❌'} updates queued: {accepted}/{total}")
+    finally:
+        await runner.cleanup()
+
+    return 0 if ok else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=f"http://localhost:{os.getenv('WEBHOOK_PORT', '8080')}{os.getenv('WEBHOOK_PATH', '/telegram')}")
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET', ''))
+    parser.add_argument('-n', '--total', type=int, default=200, help='количество обновлений')
+    parser.add_argument('-u', '--users', type=int, default=20, help='количество синтетических пользователей')
+    parser.add_argument('-c', '--concurrency', type=int, default=20, help='одновременных запросов')
+    parser.add_argument('--self-test', action='store_true', help='проверить сервер в этом процессе')
+    args = parser.parse_args()
+
+    if args.self_test:
+        return asyncio.run(self_test(args.total, args.users, args.concurrency))
+
+    report(asyncio.run(post_updates(args.url, args.secret, args.total, args.users, args.concurrency)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
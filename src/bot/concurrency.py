@@ -0,0 +1,123 @@
+"""
+Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+Обновления разных пользователей обрабатываются параллельно (до
+MAX_CONCURRENT_UPDATES одновременно), а обновления одного пользователя -
+строго по очереди, в порядке поступления. Поэтому диалог /add
+(ConversationHandler) видит сообщения пользователя в правильном порядке,
+а долгий график одного пользователя не задерживает остальных.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from monitoring.profiler import update_profiler
+
+logger = logging.getLogger(__name__)
+
+# Максимум одновременно выполняющихся обработчиков
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
+# Максимум принятых в обработку обновлений (выполняются + ждут своей очереди)
+MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', '1024'))
+
+
+class _UserQueue:
+    """Замок пользователя и число обновлений, которые его держат или ждут."""
+    __slots__ = ('lock', 'refs')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Update processor: параллельно между пользователями, последовательно внутри пользователя.
+
+    Семафор базового класса ограничивает число принятых обновлений
+    (max_pending_updates). Лимит одновременно выполняющихся обработчиков
+    берется только после замка пользователя, поэтому обновления,
+    ждущие своей очереди, не занимают слоты других пользователей.
+
+    Args:
+        max_concurrent_updates: Максимум одновременно выполняющихся обработчиков
+        max_pending_updates: Максимум принятых обновлений
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int = MAX_CONCURRENT_UPDATES,
+        max_pending_updates: int = MAX_PENDING_UPDATES
+    ):
+        # Базовый семафор должен быть > 1, иначе Application обрабатывает обновления последовательно
+        super().__init__(max(max_pending_updates, max_concurrent_updates, 2))
+        self.concurrency_limit = max_concurrent_updates
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._queues: Dict[int, _UserQueue] = {}
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[int]:
+        """
+        Ключ, внутри которого обновления обрабатываются по порядку.
+
+        Args:
+            update: Обновление
+
+        Returns:
+            ID пользователя (или чата), None - порядок не важен
+        """
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    @property
+    def active_users(self) -> int:
+        """Количество пользователей, у которых есть обновления в обработке."""
+        return len(self._queues)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        Выполнить обработку обновления после предыдущих обновлений того же пользователя.
+
+        Args:
+            update: Обновление
+            coroutine: Корутина обработки (от Application)
+        """
+        key = self.ordering_key(update)
+        if key is None:
+            async with self._running:
+                await update_profiler.wrap(update, coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _UserQueue()
+        queue.refs += 1
+
+        try:
+            # asyncio.Lock будит ожидающих в порядке FIFO
+            async with queue.lock:
+                async with self._running:
+                    await update_profiler.wrap(update, coroutine)
+        finally:
+            queue.refs -= 1
+            if queue.refs == 0 and self._queues.get(key) is queue:
+                del self._queues[key]
+
+    async def initialize(self) -> None:
+        logger.info(
+            f"Concurrent update processing: {self.concurrency_limit} handlers, per-user ordering"
+        )
+
+    async def shutdown(self) -> None:
+        # Очереди не очищаются: обновления, которые еще завершаются, удаляют
+        # свои очереди сами (после clear() их finally падал бы с KeyError)
+        pass
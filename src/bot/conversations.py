@@ -11,13 +11,38 @@ from telegram.ext import (
     CallbackQueryHandler,
     filters
 )
-from sqlalchemy.exc import IntegrityError
 
-from database.models import SessionLocal
-from database.queries import create_measurement, update_or_create_calories
+from database.async_queries import save_daily_entry, get_progress_metrics
+from visualization.chart_service import DEFAULT_PERIOD_DAYS
+from visualization.formatting import format_metrics_message
+from visualization.chart_warmup import chart_warmup
 
 # Состояния conversation
 WEIGHT, WAIST, NECK, CALORIES, DATE_SELECTION = range(5)
+# Имена состояний (для метрик)
+STATE_NAMES = {
+    WEIGHT: 'weight',
+    WAIST: 'waist',
+    NECK: 'neck',
+    CALORIES: 'calories',
+    DATE_SELECTION: 'date_selection',
+}
+
+# Ключи user_data, которые заполняет диалог /add
+ENTRY_KEYS = ('selected_date', 'weight', 'waist', 'neck', 'calories')
+
+
+def clear_entry_data(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Удалить из user_data данные диалога /add.
+
+    Остальные настройки пользователя (например, graph_period) сохраняются.
+
+    Args:
+        context: Контекст обработчика
+    """
+    for key in ENTRY_KEYS:
+        context.user_data.pop(key, None)
 
 
 async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -249,28 +274,27 @@ async def calories_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Вычислить дату для калорий (день назад)
         calories_date = selected_date - timedelta(days=1)
 
-        # Сохранить в БД
-        db = SessionLocal()
+        # Сохранить в БД одной транзакцией:
+        # вес/талия/шея за selected_date и калории за предыдущий день
         try:
-            # 1. Создать запись за selected_date с весом/талией/шеей (БЕЗ калорий)
-            measurement = create_measurement(
-                db=db,
+            measurement = await save_daily_entry(
                 user_id=user_id,
                 measurement_date=selected_date,
                 weight=weight,
                 waist=waist,
                 neck=neck,
-                calories=None  # Калории сохраняются отдельно за предыдущий день
-            )
-
-            # 2. Сохранить/обновить калории за предыдущий день
-            calories_measurement = update_or_create_calories(
-                db=db,
-                user_id=user_id,
-                measurement_date=calories_date,
+                calories_date=calories_date,
                 calories=calories
             )
 
+            if measurement is None:
+                date_str = selected_date.strftime("%d.%m.%Y")
+                await update.message.reply_text(
+                    f"⚠️ Запись за {date_str} уже существует!\n"
+                    f"Используй кнопку 🗑️ Удалить запись чтобы удалить старую."
+                )
+                return ConversationHandler.END
+
             date_str = selected_date.strftime("%d.%m.%Y")
             calories_date_str = calories_date.strftime("%d.%m.%Y")
             waist_str = f"{waist} см" if waist else "пропущено"
@@ -284,29 +308,28 @@ async def calories_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"• Шея: {neck_str}\n\n"
                 f"📅 За {calories_date_str}:\n"
                 f"• Калории: {calories} ккал\n\n"
-                f"Используй кнопки ниже для следующих действий."
             )
+
+            # Итоги за все время - из агрегатов user_stats, без чтения всех записей
+            progress = await get_progress_metrics(user_id)
+            if progress.get('weight_count', 0) > 1:
+                success_message += format_metrics_message(progress, title="📊 Прогресс за все время:") + "\n"
+
+            success_message += "Используй кнопки ниже для следующих действий."
             await update.message.reply_text(success_message)
 
-        except IntegrityError:
-            db.rollback()
-            date_str = selected_date.strftime("%d.%m.%Y")
-            await update.message.reply_text(
-                f"⚠️ Запись за {date_str} уже существует!\n"
-                f"Используй кнопку 🗑️ Удалить запись чтобы удалить старую."
-            )
+            # Следующее действие почти всегда - график: построить его заранее
+            chart_warmup.schedule(user_id, context.user_data.get('graph_period', DEFAULT_PERIOD_DAYS))
 
         except Exception as e:
-            db.rollback()
             await update.message.reply_text(
                 f"❌ Ошибка при сохранении: {str(e)}\n"
                 f"Попробуй снова с кнопки 📊 Внести данные"
             )
 
         finally:
-            db.close()
-            # Очистить user_data
-            context.user_data.clear()
+            # Очистить данные диалога
+            clear_entry_data(context)
 
         return ConversationHandler.END
 
@@ -328,7 +351,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "❌ Ввод данных отменен.\n"
         "Используй /add чтобы начать снова."
     )
-    context.user_data.clear()
+    clear_entry_data(context)
     return ConversationHandler.END
 
 
@@ -346,4 +369,7 @@ add_conversation_handler = ConversationHandler(
         CALORIES: [MessageHandler(filters.TEXT & ~filters.COMMAND, calories_input)]
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    # Состояние диалога сохраняется в БД (bot/persistence.py) и переживает перезапуск
+    name='add_measurement',
+    persistent=True,
 )
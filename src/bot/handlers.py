@@ -1,20 +1,62 @@
 """
 Handlers для команд Telegram бота.
 """
+import logging
+import pytz
 from datetime import datetime, date, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from database.models import SessionLocal
-from database.queries import (
-    get_measurements_by_period,
-    get_all_measurements,
+from database.async_queries import (
     get_last_measurements,
+    get_measurement_by_id,
     delete_measurement,
     get_user_start_date,
-    set_start_date
+    set_start_date,
+    get_or_create_user_profile,
+    set_reminder,
+    ensure_default_reminder
 )
-from visualization.charts import generate_progress_chart, format_metrics_message
+from visualization.formatting import format_metrics_message, format_trend_message
+from visualization.chart_cache import CachedChart
+from visualization.chart_service import (
+    DEFAULT_PERIOD_DAYS,
+    get_progress_chart,
+    get_trend_summary,
+    remember_file_id,
+    forget_file_id
+)
+from visualization.chart_warmup import chart_warmup
+from visualization.render_pool import RenderPoolBusy
+from monitoring.profiler import update_profiler
+
+logger = logging.getLogger(__name__)
+
+# Ответ при переполненной очереди рендеринга
+RENDER_BUSY_MESSAGE = "⏳ Сейчас строится много графиков. Попробуй через несколько секунд."
+
+
+async def _reply_with_chart(message, user_id: int, period_days: int, chart: CachedChart, **kwargs):
+    """
+    Отправить график: по file_id, если он уже загружался в Telegram, иначе PNG.
+
+    Если Telegram отклонил сохраненный file_id, график рендерится
+    и загружается заново.
+    """
+    if chart.file_id:
+        try:
+            return await message.reply_photo(photo=chart.file_id, **kwargs)
+        except BadRequest as e:
+            logger.warning(f"Stale chart file_id for user {user_id}: {e}")
+            await forget_file_id(user_id, period_days)
+            chart = await get_progress_chart(user_id, period_days, allow_file_id=False)
+            if chart is None:
+                raise
+
+    sent = await message.reply_photo(photo=chart.png, **kwargs)
+    await remember_file_id(user_id, period_days, chart, sent)
+    return sent
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -29,6 +71,18 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+    # Включить напоминание по умолчанию (если пользователь его не настраивал)
+    profile = await ensure_default_reminder(update.effective_user.id)
+    if profile.reminder_enabled:
+        timezone = 'МСК' if profile.timezone == 'Europe/Moscow' else profile.timezone
+        reminder_line = (
+            f"⏰ Каждый день в {profile.reminder_time.strftime('%H:%M')} {timezone} "
+            "я буду напоминать тебе внести данные.\n"
+            "Изменить время или выключить: /remind"
+        )
+    else:
+        reminder_line = "🔕 Напоминания выключены. Включить: /remind ЧЧ:ММ"
+
     welcome_message = (
         "👋 Привет! Я бот для трекинга показателей тела и калорий.\n\n"
         "Используй кнопки ниже для управления:\n\n"
@@ -40,7 +94,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Сначала выбираешь дату, потом вводишь данные\n"
         "• Талию и шею можно пропустить (0, -, skip)\n"
         "• Можно вносить данные за последние 7 дней\n\n"
-        "⏰ Каждый день в 9:00 МСК я буду напоминать тебе внести данные."
+        f"{reminder_line}"
     )
 
     await update.message.reply_text(welcome_message, reply_markup=reply_markup)
@@ -54,24 +108,24 @@ async def graph(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     # По умолчанию показываем за месяц
-    period_days = context.user_data.get('graph_period', 30)
+    period_days = context.user_data.get('graph_period', DEFAULT_PERIOD_DAYS)
 
-    db = SessionLocal()
     try:
-        # Получить данные
-        measurements = get_measurements_by_period(db, user_id, period_days)
+        # Получить график (из кэша или отрендерить в пуле процессов)
+        try:
+            chart = await get_progress_chart(user_id, period_days)
+        except RenderPoolBusy:
+            await update.effective_message.reply_text(RENDER_BUSY_MESSAGE)
+            return
 
-        if not measurements:
+        if chart is None:
             await update.effective_message.reply_text(
                 "📊 Нет данных для отображения.\n\n"
                 "Добавь первую запись с помощью /add"
             )
             return
 
-        # Генерировать график
-        chart_buf, metrics = generate_progress_chart(measurements, period_days)
-
-        if not chart_buf:
+        if not chart.png and not chart.file_id:
             await update.effective_message.reply_text(
                 "❌ Ошибка при генерации графика. Попробуй позже."
             )
@@ -88,11 +142,12 @@ async def graph(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup = InlineKeyboardMarkup(keyboard)
 
         # Отправить метрики
-        metrics_text = format_metrics_message(metrics)
+        metrics_text = format_metrics_message(chart.metrics)
+        metrics_text += format_trend_message(await get_trend_summary(user_id))
 
-        # Отправить график
-        await update.effective_message.reply_photo(
-            photo=chart_buf,
+        # Отправить график (по file_id, если он уже отправлялся)
+        await _reply_with_chart(
+            update.effective_message, user_id, period_days, chart,
             caption=metrics_text,
             reply_markup=reply_markup
         )
@@ -103,9 +158,6 @@ async def graph(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Попробуй позже или обратись к разработчику."
         )
 
-    finally:
-        db.close()
-
 
 async def graph_period_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -123,24 +175,24 @@ async def graph_period_callback(update: Update, context: ContextTypes.DEFAULT_TY
         'graph_two_months': 60
     }
 
-    period_days = period_map.get(query.data, 30)
+    period_days = period_map.get(query.data, DEFAULT_PERIOD_DAYS)
     context.user_data['graph_period'] = period_days
 
-    db = SessionLocal()
     try:
-        # Получить данные
-        measurements = get_measurements_by_period(db, user_id, period_days)
+        # Получить график (из кэша или отрендерить в пуле процессов)
+        try:
+            chart = await get_progress_chart(user_id, period_days)
+        except RenderPoolBusy:
+            await query.message.reply_text(RENDER_BUSY_MESSAGE)
+            return
 
-        if not measurements:
+        if chart is None:
             await query.message.reply_text(
                 "📊 Нет данных для выбранного периода."
             )
             return
 
-        # Генерировать график
-        chart_buf, metrics = generate_progress_chart(measurements, period_days)
-
-        if not chart_buf:
+        if not chart.png and not chart.file_id:
             await query.message.reply_text(
                 "❌ Ошибка при генерации графика."
             )
@@ -157,11 +209,12 @@ async def graph_period_callback(update: Update, context: ContextTypes.DEFAULT_TY
         reply_markup = InlineKeyboardMarkup(keyboard)
 
         # Отправить метрики
-        metrics_text = format_metrics_message(metrics)
+        metrics_text = format_metrics_message(chart.metrics)
+        metrics_text += format_trend_message(await get_trend_summary(user_id))
 
-        # Отправить новый график
-        await query.message.reply_photo(
-            photo=chart_buf,
+        # Отправить новый график (по file_id, если он уже отправлялся)
+        await _reply_with_chart(
+            query.message, user_id, period_days, chart,
             caption=metrics_text,
             reply_markup=reply_markup
         )
@@ -171,9 +224,6 @@ async def graph_period_callback(update: Update, context: ContextTypes.DEFAULT_TY
             f"❌ Ошибка: {str(e)}"
         )
 
-    finally:
-        db.close()
-
 
 async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -182,10 +232,9 @@ async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     user_id = update.effective_user.id
 
-    db = SessionLocal()
     try:
         # Получить последние 5 записей
-        measurements = get_last_measurements(db, user_id, limit=5)
+        measurements = await get_last_measurements(user_id, limit=5)
 
         if not measurements:
             await update.message.reply_text(
@@ -215,9 +264,6 @@ async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"❌ Ошибка: {str(e)}"
         )
 
-    finally:
-        db.close()
-
 
 async def delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -233,11 +279,9 @@ async def delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("❌ Ошибка: некорректный ID записи.")
         return
 
-    db = SessionLocal()
     try:
         # Получить запись для показа информации
-        from database.models import Measurement
-        measurement = db.query(Measurement).filter(Measurement.id == measurement_id).first()
+        measurement = await get_measurement_by_id(measurement_id)
 
         if not measurement:
             await query.message.reply_text("❌ Запись не найдена.")
@@ -246,7 +290,7 @@ async def delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         date_str = measurement.date.strftime("%d.%m.%Y")
 
         # Удалить запись
-        success = delete_measurement(db, measurement_id)
+        success = await delete_measurement(measurement_id)
 
         if success:
             await query.message.reply_text(
@@ -257,6 +301,10 @@ async def delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"• Шея: {measurement.neck} см\n"
                 f"• Калории: {measurement.calories} ккал"
             )
+            chart_warmup.schedule(
+                update.effective_user.id,
+                context.user_data.get('graph_period', DEFAULT_PERIOD_DAYS)
+            )
         else:
             await query.message.reply_text("❌ Не удалось удалить запись.")
 
@@ -265,9 +313,6 @@ async def delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"❌ Ошибка при удалении: {str(e)}"
         )
 
-    finally:
-        db.close()
-
 
 async def set_start_date_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -292,19 +337,15 @@ async def set_start_date_command(update: Update, context: ContextTypes.DEFAULT_T
                 return
 
             # Сохранить дату старта
-            db = SessionLocal()
-            try:
-                set_start_date(db, user_id, start_date)
-                date_display = start_date.strftime("%d.%m.%Y")
-                days_ago = (date.today() - start_date).days
+            await set_start_date(user_id, start_date)
+            date_display = start_date.strftime("%d.%m.%Y")
+            days_ago = (date.today() - start_date).days
 
-                await update.message.reply_text(
-                    f"✅ Дата начала трекинга установлена: {date_display}\n\n"
-                    f"📊 Прошло дней: {days_ago}\n\n"
-                    f"Теперь можешь вносить данные за этот период с помощью /add"
-                )
-            finally:
-                db.close()
+            await update.message.reply_text(
+                f"✅ Дата начала трекинга установлена: {date_display}\n\n"
+                f"📊 Прошло дней: {days_ago}\n\n"
+                f"Теперь можешь вносить данные за этот период с помощью /add"
+            )
 
         except ValueError:
             await update.message.reply_text(
@@ -314,54 +355,50 @@ async def set_start_date_command(update: Update, context: ContextTypes.DEFAULT_T
             )
     else:
         # Показать текущую дату или предложить установить
-        db = SessionLocal()
-        try:
-            current_start = get_user_start_date(db, user_id)
+        current_start = await get_user_start_date(user_id)
 
-            if current_start:
-                date_display = current_start.strftime("%d.%m.%Y")
-                days_ago = (date.today() - current_start).days
+        if current_start:
+            date_display = current_start.strftime("%d.%m.%Y")
+            days_ago = (date.today() - current_start).days
 
-                # Создать кнопки для изменения
-                keyboard = []
-                for i in range(1, 8):  # Последние 7 дней
-                    suggested_date = date.today() - timedelta(days=i)
-                    label = suggested_date.strftime('%d.%m.%Y')
-                    keyboard.append([InlineKeyboardButton(
-                        label,
-                        callback_data=f"setstart_{suggested_date.strftime('%Y%m%d')}"
-                    )])
+            # Создать кнопки для изменения
+            keyboard = []
+            for i in range(1, 8):  # Последние 7 дней
+                suggested_date = date.today() - timedelta(days=i)
+                label = suggested_date.strftime('%d.%m.%Y')
+                keyboard.append([InlineKeyboardButton(
+                    label,
+                    callback_data=f"setstart_{suggested_date.strftime('%Y%m%d')}"
+                )])
 
-                reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = InlineKeyboardMarkup(keyboard)
 
-                await update.message.reply_text(
-                    f"📅 Текущая дата начала: {date_display}\n"
-                    f"📊 Прошло дней: {days_ago}\n\n"
-                    f"Чтобы изменить, выбери дату или используй:\n"
-                    f"/set_start ДД.ММ.ГГГГ",
-                    reply_markup=reply_markup
-                )
-            else:
-                # Предложить установить дату
-                keyboard = []
-                for i in range(1, 8):  # Последние 7 дней
-                    suggested_date = date.today() - timedelta(days=i)
-                    label = suggested_date.strftime('%d.%m.%Y')
-                    keyboard.append([InlineKeyboardButton(
-                        label,
-                        callback_data=f"setstart_{suggested_date.strftime('%Y%m%d')}"
-                    )])
-
-                reply_markup = InlineKeyboardMarkup(keyboard)
+            await update.message.reply_text(
+                f"📅 Текущая дата начала: {date_display}\n"
+                f"📊 Прошло дней: {days_ago}\n\n"
+                f"Чтобы изменить, выбери дату или используй:\n"
+                f"/set_start ДД.ММ.ГГГГ",
+                reply_markup=reply_markup
+            )
+        else:
+            # Предложить установить дату
+            keyboard = []
+            for i in range(1, 8):  # Последние 7 дней
+                suggested_date = date.today() - timedelta(days=i)
+                label = suggested_date.strftime('%d.%m.%Y')
+                keyboard.append([InlineKeyboardButton(
+                    label,
+                    callback_data=f"setstart_{suggested_date.strftime('%Y%m%d')}"
+                )])
+
+            reply_markup = InlineKeyboardMarkup(keyboard)
 
-                await update.message.reply_text(
-                    "📅 Дата начала трекинга не установлена.\n\n"
-                    "Выбери дату когда начал дефицит калорий,\n"
-                    "или используй: /set_start ДД.ММ.ГГГГ",
-                    reply_markup=reply_markup
-                )
-        finally:
-            db.close()
+            await update.message.reply_text(
+                "📅 Дата начала трекинга не установлена.\n\n"
+                "Выбери дату когда начал дефицит калорий,\n"
+                "или используй: /set_start ДД.ММ.ГГГГ",
+                reply_markup=reply_markup
+            )
 
 
 async def set_start_date_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -377,19 +414,136 @@ async def set_start_date_callback(update: Update, context: ContextTypes.DEFAULT_
         date_str = query.data.split('_')[1]
         start_date = datetime.strptime(date_str, "%Y%m%d").date()
 
-        db = SessionLocal()
-        try:
-            set_start_date(db, user_id, start_date)
-            date_display = start_date.strftime("%d.%m.%Y")
-            days_ago = (date.today() - start_date).days
+        await set_start_date(user_id, start_date)
+        date_display = start_date.strftime("%d.%m.%Y")
+        days_ago = (date.today() - start_date).days
 
-            await query.message.reply_text(
-                f"✅ Дата начала трекинга установлена: {date_display}\n\n"
-                f"📊 Прошло дней: {days_ago}\n\n"
-                f"Теперь можешь вносить данные за этот период с помощью /add"
-            )
-        finally:
-            db.close()
+        await query.message.reply_text(
+            f"✅ Дата начала трекинга установлена: {date_display}\n\n"
+            f"📊 Прошло дней: {days_ago}\n\n"
+            f"Теперь можешь вносить данные за этот период с помощью /add"
+        )
 
     except (ValueError, IndexError):
         await query.message.reply_text("❌ Ошибка при установке даты.")
+
+
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handler для команды /remind.
+    Настраивает время и часовой пояс ежедневного напоминания.
+
+    Использование:
+    - /remind - показать текущие настройки
+    - /remind 08:30 - напоминать в 08:30 (часовой пояс не меняется)
+    - /remind 08:30 Europe/Berlin - время и часовой пояс
+    - /remind off - выключить напоминания
+    """
+    user_id = update.effective_user.id
+
+    if not context.args:
+        profile = await get_or_create_user_profile(user_id)
+        if profile.reminder_enabled:
+            status = (
+                f"⏰ Напоминание: каждый день в {profile.reminder_time.strftime('%H:%M')} "
+                f"({profile.timezone})"
+            )
+        else:
+            status = "🔕 Напоминания выключены"
+
+        await update.message.reply_text(
+            f"{status}\n\n"
+            "Изменить: /remind ЧЧ:ММ [часовой пояс]\n"
+            "Например: /remind 08:30 Europe/Moscow\n"
+            "Выключить: /remind off"
+        )
+        return
+
+    if context.args[0].lower() == 'off':
+        await set_reminder(user_id, enabled=False)
+        await update.message.reply_text("🔕 Напоминания выключены. Включить: /remind ЧЧ:ММ")
+        return
+
+    try:
+        reminder_time = datetime.strptime(context.args[0], "%H:%M").time()
+    except ValueError:
+        await update.message.reply_text(
+            "⚠️ Неправильный формат времени.\n\n"
+            "Используй формат: /remind ЧЧ:ММ [часовой пояс]\n"
+            "Например: /remind 08:30 Europe/Moscow"
+        )
+        return
+
+    timezone = context.args[1] if len(context.args) > 1 else None
+    try:
+        profile = await set_reminder(user_id, reminder_time, timezone)
+    except pytz.UnknownTimeZoneError:
+        await update.message.reply_text(
+            f"⚠️ Неизвестный часовой пояс: {timezone}\n"
+            "Например: Europe/Moscow, Asia/Yekaterinburg, Europe/Berlin"
+        )
+        return
+
+    await update.message.reply_text(
+        f"✅ Буду напоминать каждый день в {profile.reminder_time.strftime('%H:%M')} "
+        f"({profile.timezone})"
+    )
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handler для команды /profile (только владелец, см. main.py).
+    Включает профилирование медленных обновлений без перезапуска бота.
+
+    Использование:
+    - /profile - показать состояние
+    - /profile on [порог_мс] [доля] - сохранять профили обновлений дольше
+      порога и долю остальных (например: /profile on 500 0.01)
+    - /profile off - выключить
+    - /profile user ID - сохранять профили всех обновлений пользователя
+      (включает профилирование, если оно выключено)
+    - /profile user off - перестать
+    """
+    args = [arg.lower() for arg in context.args or []]
+
+    try:
+        if args and args[0] == 'on':
+            if len(args) > 1:
+                update_profiler.threshold_ms = float(args[1])
+            if len(args) > 2:
+                update_profiler.sample_rate = min(1.0, max(0.0, float(args[2])))
+            update_profiler.enabled = True
+            update_profiler.start()
+        elif args and args[0] == 'off':
+            update_profiler.enabled = False
+            await update_profiler.stop()
+        elif len(args) > 1 and args[0] == 'user':
+            if args[1] == 'off':
+                update_profiler.users.clear()
+            else:
+                update_profiler.users.add(int(args[1]))
+                # Без работающего сэмплера профилировать пользователя нечем
+                update_profiler.enabled = True
+                update_profiler.start()
+        elif args:
+            raise ValueError(args[0])
+    except ValueError:
+        await update.message.reply_text(
+            "⚠️ Неправильная команда.\n\n"
+            "/profile on [порог_мс] [доля]\n"
+            "/profile off\n"
+            "/profile user ID | off"
+        )
+        return
+
+    stats = update_profiler.stats
+    status = "🔬 Профилирование включено" if update_profiler.active else "💤 Профилирование выключено"
+    users = ', '.join(map(str, sorted(update_profiler.users))) or 'нет'
+    await update.message.reply_text(
+        f"{status}\n\n"
+        f"Порог: {update_profiler.threshold_ms:.0f} мс\n"
+        f"Доля остальных: {update_profiler.sample_rate:g}\n"
+        f"Пользователи: {users}\n"
+        f"Обновлений: {stats.profiled}, профилей сохранено: {stats.saved}\n"
+        f"Последний: {stats.last_path or '-'}"
+    )
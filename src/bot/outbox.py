@@ -0,0 +1,335 @@
+"""
+Очередь исходящих сообщений для массовых рассылок.
+
+Все сообщения проходят через общий token bucket (лимит Telegram ~30 сообщений/сек
+на бота) и ограничение частоты на каждый чат. Ошибки доставки обрабатываются так:
+- RetryAfter (429): вся очередь приостанавливается на retry_after и сообщение повторяется
+- сетевые ошибки и таймауты: повтор с экспоненциальной задержкой
+- BadRequest, Forbidden (бот заблокирован) и прочие: сообщение уходит в dead letter
+
+Dead letter - отдельный логгер bot.outbox.dead_letter, чтобы его можно было
+направить в свой файл/алерт.
+"""
+import asyncio
+import logging
+import os
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+dead_letter_logger = logging.getLogger(f"{__name__}.dead_letter")
+
+# Общий лимит сообщений в секунду (с запасом от лимита Telegram в 30)
+OUTBOX_RATE_LIMIT = float(os.getenv('OUTBOX_RATE_LIMIT', '25'))
+# Лимит сообщений в секунду в один чат
+OUTBOX_PER_CHAT_RATE = float(os.getenv('OUTBOX_PER_CHAT_RATE', '1'))
+# Количество параллельных отправителей
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '8'))
+# Размер очереди (при заполнении send_message ждет свободного места)
+OUTBOX_QUEUE_SIZE = int(os.getenv('OUTBOX_QUEUE_SIZE', '1000'))
+# Максимум попыток доставки одного сообщения
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+
+# Экспоненциальная задержка повтора при сетевых ошибках (сек)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class TokenBucket:
+    """
+    Token bucket: в среднем rate операций в секунду, всплеск до capacity.
+
+    Args:
+        rate: Скорость пополнения (токенов в секунду)
+        capacity: Емкость (максимальный всплеск)
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated: Optional[float] = None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if self._updated is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Дождаться и забрать один токен."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Не выдавать токены ближайшие seconds секунд (ответ 429 от Telegram).
+
+        Args:
+            seconds: Длительность паузы
+        """
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+
+@dataclass
+class OutboundMessage:
+    """
+    Сообщение в очереди.
+
+    Поля:
+    - chat_id: Получатель
+    - text: Текст
+    - kwargs: Остальные аргументы Bot.send_message
+    - future: Результат доставки (Message или None для dead letter)
+    - attempts: Сделанные попытки
+    """
+    chat_id: int
+    text: str
+    kwargs: dict
+    future: asyncio.Future
+    attempts: int = 0
+
+
+@dataclass
+class OutboxStats:
+    """Счетчики очереди с момента запуска."""
+    sent: int = 0
+    retried: int = 0
+    dead: int = 0
+
+
+class Outbox:
+    """
+    Асинхронная очередь исходящих сообщений с ограничением скорости и повторами.
+
+    Args:
+        rate_limit: Общий лимит сообщений в секунду
+        per_chat_rate: Лимит сообщений в секунду в один чат
+        workers: Количество параллельных отправителей
+        queue_size: Размер очереди
+        max_attempts: Максимум попыток доставки
+    """
+
+    def __init__(
+        self,
+        rate_limit: float = OUTBOX_RATE_LIMIT,
+        per_chat_rate: float = OUTBOX_PER_CHAT_RATE,
+        workers: int = OUTBOX_WORKERS,
+        queue_size: int = OUTBOX_QUEUE_SIZE,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS
+    ):
+        self.rate_limit = rate_limit
+        self.per_chat_interval = 1.0 / per_chat_rate
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.stats = OutboxStats()
+
+        self._bot: Optional[Bot] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retry_tasks: set = set()
+        self._chat_next_send: Dict[int, float] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, bot: Bot):
+        """
+        Запустить отправителей (вызывается внутри event loop бота).
+
+        Args:
+            bot: Telegram Bot instance
+        """
+        if self.running:
+            return
+
+        self._bot = bot
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._bucket = TokenBucket(self.rate_limit)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f'outbox-{i}')
+            for i in range(self.workers)
+        ]
+        logger.info(f"Outbox started: {self.workers} workers, {self.rate_limit:g} msg/s")
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Остановить очередь, дав до timeout секунд на отправку оставшихся сообщений.
+
+        Неотправленные сообщения уходят в dead letter. Вызывается из post_stop:
+        в post_shutdown HTTP-клиент бота уже закрыт и отправить ничего нельзя.
+
+        Args:
+            timeout: Время на досылку (сек)
+        """
+        if not self.running:
+            return
+
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Outbox stopped with {self._queue.qsize() + len(self._retry_tasks)} undelivered messages"
+            )
+
+        for task in self._tasks + list(self._retry_tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retry_tasks, return_exceptions=True)
+
+        while not self._queue.empty():
+            self._dead_letter(self._queue.get_nowait(), 'outbox stopped')
+
+        self._tasks = []
+        self._retry_tasks.clear()
+        logger.info(
+            f"Outbox stopped: sent={self.stats.sent} retried={self.stats.retried} dead={self.stats.dead}"
+        )
+
+    async def _drain(self):
+        """
+        Дождаться, пока не останется ни сообщений в очереди, ни отложенных повторов.
+
+        Сообщения, ждущие повтора (RetryAfter, backoff), не в очереди - join()
+        их не ждет, а вернувшись в очередь, они могут снова уйти на повтор.
+        """
+        while True:
+            await self._queue.join()
+            if not self._retry_tasks:
+                return
+            await asyncio.wait(list(self._retry_tasks))
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """
+        Поставить сообщение в очередь.
+
+        Ждет, только если очередь заполнена. Результат доставки можно
+        дождаться через возвращенный future.
+
+        Args:
+            chat_id: Получатель
+            text: Текст
+            **kwargs: Остальные аргументы Bot.send_message
+
+        Returns:
+            Future с отправленным Message (None если сообщение ушло в dead letter)
+
+        Raises:
+            RuntimeError: Если очередь не запущена
+        """
+        if not self.running:
+            raise RuntimeError("Outbox is not started")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(OutboundMessage(chat_id, text, kwargs, future))
+        return future
+
+    async def _worker(self):
+        """Забирать сообщения из очереди и отправлять."""
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._deliver(message)
+            except asyncio.CancelledError:
+                self._dead_letter(message, 'outbox stopped')
+                raise
+            except Exception as e:
+                logger.exception(f"Unexpected outbox error for chat {message.chat_id}")
+                self._dead_letter(message, repr(e))
+            finally:
+                self._queue.task_done()
+
+    async def _wait_for_chat(self, chat_id: int):
+        """Соблюсти лимит частоты сообщений в один чат."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        send_at = max(now, self._chat_next_send.get(chat_id, now))
+        self._chat_next_send[chat_id] = send_at + self.per_chat_interval
+
+        if len(self._chat_next_send) > 10 * self.queue_size:
+            self._chat_next_send = {c: t for c, t in self._chat_next_send.items() if t > now}
+
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    async def _deliver(self, message: OutboundMessage):
+        """Одна попытка доставки; при временной ошибке - повтор позже."""
+        await self._wait_for_chat(message.chat_id)
+        await self._bucket.acquire()
+        message.attempts += 1
+
+        try:
+            sent = await self._bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Flood control: pausing outbox for {retry_after}s")
+            self._bucket.pause(float(retry_after))
+            self._retry(message, float(retry_after), str(e))
+        except BadRequest as e:
+            # BadRequest - подкласс NetworkError, но повтор не поможет
+            self._dead_letter(message, str(e))
+        except NetworkError as e:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (message.attempts - 1))
+            self._retry(message, delay * random.uniform(0.5, 1.5), str(e))
+        except Exception as e:
+            self._dead_letter(message, str(e))
+        else:
+            self.stats.sent += 1
+            if not message.future.done():
+                message.future.set_result(sent)
+
+    def _retry(self, message: OutboundMessage, delay: float, reason: str):
+        """Вернуть сообщение в очередь через delay секунд (или в dead letter)."""
+        if message.attempts >= self.max_attempts:
+            self._dead_letter(message, reason)
+            return
+
+        self.stats.retried += 1
+        task = asyncio.create_task(self._requeue_later(message, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _requeue_later(self, message: OutboundMessage, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            await self._queue.put(message)
+        except asyncio.CancelledError:
+            self._dead_letter(message, 'outbox stopped')
+            raise
+
+    def _dead_letter(self, message: OutboundMessage, reason: str):
+        """Записать недоставленное сообщение в dead letter лог."""
+        self.stats.dead += 1
+        dead_letter_logger.error(
+            f"Undelivered message to chat {message.chat_id} after {message.attempts} attempts: "
+            f"{reason} | text={message.text[:100]!r}"
+        )
+        if not message.future.done():
+            message.future.set_result(None)
+
+
+outbox = Outbox()
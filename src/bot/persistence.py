@@ -0,0 +1,191 @@
+"""
+Хранение состояния бота в SQLite (python-telegram-bot BasePersistence).
+
+Сохраняются user_data и состояния постоянных диалогов (ConversationHandler
+с persistent=True), поэтому незавершенный /add переживает перезапуск бота.
+
+Запись отложенная (write-behind): Application передает изменения раз в
+update_interval секунд, а все изменения одного такого прохода копятся в
+памяти и записываются одной транзакцией в пуле потоков БД - один fsync
+вместо одного на каждое сообщение пользователя.
+
+Несколько процессов могут работать с одной БД, если обновления одного
+пользователя всегда попадают в один и тот же процесс (sticky-маршрутизация):
+данные читаются из БД при запуске, а не перед каждым обновлением.
+"""
+import asyncio
+import json
+import logging
+import os
+import pickle
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database.async_queries import get_bot_states, save_bot_states
+
+logger = logging.getLogger(__name__)
+
+# Как часто Application передает изменения в persistence (сек)
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '5'))
+# Сколько ждать остальных изменений прохода перед записью (сек)
+PERSISTENCE_FLUSH_DELAY = float(os.getenv('PERSISTENCE_FLUSH_DELAY', '0.1'))
+
+USER_DATA_NAMESPACE = 'user_data'
+
+# (namespace, key) → pickle или None (удалить)
+_PendingKey = Tuple[str, str]
+ConversationKey = Tuple[int, ...]
+ConversationDict = Dict[ConversationKey, object]
+
+
+def _conversation_namespace(name: str) -> str:
+    return f'conversation:{name}'
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    BasePersistence поверх таблицы bot_state с отложенной пакетной записью.
+
+    Хранит только user_data и состояния диалогов (chat_data, bot_data
+    и callback_data боту не нужны).
+
+    Args:
+        update_interval: Интервал передачи изменений из Application (сек)
+        flush_delay: Задержка перед записью пачки изменений (сек)
+    """
+
+    def __init__(
+        self,
+        update_interval: float = PERSISTENCE_UPDATE_INTERVAL,
+        flush_delay: float = PERSISTENCE_FLUSH_DELAY
+    ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.flush_delay = flush_delay
+        self._pending: Dict[_PendingKey, Optional[bytes]] = {}
+        # Текущие состояния диалогов: name → {key: state} (для метрик)
+        self._conversation_states: Dict[str, ConversationDict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+
+    # Чтение (один раз при запуске Application)
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        rows = await get_bot_states(USER_DATA_NAMESPACE)
+        return {int(row.key): pickle.loads(row.data) for row in rows}
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        rows = await get_bot_states(_conversation_namespace(name))
+        conversations = {tuple(json.loads(row.key)): pickle.loads(row.data) for row in rows}
+        self._conversation_states[name] = dict(conversations)
+        return conversations
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    # Запись (буферизуется, см. _buffer)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # Пустой user_data (например, после завершения /add) не храним
+        self._buffer(USER_DATA_NAMESPACE, str(user_id), pickle.dumps(data) if data else None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._buffer(USER_DATA_NAMESPACE, str(user_id), None)
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        # None - диалог завершен
+        states = self._conversation_states.setdefault(name, {})
+        if new_state is None:
+            states.pop(key, None)
+        else:
+            states[key] = new_state
+        data = pickle.dumps(new_state) if new_state is not None else None
+        self._buffer(_conversation_namespace(name), json.dumps(list(key)), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    # Единственный процесс - источник истины для своих пользователей, перечитывать нечего
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Записать все накопленные изменения (вызывается при остановке Application)."""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self._write_pending()
+
+    def conversation_counts(self) -> Dict[str, Dict[object, int]]:
+        """
+        Количество незавершенных диалогов по состояниям.
+
+        Состояния обновляются вместе с записью в БД (раз в update_interval),
+        поэтому отстают от обработчиков не больше чем на update_interval.
+
+        Вызывается из потока HTTP-сервера метрик, пока event loop меняет
+        словари состояний: обходятся их копии (dict() копирует атомарно под GIL),
+        иначе запрос метрик мог упасть с "dictionary changed size during iteration".
+
+        Returns:
+            name → {state: количество}
+        """
+        counts = {}
+        for name, states in dict(self._conversation_states).items():
+            per_state = counts[name] = {}
+            for state in dict(states).values():
+                per_state[state] = per_state.get(state, 0) + 1
+        return counts
+
+    def _buffer(self, namespace: str, key: str, data: Optional[bytes]):
+        """Запомнить изменение (последнее значение для ключа побеждает) и запланировать запись."""
+        self._pending[(namespace, key)] = data
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        await self._write_pending()
+
+    async def _write_pending(self):
+        """Записать накопленные изменения одной транзакцией."""
+        async with self._write_lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+            upserts = [(ns, key, data) for (ns, key), data in pending.items() if data is not None]
+            deletes = [(ns, key) for (ns, key), data in pending.items() if data is None]
+
+            try:
+                await save_bot_states(upserts, deletes)
+                logger.debug(f"Persistence flushed: {len(upserts)} updated, {len(deletes)} deleted")
+            except Exception:
+                logger.exception("Failed to write bot state, will retry on next flush")
+                # Не затирать изменения, пришедшие во время записи
+                for item, data in pending.items():
+                    self._pending.setdefault(item, data)
@@ -1,65 +1,166 @@
 """
-Scheduler для автоматических напоминаний.
+Scheduler для автоматических напоминаний и еженедельных отчетов.
+
+Один периодический job (reminder_tick) обслуживает всех пользователей:
+забирает из БД пачками тех, у кого наступило next_reminder_at
+(см. queries.claim_due_reminders), и рассылает напоминания
+через очередь outbox (лимиты Telegram, повторы, 429).
+
+Еженедельный отчет (weekly_report, включается WEEKLY_REPORT=1) считает сглаженную статистику
+(visualization.analytics) пачками пользователей: один запрос и один
+векторный проход на пачку.
 """
+import asyncio
 import logging
+import os
 import pytz
-from datetime import datetime
+from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from telegram import Bot
+from apscheduler.triggers.interval import IntervalTrigger
+
+from bot.outbox import outbox
+from database.async_queries import (
+    claim_due_reminders,
+    get_active_user_ids,
+    get_measurement_rows_for_users
+)
+from visualization.formatting import format_weekly_report
 
 logger = logging.getLogger(__name__)
 
 # Часовой пояс Москвы
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
+# Период проверки наступивших напоминаний (сек)
+REMINDER_TICK_SECONDS = int(os.getenv('REMINDER_TICK_SECONDS', '30'))
+# Сколько пользователей забирать из БД за один запрос
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '200'))
+
+# Еженедельный отчет: включен ли (по умолчанию нет), день недели (mon-sun) и час по МСК
+WEEKLY_REPORT = os.getenv('WEEKLY_REPORT', '0') == '1'
+WEEKLY_REPORT_DAY = os.getenv('WEEKLY_REPORT_DAY', 'sun')
+WEEKLY_REPORT_HOUR = int(os.getenv('WEEKLY_REPORT_HOUR', '20'))
+# Сколько пользователей обрабатывать одним запросом и проходом аналитики
+WEEKLY_REPORT_BATCH_SIZE = int(os.getenv('WEEKLY_REPORT_BATCH_SIZE', '1000'))
+
+REMINDER_MESSAGE = (
+    "⏰ Привет! Пора внести данные за сегодня.\n\n"
+    "Отправь /add auto чтобы начать ввод данных за сегодня,\n"
+    "или используй кнопку 📊 Внести данные чтобы выбрать другую дату."
+)
+
 
-async def send_daily_reminder(bot: Bot, user_id: int):
+async def send_daily_reminder(user_id: int) -> asyncio.Future:
     """
-    Отправить ежедневное напоминание пользователю.
+    Поставить ежедневное напоминание пользователю в очередь отправки.
     Автоматически запускает ввод данных за сегодня.
 
     Args:
-        bot: Telegram Bot instance
         user_id: ID пользователя
+
+    Returns:
+        Future результата доставки (см. Outbox.send_message)
     """
-    try:
-        message = (
-            "⏰ Доброе утро! Пора внести данные за сегодня.\n\n"
-            "Отправь /add auto чтобы начать ввод данных за сегодня,\n"
-            "или используй кнопку 📊 Внести данные чтобы выбрать другую дату."
-        )
+    return await outbox.send_message(chat_id=user_id, text=REMINDER_MESSAGE)
+
+
+async def reminder_tick():
+    """
+    Разослать все наступившие напоминания.
 
-        await bot.send_message(chat_id=user_id, text=message)
-        logger.info(f"Daily reminder sent to user {user_id}")
+    Забирает пользователей пачками, пока не закончатся наступившие.
+    Пачка помечается отправленной до рассылки (не более одного
+    напоминания в день даже при сбое посередине). Тем, кто уже внес
+    запись за сегодня, напоминание не отправляется. Скорость, повторы
+    и 429 обрабатывает очередь outbox.
+    """
+    deliveries = []
+    skipped = 0
+    while True:
+        claimed = await claim_due_reminders(datetime.utcnow(), REMINDER_BATCH_SIZE)
+        if not claimed:
+            break
+        for user_id, logged_today in claimed:
+            if logged_today:
+                skipped += 1
+                continue
+            deliveries.append(await send_daily_reminder(user_id))
 
-    except Exception as e:
-        logger.error(f"Failed to send reminder to user {user_id}: {e}")
+    if deliveries:
+        results = await asyncio.gather(*deliveries)
+        sent = sum(1 for result in results if result is not None)
+        logger.info(f"Daily reminders sent: {sent}/{len(deliveries)}, already logged today: {skipped}")
+    elif skipped:
+        logger.info(f"Daily reminders skipped, already logged today: {skipped}")
 
 
-def setup_scheduler(bot: Bot, user_id: int) -> AsyncIOScheduler:
+async def send_weekly_reports():
     """
-    Настроить и запустить scheduler для напоминаний.
+    Разослать еженедельный отчет (сглаженный вес, тренд, TDEE).
 
-    Args:
-        bot: Telegram Bot instance
-        user_id: ID пользователя для отправки напоминаний
+    Получают пользователи с записями за последнюю неделю и включенными
+    напоминаниями (после /remind off отчет тоже не приходит), у которых
+    достаточно взвешиваний для тренда. Статистика считается пачками
+    по WEEKLY_REPORT_BATCH_SIZE пользователей в пуле потоков.
+    """
+    # numpy загружается только на время отчета, а не при старте бота
+    from visualization.analytics import ANALYTICS_LOOKBACK_DAYS, analyze_rows
+
+    today = datetime.now(MOSCOW_TZ).date()
+    since = today - timedelta(days=ANALYTICS_LOOKBACK_DAYS - 1)
+    user_ids = await get_active_user_ids(today - timedelta(days=6), notifications_only=True)
+
+    deliveries = []
+    skipped = 0
+    for start in range(0, len(user_ids), WEEKLY_REPORT_BATCH_SIZE):
+        batch = user_ids[start:start + WEEKLY_REPORT_BATCH_SIZE]
+        rows = await get_measurement_rows_for_users(batch, since)
+        summaries = await asyncio.to_thread(analyze_rows, rows, today)
+
+        for user_id, summary in summaries.items():
+            if summary.trend_kg_per_week is None:
+                skipped += 1
+                continue
+            deliveries.append(await outbox.send_message(chat_id=user_id, text=format_weekly_report(summary)))
+
+    results = await asyncio.gather(*deliveries)
+    sent = sum(1 for result in results if result is not None)
+    logger.info(f"Weekly reports sent: {sent}/{len(deliveries)}, not enough data: {skipped}")
+
+
+def setup_scheduler() -> AsyncIOScheduler:
+    """
+    Настроить scheduler для напоминаний и еженедельных отчетов всех пользователей.
 
     Returns:
         AsyncIOScheduler instance
     """
     scheduler = AsyncIOScheduler(timezone=MOSCOW_TZ)
 
-    # Добавить job для ежедневного напоминания в 9:00 МСК
+    # Один job на всех пользователей; следующий запуск пропускается,
+    # пока предыдущий еще рассылает (max_instances=1, coalesce)
     scheduler.add_job(
-        send_daily_reminder,
-        trigger=CronTrigger(hour=9, minute=0, timezone=MOSCOW_TZ),
-        args=[bot, user_id],
-        id='daily_reminder',
-        name='Daily measurement reminder',
+        reminder_tick,
+        trigger=IntervalTrigger(seconds=REMINDER_TICK_SECONDS, timezone=MOSCOW_TZ),
+        id='reminder_tick',
+        name='Daily measurement reminders',
+        max_instances=1,
+        coalesce=True,
         replace_existing=True
     )
 
-    logger.info(f"Scheduler configured: Daily reminder at 9:00 MSK for user {user_id}")
+    if WEEKLY_REPORT:
+        scheduler.add_job(
+            send_weekly_reports,
+            trigger=CronTrigger(day_of_week=WEEKLY_REPORT_DAY, hour=WEEKLY_REPORT_HOUR, timezone=MOSCOW_TZ),
+            id='weekly_report',
+            name='Weekly progress report',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+    logger.info(f"Scheduler configured: reminder tick every {REMINDER_TICK_SECONDS}s")
 
     return scheduler
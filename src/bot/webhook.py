@@ -0,0 +1,174 @@
+"""
+Режим webhook: прием обновлений от Telegram через собственный HTTP-сервер (aiohttp).
+
+В отличие от long polling обновления приходят сразу, а несколько реплик
+бота можно поставить за reverse proxy.
+
+Эндпоинты:
+- POST {WEBHOOK_PATH} - обновления от Telegram (проверяется секретный токен)
+- GET /healthz - проверка живости для балансировщика/оркестратора
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram присылает secret_token из setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Публичный URL бота (без пути), например https://bot.example.com
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+# Путь, на который Telegram присылает обновления
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Секретный токен (1-256 символов A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# Адрес и порт локального HTTP-сервера
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+# Максимум одновременных соединений от Telegram (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Ключ приложения Telegram в aiohttp.web.Application
+APPLICATION_KEY = web.AppKey('application', Application)
+SECRET_KEY = web.AppKey('secret_token', str)
+
+
+async def handle_update(request: web.Request) -> web.Response:
+    """
+    Принять обновление от Telegram и поставить его в очередь Application.
+
+    Returns:
+        200 - принято, 400 - некорректное тело, 403 - неверный секретный токен
+    """
+    secret_token = request.app[SECRET_KEY]
+    received = request.headers.get(SECRET_HEADER, '')
+    if not hmac.compare_digest(received.encode(), secret_token.encode()):
+        return web.Response(status=403)
+
+    application = request.app[APPLICATION_KEY]
+    try:
+        data = await request.json()
+        update = Update.de_json(data, application.bot)
+    except (json.JSONDecodeError, ValueError, TypeError, KeyError) as e:
+        logger.warning(f"Invalid update payload: {e}")
+        return web.Response(status=400)
+
+    if update is None:
+        return web.Response(status=400)
+
+    await application.update_queue.put(update)
+    return web.Response()
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    """
+    Проверка живости.
+
+    Returns:
+        200 с размером очереди обновлений, 503 если Application не запущен
+    """
+    application = request.app[APPLICATION_KEY]
+    status = 200 if application.running else 503
+    return web.json_response(
+        {'running': application.running, 'update_queue': application.update_queue.qsize()},
+        status=status
+    )
+
+
+def create_webhook_app(application: Application, path: str, secret_token: str) -> web.Application:
+    """
+    Создать aiohttp-приложение для приема обновлений.
+
+    Args:
+        application: Telegram Application
+        path: Путь для обновлений
+        secret_token: Ожидаемый секретный токен
+
+    Returns:
+        aiohttp.web.Application
+    """
+    app = web.Application()
+    app[APPLICATION_KEY] = application
+    app[SECRET_KEY] = secret_token
+    app.router.add_post(path, handle_update)
+    app.router.add_get('/healthz', handle_health)
+    return app
+
+
+async def run_webhook(
+    application: Application,
+    url: str = WEBHOOK_URL,
+    path: str = WEBHOOK_PATH,
+    secret_token: str = WEBHOOK_SECRET,
+    host: str = WEBHOOK_HOST,
+    port: int = WEBHOOK_PORT,
+    allowed_updates: Optional[list] = None
+):
+    """
+    Запустить бота в режиме webhook и работать до SIGINT/SIGTERM.
+
+    Порядок остановки: перестать принимать запросы, обработать уже
+    принятые обновления, остановить Application (post_stop, post_shutdown).
+
+    Args:
+        application: Telegram Application
+        url: Публичный URL бота (без пути)
+        path: Путь для обновлений
+        secret_token: Секретный токен
+        host: Адрес HTTP-сервера
+        port: Порт HTTP-сервера
+        allowed_updates: Типы обновлений для setWebhook
+
+    Raises:
+        ValueError: Если не задан url или secret_token
+    """
+    if not url or not secret_token:
+        raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    runner = web.AppRunner(create_webhook_app(application, path, secret_token), shutdown_timeout=10)
+    await application.initialize()
+    try:
+        # Хуки вызываются в том же порядке, что и в run_polling
+        if application.post_init:
+            await application.post_init(application)
+
+        await application.bot.set_webhook(
+            url=url.rstrip('/') + path,
+            secret_token=secret_token,
+            allowed_updates=allowed_updates,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        await application.start()
+
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Webhook server listening on {host}:{port}{path}")
+
+        await stop_event.wait()
+        logger.info("Stopping webhook server...")
+    finally:
+        # Новые запросы больше не принимаются; принятые остаются в update_queue
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
@@ -0,0 +1,305 @@
+"""
+Асинхронные обертки над CRUD операциями.
+
+Синхронные запросы из queries.py выполняются в выделенном пуле потоков,
+поэтому медленный fsync SQLite не блокирует event loop бота.
+Каждый вызов открывает собственную сессию и закрывает ее по завершении.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Row
+
+from .models import ChartFile, Measurement, SessionLocal, UserProfile, UserStats
+from . import queries
+
+# Количество потоков для работы с БД
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', '4'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    Получить (или создать) пул потоков для запросов к БД.
+
+    Returns:
+        ThreadPoolExecutor
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=DB_EXECUTOR_WORKERS,
+            thread_name_prefix='db'
+        )
+    return _executor
+
+
+def shutdown_db_executor():
+    """
+    Остановить пул потоков БД (дожидается завершения текущих запросов).
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _call_in_session(func: Callable, *args, **kwargs) -> Any:
+    """
+    Выполнить func(db, *args, **kwargs) в новой сессии (вызывается в потоке пула).
+    """
+    db = SessionLocal()
+    try:
+        return func(db, *args, **kwargs)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def run_in_session(func: Callable, *args, **kwargs) -> Any:
+    """
+    Выполнить синхронную функцию вида func(db, ...) в пуле потоков БД.
+
+    Args:
+        func: Функция, первым аргументом принимающая Session
+        *args, **kwargs: Остальные аргументы функции
+
+    Returns:
+        Результат func
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(),
+        functools.partial(_call_in_session, func, *args, **kwargs)
+    )
+
+
+async def create_measurement(
+    user_id: int,
+    measurement_date: date,
+    weight: Optional[float] = None,
+    calories: Optional[int] = None,
+    waist: Optional[float] = None,
+    neck: Optional[float] = None
+) -> Measurement:
+    """Async-версия queries.create_measurement."""
+    return await run_in_session(
+        queries.create_measurement,
+        user_id=user_id,
+        measurement_date=measurement_date,
+        weight=weight,
+        calories=calories,
+        waist=waist,
+        neck=neck
+    )
+
+
+async def upsert_measurement(
+    user_id: int,
+    measurement_date: date,
+    weight: Optional[float] = None,
+    waist: Optional[float] = None,
+    neck: Optional[float] = None,
+    calories: Optional[int] = None,
+    only_if_weight_empty: bool = False
+) -> Optional[Row]:
+    """Async-версия queries.upsert_measurement."""
+    return await run_in_session(
+        queries.upsert_measurement,
+        user_id=user_id,
+        measurement_date=measurement_date,
+        weight=weight,
+        waist=waist,
+        neck=neck,
+        calories=calories,
+        only_if_weight_empty=only_if_weight_empty
+    )
+
+
+async def save_daily_entry(
+    user_id: int,
+    measurement_date: date,
+    weight: float,
+    waist: Optional[float],
+    neck: Optional[float],
+    calories_date: date,
+    calories: int
+) -> Optional[Row]:
+    """Async-версия queries.save_daily_entry."""
+    return await run_in_session(
+        queries.save_daily_entry,
+        user_id=user_id,
+        measurement_date=measurement_date,
+        weight=weight,
+        waist=waist,
+        neck=neck,
+        calories_date=calories_date,
+        calories=calories
+    )
+
+
+async def update_or_create_calories(
+    user_id: int,
+    measurement_date: date,
+    calories: int
+) -> Row:
+    """Async-версия queries.update_or_create_calories."""
+    return await run_in_session(
+        queries.update_or_create_calories,
+        user_id=user_id,
+        measurement_date=measurement_date,
+        calories=calories
+    )
+
+
+async def get_measurement_by_id(measurement_id: int) -> Optional[Measurement]:
+    """Async-версия queries.get_measurement_by_id."""
+    return await run_in_session(queries.get_measurement_by_id, measurement_id)
+
+
+async def get_measurement_by_date(user_id: int, measurement_date: date) -> Optional[Measurement]:
+    """Async-версия queries.get_measurement_by_date."""
+    return await run_in_session(queries.get_measurement_by_date, user_id, measurement_date)
+
+
+async def get_measurements_by_period(user_id: int, days: int) -> List[Measurement]:
+    """Async-версия queries.get_measurements_by_period."""
+    return await run_in_session(queries.get_measurements_by_period, user_id, days)
+
+
+async def get_measurement_rows_by_period(user_id: int, days: int) -> Sequence[Row]:
+    """Async-версия queries.get_measurement_rows_by_period."""
+    return await run_in_session(queries.get_measurement_rows_by_period, user_id, days)
+
+
+async def get_all_measurement_rows(user_id: int) -> Sequence[Row]:
+    """Async-версия queries.get_all_measurement_rows."""
+    return await run_in_session(queries.get_all_measurement_rows, user_id)
+
+
+async def get_active_user_ids(since: date, notifications_only: bool = False) -> List[int]:
+    """Async-версия queries.get_active_user_ids."""
+    return await run_in_session(queries.get_active_user_ids, since, notifications_only)
+
+
+async def get_measurement_rows_for_users(user_ids: Sequence[int], since: date) -> Sequence[Row]:
+    """Async-версия queries.get_measurement_rows_for_users."""
+    return await run_in_session(queries.get_measurement_rows_for_users, user_ids, since)
+
+
+async def get_last_measurements(user_id: int, limit: int = 5) -> List[Measurement]:
+    """Async-версия queries.get_last_measurements."""
+    return await run_in_session(queries.get_last_measurements, user_id, limit)
+
+
+async def get_all_measurements(user_id: int) -> List[Measurement]:
+    """Async-версия queries.get_all_measurements."""
+    return await run_in_session(queries.get_all_measurements, user_id)
+
+
+async def delete_measurement(measurement_id: int) -> bool:
+    """Async-версия queries.delete_measurement."""
+    return await run_in_session(queries.delete_measurement, measurement_id)
+
+
+async def update_measurement(
+    measurement_id: int,
+    weight: Optional[float] = None,
+    waist: Optional[float] = None,
+    neck: Optional[float] = None,
+    calories: Optional[int] = None
+) -> Optional[Measurement]:
+    """Async-версия queries.update_measurement."""
+    return await run_in_session(
+        queries.update_measurement,
+        measurement_id,
+        weight=weight,
+        waist=waist,
+        neck=neck,
+        calories=calories
+    )
+
+
+async def get_or_create_user_profile(user_id: int) -> UserProfile:
+    """Async-версия queries.get_or_create_user_profile."""
+    return await run_in_session(queries.get_or_create_user_profile, user_id)
+
+
+async def set_start_date(user_id: int, start_date: date) -> UserProfile:
+    """Async-версия queries.set_start_date."""
+    return await run_in_session(queries.set_start_date, user_id, start_date)
+
+
+async def get_user_start_date(user_id: int) -> Optional[date]:
+    """Async-версия queries.get_user_start_date."""
+    return await run_in_session(queries.get_user_start_date, user_id)
+
+
+async def get_data_version(user_id: int) -> int:
+    """Async-версия queries.get_data_version."""
+    return await run_in_session(queries.get_data_version, user_id)
+
+
+async def get_user_stats(user_id: int) -> Optional[UserStats]:
+    """Async-версия queries.get_user_stats."""
+    return await run_in_session(queries.get_user_stats, user_id)
+
+
+async def get_progress_metrics(user_id: int) -> dict:
+    """Async-версия queries.get_progress_metrics."""
+    return await run_in_session(queries.get_progress_metrics, user_id)
+
+
+async def set_reminder(
+    user_id: int,
+    reminder_time: Optional[time] = None,
+    timezone: Optional[str] = None,
+    enabled: bool = True
+) -> UserProfile:
+    """Async-версия queries.set_reminder."""
+    return await run_in_session(queries.set_reminder, user_id, reminder_time, timezone, enabled)
+
+
+async def ensure_default_reminder(user_id: int) -> UserProfile:
+    """Async-версия queries.ensure_default_reminder."""
+    return await run_in_session(queries.ensure_default_reminder, user_id)
+
+
+async def claim_due_reminders(now: datetime, limit: int) -> List[Tuple[int, bool]]:
+    """Async-версия queries.claim_due_reminders."""
+    return await run_in_session(queries.claim_due_reminders, now, limit)
+
+
+async def get_chart_file(user_id: int, period_days: int) -> Optional[ChartFile]:
+    """Async-версия queries.get_chart_file."""
+    return await run_in_session(queries.get_chart_file, user_id, period_days)
+
+
+async def save_chart_file(user_id: int, period_days: int, series_hash: str, file_id: str) -> ChartFile:
+    """Async-версия queries.save_chart_file."""
+    return await run_in_session(queries.save_chart_file, user_id, period_days, series_hash, file_id)
+
+
+async def delete_chart_file(user_id: int, period_days: int) -> bool:
+    """Async-версия queries.delete_chart_file."""
+    return await run_in_session(queries.delete_chart_file, user_id, period_days)
+
+
+async def get_bot_states(namespace: str) -> Sequence[Row]:
+    """Async-версия queries.get_bot_states."""
+    return await run_in_session(queries.get_bot_states, namespace)
+
+
+async def save_bot_states(
+    upserts: Sequence[Tuple[str, str, bytes]],
+    deletes: Sequence[Tuple[str, str]]
+) -> None:
+    """Async-версия queries.save_bot_states."""
+    return await run_in_session(queries.save_bot_states, upserts, deletes)
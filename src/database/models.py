@@ -2,9 +2,10 @@
 SQLAlchemy модели для базы данных deficit бота.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, BigInteger, Float, Date, DateTime, UniqueConstraint, create_engine
+from sqlalchemy import Column, Integer, BigInteger, Boolean, Float, String, Date, DateTime, Time, LargeBinary, Index, create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 Base = declarative_base()
 
@@ -16,6 +17,11 @@ class UserProfile(Base):
     Поля:
     - user_id: Telegram user ID (первичный ключ)
     - start_date: Дата начала трекинга дефицита калорий
+    - data_version: Версия данных замеров (увеличивается при каждом изменении)
+    - reminder_enabled: Включены ли ежедневные напоминания
+    - reminder_time: Локальное время напоминания (None - не настраивалось)
+    - timezone: Часовой пояс пользователя (имя из базы tz, например Europe/Moscow)
+    - next_reminder_at: Момент следующего напоминания в UTC (None - напоминания выключены)
     - created_at: Timestamp создания профиля
     - updated_at: Timestamp последнего обновления
     """
@@ -23,6 +29,11 @@ class UserProfile(Base):
 
     user_id = Column(BigInteger, primary_key=True)
     start_date = Column(Date, nullable=True)
+    data_version = Column(Integer, nullable=False, default=0, server_default='0')
+    reminder_enabled = Column(Boolean, nullable=False, default=False, server_default='0')
+    reminder_time = Column(Time, nullable=True)
+    timezone = Column(String(64), nullable=False, default='Europe/Moscow', server_default='Europe/Moscow')
+    next_reminder_at = Column(DateTime, nullable=True, index=True)  # Выборка пользователей к отправке
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
@@ -43,33 +54,217 @@ class Measurement(Base):
     - neck: Объем шеи в см (опционально, измеряется раз в неделю)
     - calories: Калории за день
     - created_at: Timestamp создания записи
+    - updated_at: Timestamp последнего обновления
     """
     __tablename__ = 'measurements'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(BigInteger, nullable=False, index=True)
-    date = Column(Date, nullable=False, index=True)
+    user_id = Column(BigInteger, nullable=False)
+    date = Column(Date, nullable=False)
     weight = Column(Float, nullable=True)  # Опционально (для записей только с калориями)
     waist = Column(Float, nullable=True)   # Опционально (измеряется раз в неделю)
     neck = Column(Float, nullable=True)    # Опционально (измеряется раз в неделю)
     calories = Column(Integer, nullable=True)  # Опционально (за предыдущий день)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
-    # Ограничение: одна запись на день для пользователя
+    # Одна запись на день для пользователя. Единственный индекс таблицы:
+    # им же обслуживаются выборки по user_id и диапазону дат
     __table_args__ = (
-        UniqueConstraint('user_id', 'date', name='uix_user_date'),
+        Index('uix_measurements_user_date', 'user_id', 'date', unique=True),
     )
 
     def __repr__(self):
         return f"<Measurement(id={self.id}, user_id={self.user_id}, date={self.date}, weight={self.weight}kg)>"
 
 
+class ChartFile(Base):
+    """
+    Модель для хранения Telegram file_id последнего отправленного графика.
+
+    Поля:
+    - user_id: Telegram user ID
+    - period_days: Период графика в днях
+    - series_hash: Хэш данных, по которым построен график
+    - file_id: Telegram file_id загруженного PNG
+    - created_at: Timestamp сохранения
+    """
+    __tablename__ = 'chart_files'
+
+    user_id = Column(BigInteger, primary_key=True)
+    period_days = Column(Integer, primary_key=True)
+    series_hash = Column(String(64), nullable=False)
+    file_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<ChartFile(user_id={self.user_id}, period_days={self.period_days}, file_id={self.file_id})>"
+
+
+class BotState(Base):
+    """
+    Модель для хранения состояния бота между перезапусками (см. bot/persistence.py).
+
+    Поля:
+    - namespace: Тип данных ('user_data', 'conversation:<имя диалога>')
+    - key: Ключ внутри namespace (user_id или ключ диалога)
+    - data: Значение (pickle)
+    - updated_at: Timestamp последней записи
+    """
+    __tablename__ = 'bot_state'
+
+    namespace = Column(String(64), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<BotState(namespace={self.namespace}, key={self.key})>"
+
+
+class UserStats(Base):
+    """
+    Модель для хранения агрегатов по всем замерам пользователя.
+
+    Обновляется инкрементально каждой операцией записи в queries.py
+    (в той же транзакции), поэтому итоги прогресса не требуют чтения
+    всех записей. Пересоздается из measurements: scripts/rebuild_user_stats.py.
+
+    Поля (для каждого показателя <m> из weight, waist, neck, calories):
+    - user_id: Telegram user ID (первичный ключ)
+    - <m>_count, <m>_sum: Количество непустых значений и их сумма (для среднего)
+    - <m>_min, <m>_max: Минимум и максимум
+    - <m>_first, <m>_first_date: Самое раннее значение и его дата
+    - <m>_last, <m>_last_date: Самое позднее значение и его дата
+    - updated_at: Timestamp последнего обновления
+    """
+    __tablename__ = 'user_stats'
+
+    user_id = Column(BigInteger, primary_key=True)
+
+    # Вес
+    weight_count = Column(Integer, nullable=False, default=0, server_default='0')
+    weight_sum = Column(Float, nullable=False, default=0.0, server_default='0')
+    weight_min = Column(Float, nullable=True)
+    weight_max = Column(Float, nullable=True)
+    weight_first = Column(Float, nullable=True)
+    weight_first_date = Column(Date, nullable=True)
+    weight_last = Column(Float, nullable=True)
+    weight_last_date = Column(Date, nullable=True)
+
+    # Талия
+    waist_count = Column(Integer, nullable=False, default=0, server_default='0')
+    waist_sum = Column(Float, nullable=False, default=0.0, server_default='0')
+    waist_min = Column(Float, nullable=True)
+    waist_max = Column(Float, nullable=True)
+    waist_first = Column(Float, nullable=True)
+    waist_first_date = Column(Date, nullable=True)
+    waist_last = Column(Float, nullable=True)
+    waist_last_date = Column(Date, nullable=True)
+
+    # Шея
+    neck_count = Column(Integer, nullable=False, default=0, server_default='0')
+    neck_sum = Column(Float, nullable=False, default=0.0, server_default='0')
+    neck_min = Column(Float, nullable=True)
+    neck_max = Column(Float, nullable=True)
+    neck_first = Column(Float, nullable=True)
+    neck_first_date = Column(Date, nullable=True)
+    neck_last = Column(Float, nullable=True)
+    neck_last_date = Column(Date, nullable=True)
+
+    # Калории
+    calories_count = Column(Integer, nullable=False, default=0, server_default='0')
+    calories_sum = Column(Float, nullable=False, default=0.0, server_default='0')
+    calories_min = Column(Float, nullable=True)
+    calories_max = Column(Float, nullable=True)
+    calories_first = Column(Float, nullable=True)
+    calories_first_date = Column(Date, nullable=True)
+    calories_last = Column(Float, nullable=True)
+    calories_last_date = Column(Date, nullable=True)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<UserStats(user_id={self.user_id}, weight_count={self.weight_count})>"
+
+
 # Database connection and session setup
 import os
 DB_PATH = os.getenv('DB_PATH', './data/deficit.db')
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
-engine = create_engine(DATABASE_URL, echo=False)
+# Профиль производительности SQLite (применяется к каждому соединению)
+# WAL: читатели не блокируют писателя; NORMAL безопасен в режиме WAL
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL').upper()
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').upper()
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', '-65536'))  # < 0 - в КиБ (64 МБ)
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+DB_TEMP_STORE = os.getenv('DB_TEMP_STORE', 'MEMORY').upper()
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+
+# Пул соединений (должен покрывать DB_EXECUTOR_WORKERS)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+_ALLOWED_PRAGMA_VALUES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+}
+
+
+def sqlite_pragmas() -> dict:
+    """
+    Собрать PRAGMA для новых соединений из переменных окружения.
+
+    Returns:
+        dict {pragma: значение}
+
+    Raises:
+        ValueError: Если значение PRAGMA недопустимо
+    """
+    pragmas = {
+        'journal_mode': DB_JOURNAL_MODE,
+        'synchronous': DB_SYNCHRONOUS,
+        'cache_size': DB_CACHE_SIZE,
+        'mmap_size': DB_MMAP_SIZE,
+        'temp_store': DB_TEMP_STORE,
+        'busy_timeout': DB_BUSY_TIMEOUT_MS,
+    }
+    for name, allowed in _ALLOWED_PRAGMA_VALUES.items():
+        if pragmas[name] not in allowed:
+            raise ValueError(f"Invalid SQLite {name}: {pragmas[name]} (allowed: {', '.join(sorted(allowed))})")
+    return pragmas
+
+
+SQLITE_PRAGMAS = sqlite_pragmas()
+
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    # Сессии используются из пула потоков БД (см. async_queries)
+    connect_args={'check_same_thread': False}
+)
+
+
+@event.listens_for(engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Применить профиль SQLITE_PRAGMAS к новому соединению.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -87,8 +282,9 @@ def init_db():
 
     # Проверить подключение к базе
     try:
-        engine.connect()
-        print("✅ Database connection successful")
+        with engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+        print(f"✅ Database connection successful (journal_mode={journal_mode})")
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
         raise
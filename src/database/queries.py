@@ -1,12 +1,23 @@
 """
 CRUD операции для работы с базой данных.
 """
-from datetime import date, datetime, timedelta
-from typing import List, Optional
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Sequence, Tuple
+import pytz
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import Row, case, delete, desc, func, insert, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from .models import Measurement, UserProfile
+from .models import BotState, ChartFile, Measurement, UserProfile, UserStats
+
+# Колонки для read-only выборок (графики, экспорт): без id и служебных полей
+MEASUREMENT_ROW_COLUMNS = (
+    Measurement.date,
+    Measurement.weight,
+    Measurement.waist,
+    Measurement.neck,
+    Measurement.calories,
+)
 
 
 def create_measurement(
@@ -45,17 +56,137 @@ def create_measurement(
         calories=calories
     )
     db.add(measurement)
+    bump_data_version(db, user_id)
+    apply_stats_change(db, user_id, measurement_date, {}, _measurement_values(measurement))
     db.commit()
     db.refresh(measurement)
     return measurement
 
 
+def upsert_measurement(
+    db: Session,
+    user_id: int,
+    measurement_date: date,
+    weight: Optional[float] = None,
+    waist: Optional[float] = None,
+    neck: Optional[float] = None,
+    calories: Optional[int] = None,
+    only_if_weight_empty: bool = False,
+    commit: bool = True
+) -> Optional[Row]:
+    """
+    Создать запись за дату или обновить существующую одним запросом.
+
+    INSERT ... ON CONFLICT(user_id, date) DO UPDATE ... RETURNING:
+    без предварительного SELECT и без гонки между параллельными сохранениями.
+    При обновлении меняются только переданные (не None) показатели,
+    остальные значения существующей записи сохраняются.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        measurement_date: Дата замера
+        weight: Вес в кг (опционально)
+        waist: Объем талии в см (опционально)
+        neck: Объем шеи в см (опционально)
+        calories: Калории за день (опционально)
+        only_if_weight_empty: Обновлять существующую запись, только если в ней нет веса
+            (запись, созданная только с калориями)
+        commit: Зафиксировать транзакцию (False - вызывающий коммитит сам)
+
+    Returns:
+        Строка (id, date, weight, waist, neck, calories) или None,
+        если запись существует и only_if_weight_empty не позволил ее изменить
+    """
+    values = {'weight': weight, 'waist': waist, 'neck': neck, 'calories': calories}
+    now = datetime.utcnow()
+
+    # Запись в начале транзакции берет блокировку записи SQLite: старые значения,
+    # прочитанные ниже для user_stats, не изменятся до commit
+    bump_data_version(db, user_id)
+    previous = db.execute(
+        select(*MEASUREMENT_ROW_COLUMNS).where(
+            Measurement.user_id == user_id,
+            Measurement.date == measurement_date
+        )
+    ).first()
+
+    stmt = sqlite_insert(Measurement).values(
+        user_id=user_id,
+        date=measurement_date,
+        created_at=now,
+        updated_at=now,
+        **values
+    )
+    update_values = {name: stmt.excluded[name] for name, value in values.items() if value is not None}
+    update_values['updated_at'] = stmt.excluded.updated_at
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Measurement.user_id, Measurement.date],
+        set_=update_values,
+        where=Measurement.weight.is_(None) if only_if_weight_empty else None
+    ).returning(Measurement.id, *MEASUREMENT_ROW_COLUMNS)
+
+    row = db.execute(stmt).first()
+    if row is None:
+        if commit:
+            db.rollback()
+        return None
+
+    apply_stats_change(db, user_id, measurement_date, _measurement_values(previous), _measurement_values(row))
+    if commit:
+        db.commit()
+    return row
+
+
+def save_daily_entry(
+    db: Session,
+    user_id: int,
+    measurement_date: date,
+    weight: float,
+    waist: Optional[float],
+    neck: Optional[float],
+    calories_date: date,
+    calories: int
+) -> Optional[Row]:
+    """
+    Сохранить замеры за день и калории за предыдущий день в одной транзакции.
+
+    Если за measurement_date уже есть запись только с калориями, вес/талия/шея
+    дописываются в нее. Если вес за эту дату уже внесен, ничего не сохраняется.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        measurement_date: Дата замера
+        weight: Вес в кг
+        waist: Объем талии в см (опционально)
+        neck: Объем шеи в см (опционально)
+        calories_date: Дата, к которой относятся калории
+        calories: Калории за день
+
+    Returns:
+        Строка записи за measurement_date или None, если запись с весом уже существует
+    """
+    measurement = upsert_measurement(
+        db, user_id, measurement_date,
+        weight=weight, waist=waist, neck=neck,
+        only_if_weight_empty=True, commit=False
+    )
+    if measurement is None:
+        db.rollback()
+        return None
+
+    upsert_measurement(db, user_id, calories_date, calories=calories, commit=False)
+    db.commit()
+    return measurement
+
+
 def update_or_create_calories(
     db: Session,
     user_id: int,
     measurement_date: date,
     calories: int
-) -> Measurement:
+) -> Row:
     """
     Обновить калории в существующей записи или создать новую запись только с калориями.
 
@@ -66,35 +197,28 @@ def update_or_create_calories(
         calories: Калории за день
 
     Returns:
-        Обновленная или созданная запись Measurement
+        Строка (id, date, weight, waist, neck, calories) обновленной или созданной записи
     """
-    # Попытаться найти существующую запись
-    measurement = db.query(Measurement).filter(
-        Measurement.user_id == user_id,
-        Measurement.date == measurement_date
-    ).first()
+    return upsert_measurement(db, user_id, measurement_date, calories=calories)
 
-    if measurement:
-        # Обновить калории в существующей записи
-        measurement.calories = calories
-        measurement.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(measurement)
-    else:
-        # Создать новую запись только с калориями
-        measurement = Measurement(
-            user_id=user_id,
-            date=measurement_date,
-            weight=None,
-            waist=None,
-            neck=None,
-            calories=calories
-        )
-        db.add(measurement)
-        db.commit()
-        db.refresh(measurement)
 
-    return measurement
+def get_measurement_by_id(
+    db: Session,
+    measurement_id: int
+) -> Optional[Measurement]:
+    """
+    Получить запись по ID.
+
+    Args:
+        db: Сессия БД
+        measurement_id: ID записи
+
+    Returns:
+        Measurement или None если нет записи
+    """
+    return db.query(Measurement).filter(
+        Measurement.id == measurement_id
+    ).first()
 
 
 def get_measurement_by_date(
@@ -142,6 +266,105 @@ def get_measurements_by_period(
     ).order_by(Measurement.date.asc()).all()
 
 
+def get_measurement_rows_by_period(
+    db: Session,
+    user_id: int,
+    days: int
+) -> Sequence[Row]:
+    """
+    Получить строки (date, weight, waist, neck, calories) за последние N дней.
+
+    Core-запрос без создания ORM-объектов: для read-only путей
+    (графики, экспорт), где нужны только значения колонок.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        days: Количество дней
+
+    Returns:
+        Список строк, отсортированный по дате (старые → новые)
+    """
+    start_date = date.today() - timedelta(days=days)
+    stmt = select(*MEASUREMENT_ROW_COLUMNS).where(
+        Measurement.user_id == user_id,
+        Measurement.date >= start_date
+    ).order_by(Measurement.date.asc())
+    return db.execute(stmt).all()
+
+
+def get_all_measurement_rows(
+    db: Session,
+    user_id: int
+) -> Sequence[Row]:
+    """
+    Получить все строки (date, weight, waist, neck, calories) пользователя.
+
+    Core-запрос без создания ORM-объектов (см. get_measurement_rows_by_period).
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+
+    Returns:
+        Список строк, отсортированный по дате (старые → новые)
+    """
+    stmt = select(*MEASUREMENT_ROW_COLUMNS).where(
+        Measurement.user_id == user_id
+    ).order_by(Measurement.date.asc())
+    return db.execute(stmt).all()
+
+
+def get_active_user_ids(db: Session, since: date, notifications_only: bool = False) -> List[int]:
+    """
+    Получить пользователей, у которых есть записи начиная с даты.
+
+    Args:
+        db: Сессия БД
+        since: Начальная дата (включительно)
+        notifications_only: Только пользователи с включенными напоминаниями
+            (выключившие их через /remind off не получают и рассылки)
+
+    Returns:
+        Список user_id по возрастанию
+    """
+    stmt = select(Measurement.user_id).where(
+        Measurement.date >= since
+    )
+    if notifications_only:
+        stmt = stmt.join(UserProfile, UserProfile.user_id == Measurement.user_id).where(
+            UserProfile.reminder_enabled.is_(True)
+        )
+    stmt = stmt.distinct().order_by(Measurement.user_id)
+    return list(db.execute(stmt).scalars())
+
+
+def get_measurement_rows_for_users(
+    db: Session,
+    user_ids: Sequence[int],
+    since: date
+) -> Sequence[Row]:
+    """
+    Получить строки (user_id, date, weight, waist, neck, calories) пачки пользователей.
+
+    Для пакетной аналитики (еженедельный отчет): один запрос на пачку
+    вместо запроса на пользователя.
+
+    Args:
+        db: Сессия БД
+        user_ids: Пользователи пачки
+        since: Начальная дата (включительно)
+
+    Returns:
+        Список строк, отсортированный по пользователю и дате
+    """
+    stmt = select(Measurement.user_id, *MEASUREMENT_ROW_COLUMNS).where(
+        Measurement.user_id.in_(user_ids),
+        Measurement.date >= since
+    ).order_by(Measurement.user_id, Measurement.date)
+    return db.execute(stmt).all()
+
+
 def get_last_measurements(
     db: Session,
     user_id: int,
@@ -202,6 +425,8 @@ def delete_measurement(
 
     if measurement:
         db.delete(measurement)
+        bump_data_version(db, measurement.user_id)
+        apply_stats_change(db, measurement.user_id, measurement.date, _measurement_values(measurement), {})
         db.commit()
         return True
     return False
@@ -236,6 +461,7 @@ def update_measurement(
     if not measurement:
         return None
 
+    previous = _measurement_values(measurement)
     if weight is not None:
         measurement.weight = weight
     if waist is not None:
@@ -245,6 +471,8 @@ def update_measurement(
     if calories is not None:
         measurement.calories = calories
 
+    bump_data_version(db, measurement.user_id)
+    apply_stats_change(db, measurement.user_id, measurement.date, previous, _measurement_values(measurement))
     db.commit()
     db.refresh(measurement)
     return measurement
@@ -304,3 +532,572 @@ def get_user_start_date(db: Session, user_id: int) -> Optional[date]:
     """
     profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
     return profile.start_date if profile else None
+
+
+def bump_data_version(db: Session, user_id: int) -> None:
+    """
+    Увеличить версию данных пользователя (без commit).
+
+    Вызывается всеми операциями, изменяющими замеры, в той же транзакции.
+    Версия входит в ключ кэша графиков, поэтому старые графики
+    перестают использоваться автоматически.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+    """
+    now = datetime.utcnow()
+    stmt = sqlite_insert(UserProfile).values(
+        user_id=user_id,
+        data_version=1,
+        created_at=now,
+        updated_at=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserProfile.user_id],
+        set_={'data_version': UserProfile.data_version + 1}
+    )
+    db.execute(stmt)
+
+
+def get_data_version(db: Session, user_id: int) -> int:
+    """
+    Получить версию данных пользователя.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+
+    Returns:
+        Версия данных (0 если профиля нет)
+    """
+    version = db.query(UserProfile.data_version).filter(UserProfile.user_id == user_id).scalar()
+    return version or 0
+
+
+# User stats operations
+
+# Показатели, по которым ведутся агрегаты user_stats
+STAT_METRICS = ('weight', 'waist', 'neck', 'calories')
+
+
+def _measurement_values(measurement) -> dict:
+    """Значения показателей записи (Measurement или строки) по именам из STAT_METRICS."""
+    if measurement is None:
+        return {}
+    return {name: getattr(measurement, name) for name in STAT_METRICS}
+
+
+def _get_stats_for_update(db: Session, user_id: int) -> UserStats:
+    """Получить агрегаты пользователя (или создать пустые) для изменения."""
+    stats = db.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(user_id=user_id)
+        for name in STAT_METRICS:
+            setattr(stats, f'{name}_count', 0)
+            setattr(stats, f'{name}_sum', 0.0)
+        db.add(stats)
+        # Session.get не находит незаписанные объекты: следующая запись
+        # в этой же транзакции (save_daily_entry) должна найти строку
+        db.flush([stats])
+    return stats
+
+
+def _remove_stat_value(
+    stats: UserStats,
+    name: str,
+    measurement_date: date,
+    value: float,
+    replacement: Optional[float]
+) -> bool:
+    """
+    Исключить значение показателя из агрегатов.
+
+    Returns:
+        True если значение было крайним и показатель нужно пересчитать по записям
+    """
+    low = getattr(stats, f'{name}_min')
+    high = getattr(stats, f'{name}_max')
+    if getattr(stats, f'{name}_count') <= 1 or low is None or value <= low or value >= high:
+        return True
+    # Значение на крайней дате без замены - неизвестно, какая запись станет первой/последней
+    endpoints = (getattr(stats, f'{name}_first_date'), getattr(stats, f'{name}_last_date'))
+    if replacement is None and measurement_date in endpoints:
+        return True
+
+    setattr(stats, f'{name}_count', getattr(stats, f'{name}_count') - 1)
+    setattr(stats, f'{name}_sum', getattr(stats, f'{name}_sum') - value)
+    return False
+
+
+def _add_stat_value(stats: UserStats, name: str, measurement_date: date, value: float):
+    """Учесть новое значение показателя в агрегатах."""
+    low = getattr(stats, f'{name}_min')
+    high = getattr(stats, f'{name}_max')
+    setattr(stats, f'{name}_count', getattr(stats, f'{name}_count') + 1)
+    setattr(stats, f'{name}_sum', getattr(stats, f'{name}_sum') + value)
+    setattr(stats, f'{name}_min', value if low is None else min(low, value))
+    setattr(stats, f'{name}_max', value if high is None else max(high, value))
+
+    first_date = getattr(stats, f'{name}_first_date')
+    if first_date is None or measurement_date <= first_date:
+        setattr(stats, f'{name}_first', value)
+        setattr(stats, f'{name}_first_date', measurement_date)
+    last_date = getattr(stats, f'{name}_last_date')
+    if last_date is None or measurement_date >= last_date:
+        setattr(stats, f'{name}_last', value)
+        setattr(stats, f'{name}_last_date', measurement_date)
+
+
+def _recompute_stat(db: Session, stats: UserStats, name: str):
+    """Пересчитать агрегаты одного показателя по записям пользователя (индекс user_id, date)."""
+    # Сессия без autoflush: записать изменения замеров до чтения
+    db.flush()
+    column = getattr(Measurement, name)
+    user_values = (Measurement.user_id == stats.user_id, column.is_not(None))
+
+    count, total, low, high = db.execute(
+        select(func.count(column), func.sum(column), func.min(column), func.max(column))
+        .where(*user_values)
+    ).one()
+    first = db.execute(
+        select(Measurement.date, column).where(*user_values).order_by(Measurement.date.asc()).limit(1)
+    ).first()
+    last = db.execute(
+        select(Measurement.date, column).where(*user_values).order_by(Measurement.date.desc()).limit(1)
+    ).first()
+
+    setattr(stats, f'{name}_count', count)
+    setattr(stats, f'{name}_sum', float(total or 0))
+    setattr(stats, f'{name}_min', low)
+    setattr(stats, f'{name}_max', high)
+    setattr(stats, f'{name}_first', first[1] if first else None)
+    setattr(stats, f'{name}_first_date', first[0] if first else None)
+    setattr(stats, f'{name}_last', last[1] if last else None)
+    setattr(stats, f'{name}_last_date', last[0] if last else None)
+
+
+def apply_stats_change(
+    db: Session,
+    user_id: int,
+    measurement_date: date,
+    old: dict,
+    new: dict
+) -> None:
+    """
+    Учесть изменение одной записи в агрегатах пользователя (без commit).
+
+    Вызывается всеми операциями, изменяющими замеры, в той же транзакции.
+    Обычно обновление O(1): количество, сумма, минимум/максимум и крайние
+    даты меняются по старому и новому значению. Показатель пересчитывается
+    по записям, только если удалено или изменено его крайнее значение.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        measurement_date: Дата измененной записи
+        old: Значения показателей до изменения ({} - записи не было)
+        new: Значения показателей после изменения ({} - запись удалена)
+    """
+    stats = None
+    for name in STAT_METRICS:
+        old_value, new_value = old.get(name), new.get(name)
+        if old_value == new_value:
+            continue
+
+        if stats is None:
+            stats = _get_stats_for_update(db, user_id)
+
+        if old_value is not None and _remove_stat_value(stats, name, measurement_date, old_value, new_value):
+            _recompute_stat(db, stats, name)
+        elif new_value is not None:
+            _add_stat_value(stats, name, measurement_date, new_value)
+
+    if stats is not None:
+        stats.updated_at = datetime.utcnow()
+
+
+def get_user_stats(db: Session, user_id: int) -> Optional[UserStats]:
+    """
+    Получить агрегаты по всем замерам пользователя.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+
+    Returns:
+        UserStats или None если записей не было
+    """
+    return db.get(UserStats, user_id)
+
+
+def get_progress_metrics(db: Session, user_id: int) -> dict:
+    """
+    Метрики прогресса за все время из агрегатов, без чтения записей.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+
+    Returns:
+        dict с полями <metric>_start/_current/_diff (формат
+        visualization.series.compute_progress_metrics), а также
+        <metric>_count/_min/_max/_avg для веса, талии, шеи и калорий
+        (только для показателей, по которым есть данные)
+    """
+    stats = get_user_stats(db, user_id)
+    metrics = {}
+    if stats is None:
+        return metrics
+
+    for name in STAT_METRICS:
+        count = getattr(stats, f'{name}_count')
+        if not count:
+            continue
+        metrics[f'{name}_count'] = count
+        metrics[f'{name}_min'] = getattr(stats, f'{name}_min')
+        metrics[f'{name}_max'] = getattr(stats, f'{name}_max')
+        metrics[f'{name}_avg'] = getattr(stats, f'{name}_sum') / count
+        if name != 'calories':
+            start = getattr(stats, f'{name}_first')
+            current = getattr(stats, f'{name}_last')
+            metrics[f'{name}_start'] = start
+            metrics[f'{name}_current'] = current
+            metrics[f'{name}_diff'] = current - start
+    return metrics
+
+
+def rebuild_user_stats(db: Session, user_id: Optional[int] = None, commit: bool = True) -> int:
+    """
+    Пересчитать user_stats по measurements.
+
+    Для заполнения после восстановления БД из бэкапа, ручных правок
+    measurements или для проверки инкрементальных обновлений.
+    Выполняется одним INSERT ... SELECT в одной транзакции.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID (None - все пользователи)
+        commit: Зафиксировать транзакцию (False - вызывающий коммитит или откатывает сам)
+
+    Returns:
+        Количество пользователей, для которых записаны агрегаты
+    """
+    users = select(Measurement.user_id).distinct()
+    if user_id is not None:
+        users = users.where(Measurement.user_id == user_id)
+    users = users.subquery()
+
+    columns = {'user_id': users.c.user_id}
+    for name in STAT_METRICS:
+        column = getattr(Measurement, name)
+        user_values = (Measurement.user_id == users.c.user_id, column.is_not(None))
+        oldest = select(column, Measurement.date).where(*user_values).order_by(Measurement.date.asc()).limit(1)
+        newest = select(column, Measurement.date).where(*user_values).order_by(Measurement.date.desc()).limit(1)
+
+        columns[f'{name}_count'] = select(func.count(column)).where(*user_values).scalar_subquery()
+        columns[f'{name}_sum'] = select(func.coalesce(func.sum(column), 0)).where(*user_values).scalar_subquery()
+        columns[f'{name}_min'] = select(func.min(column)).where(*user_values).scalar_subquery()
+        columns[f'{name}_max'] = select(func.max(column)).where(*user_values).scalar_subquery()
+        columns[f'{name}_first'] = oldest.with_only_columns(column).scalar_subquery()
+        columns[f'{name}_first_date'] = oldest.with_only_columns(Measurement.date).scalar_subquery()
+        columns[f'{name}_last'] = newest.with_only_columns(column).scalar_subquery()
+        columns[f'{name}_last_date'] = newest.with_only_columns(Measurement.date).scalar_subquery()
+    columns['updated_at'] = literal(datetime.utcnow(), UserStats.updated_at.type)
+
+    stale = delete(UserStats)
+    if user_id is not None:
+        stale = stale.where(UserStats.user_id == user_id)
+    db.execute(stale)
+    result = db.execute(insert(UserStats).from_select(list(columns), select(*columns.values())))
+    if commit:
+        db.commit()
+    return result.rowcount
+
+
+# Reminder operations
+
+# Напоминание по умолчанию (как было до персональных настроек)
+DEFAULT_REMINDER_TIME = time(9, 0)
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+
+
+def next_reminder_at(reminder_time: time, timezone: str, after: datetime) -> datetime:
+    """
+    Вычислить ближайший момент напоминания после заданного.
+
+    Args:
+        reminder_time: Локальное время напоминания
+        timezone: Часовой пояс пользователя
+        after: Момент в UTC (naive)
+
+    Returns:
+        Момент следующего напоминания в UTC (naive), строго позже after
+    """
+    tz = pytz.timezone(timezone)
+    local_after = pytz.utc.localize(after).astimezone(tz)
+
+    candidate_date = local_after.date()
+    while True:
+        candidate = tz.normalize(tz.localize(datetime.combine(candidate_date, reminder_time)))
+        candidate_utc = candidate.astimezone(pytz.utc).replace(tzinfo=None)
+        if candidate_utc > after:
+            return candidate_utc
+        candidate_date += timedelta(days=1)
+
+
+def set_reminder(
+    db: Session,
+    user_id: int,
+    reminder_time: Optional[time] = None,
+    timezone: Optional[str] = None,
+    enabled: bool = True
+) -> UserProfile:
+    """
+    Включить/выключить ежедневное напоминание и сохранить его время.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        reminder_time: Локальное время (None - оставить текущее или по умолчанию)
+        timezone: Часовой пояс (None - оставить текущий)
+        enabled: Включить (True) или выключить (False)
+
+    Returns:
+        Обновленный UserProfile
+
+    Raises:
+        pytz.UnknownTimeZoneError: Если часовой пояс неизвестен
+    """
+    if timezone is not None:
+        pytz.timezone(timezone)
+
+    profile = get_or_create_user_profile(db, user_id)
+    if timezone is not None:
+        profile.timezone = timezone
+    if reminder_time is not None:
+        profile.reminder_time = reminder_time
+    elif profile.reminder_time is None:
+        profile.reminder_time = DEFAULT_REMINDER_TIME
+
+    profile.reminder_enabled = enabled
+    profile.next_reminder_at = (
+        next_reminder_at(profile.reminder_time, profile.timezone, datetime.utcnow())
+        if enabled else None
+    )
+    db.commit()
+    db.refresh(profile)
+    return profile
+
+
+def ensure_default_reminder(db: Session, user_id: int) -> UserProfile:
+    """
+    Включить напоминание по умолчанию, если пользователь его еще не настраивал.
+
+    Явно выключенное напоминание (/remind off) не включается повторно.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+
+    Returns:
+        UserProfile
+    """
+    profile = get_or_create_user_profile(db, user_id)
+    if profile.reminder_time is None:
+        profile = set_reminder(db, user_id, DEFAULT_REMINDER_TIME, enabled=True)
+    return profile
+
+
+def local_dates(timezones: Sequence[str], now: datetime) -> dict:
+    """
+    Текущая локальная дата для каждого часового пояса.
+
+    Args:
+        timezones: Имена часовых поясов
+        now: Текущий момент в UTC (naive)
+
+    Returns:
+        dict {timezone: date}
+    """
+    utc_now = pytz.utc.localize(now)
+    return {tz: utc_now.astimezone(pytz.timezone(tz)).date() for tz in timezones}
+
+
+def claim_due_reminders(db: Session, now: datetime, limit: int) -> List[Tuple[int, bool]]:
+    """
+    Забрать пачку пользователей, которым пора отправить напоминание.
+
+    Выборка идет по индексу next_reminder_at; для забранных пользователей
+    next_reminder_at сразу переносится на следующий день, поэтому
+    повторный вызов их не вернет (не более одного напоминания в день).
+
+    В том же запросе для каждого пользователя проверяется, есть ли у него
+    запись за сегодня (по его часовому поясу): коррелированный EXISTS
+    по индексу (user_id, date) вместо отдельного запроса на каждого.
+
+    Args:
+        db: Сессия БД
+        now: Текущий момент в UTC (naive)
+        limit: Максимальный размер пачки
+
+    Returns:
+        Список (user_id, logged_today); пустой - наступивших напоминаний нет
+    """
+    due = UserProfile.next_reminder_at <= now
+
+    # Локальная "сегодня" зависит только от часового пояса: считаем ее
+    # один раз на пояс и подставляем в запрос через CASE
+    timezones = db.execute(select(UserProfile.timezone).where(due).distinct()).scalars().all()
+    if not timezones:
+        return []
+    local_today = case(local_dates(timezones, now), value=UserProfile.timezone)
+
+    logged_today = select(Measurement.id).where(
+        Measurement.user_id == UserProfile.user_id,
+        Measurement.date == local_today
+    ).exists()
+
+    rows = db.execute(
+        select(
+            UserProfile.user_id,
+            UserProfile.reminder_time,
+            UserProfile.timezone,
+            logged_today.label('logged_today')
+        )
+        .where(due)
+        .order_by(UserProfile.next_reminder_at)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return []
+
+    db.execute(update(UserProfile), [
+        {
+            'user_id': row.user_id,
+            'next_reminder_at': next_reminder_at(row.reminder_time or DEFAULT_REMINDER_TIME, row.timezone, now)
+        }
+        for row in rows
+    ])
+    db.commit()
+    return [(row.user_id, bool(row.logged_today)) for row in rows]
+
+
+# Chart file operations
+
+def get_chart_file(db: Session, user_id: int, period_days: int) -> Optional[ChartFile]:
+    """
+    Получить сохраненный file_id последнего графика за период.
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        period_days: Период графика в днях
+
+    Returns:
+        ChartFile или None
+    """
+    return db.query(ChartFile).filter(
+        ChartFile.user_id == user_id,
+        ChartFile.period_days == period_days
+    ).first()
+
+
+def save_chart_file(
+    db: Session,
+    user_id: int,
+    period_days: int,
+    series_hash: str,
+    file_id: str
+) -> ChartFile:
+    """
+    Сохранить file_id отправленного графика (заменяет предыдущий за этот период).
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        period_days: Период графика в днях
+        series_hash: Хэш данных графика
+        file_id: Telegram file_id
+
+    Returns:
+        ChartFile
+    """
+    chart_file = db.merge(ChartFile(
+        user_id=user_id,
+        period_days=period_days,
+        series_hash=series_hash,
+        file_id=file_id,
+        created_at=datetime.utcnow()
+    ))
+    db.commit()
+    return chart_file
+
+
+def delete_chart_file(db: Session, user_id: int, period_days: int) -> bool:
+    """
+    Удалить сохраненный file_id (например, если Telegram его больше не принимает).
+
+    Args:
+        db: Сессия БД
+        user_id: Telegram user ID
+        period_days: Период графика в днях
+
+    Returns:
+        True если удалено, False если записи не было
+    """
+    deleted = db.query(ChartFile).filter(
+        ChartFile.user_id == user_id,
+        ChartFile.period_days == period_days
+    ).delete(synchronize_session=False)
+    db.commit()
+    return bool(deleted)
+
+
+# Bot state operations
+
+def get_bot_states(db: Session, namespace: str) -> Sequence[Row]:
+    """
+    Получить все сохраненные значения из namespace.
+
+    Args:
+        db: Сессия БД
+        namespace: Тип данных (например, 'user_data')
+
+    Returns:
+        Список строк (key, data)
+    """
+    stmt = select(BotState.key, BotState.data).where(BotState.namespace == namespace)
+    return db.execute(stmt).all()
+
+
+def save_bot_states(
+    db: Session,
+    upserts: Sequence[Tuple[str, str, bytes]],
+    deletes: Sequence[Tuple[str, str]]
+) -> None:
+    """
+    Записать пачку изменений состояния бота одной транзакцией.
+
+    Args:
+        db: Сессия БД
+        upserts: Список (namespace, key, data) для записи
+        deletes: Список (namespace, key) для удаления
+    """
+    now = datetime.utcnow()
+    if upserts:
+        stmt = sqlite_insert(BotState)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BotState.namespace, BotState.key],
+            set_={'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+        )
+        db.execute(stmt, [
+            {'namespace': namespace, 'key': key, 'data': data, 'updated_at': now}
+            for namespace, key, data in upserts
+        ])
+    for namespace, key in deletes:
+        db.query(BotState).filter(
+            BotState.namespace == namespace,
+            BotState.key == key
+        ).delete(synchronize_session=False)
+    db.commit()
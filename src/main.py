@@ -3,24 +3,35 @@ Deficit Tracker Bot - главный файл.
 
 Telegram-бот для отслеживания показателей тела и калорий.
 """
+import asyncio
 import os
 import logging
 from dotenv import load_dotenv
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from telegram import BotCommand
 
-from database.models import init_db
+# Загрузить переменные окружения до импорта модулей, читающих настройки из env
+load_dotenv()
+
+from database.models import engine, init_db
+from database.async_queries import shutdown_db_executor, ensure_default_reminder
+from visualization.render_pool import render_pool
+from visualization.chart_warmup import chart_warmup
 from bot.handlers import (
     start, graph, delete,
     graph_period_callback, delete_callback,
-    set_start_date_command, set_start_date_callback
+    set_start_date_command, set_start_date_callback,
+    remind_command, profile_command
 )
-from bot.conversations import add_conversation_handler
+from bot.conversations import STATE_NAMES, add_conversation_handler
 from bot.keyboard import button_graph, button_start_date, button_delete
 from bot.scheduler import setup_scheduler
-
-# Загрузить переменные окружения
-load_dotenv()
+from bot.outbox import outbox
+from bot.concurrency import PerUserUpdateProcessor
+from bot.persistence import SQLitePersistence
+from monitoring.metrics import InstrumentedRequest, metrics
+from monitoring.loop_lag import loop_lag_monitor
+from monitoring.profiler import update_profiler
 
 # Настройка логирования
 logging.basicConfig(
@@ -29,6 +40,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Способ получения обновлений: polling или webhook (см. bot/webhook.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Адрес Bot API: свой Bot API server или локальная заглушка (scripts/fake_bot_api.py)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+# Соединений к Bot API для отправки (как по умолчанию в python-telegram-bot)
+BOT_CONNECTION_POOL_SIZE = 256
+
+
+def add_handlers(application: Application):
+    """
+    Зарегистрировать обработчики команд, кнопок и диалогов.
+
+    Args:
+        application: Telegram Application
+    """
+    # Добавить command handlers
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(add_conversation_handler)  # Conversation для /add (включает кнопку "📊 Внести данные")
+    application.add_handler(CommandHandler("set_start", set_start_date_command))
+    application.add_handler(CommandHandler("graph", graph))
+    application.add_handler(CommandHandler("delete", delete))
+    application.add_handler(CommandHandler("remind", remind_command))
+
+    # Добавить handlers для кнопок клавиатуры
+    application.add_handler(MessageHandler(filters.Regex("^📈 График$"), button_graph))
+    application.add_handler(MessageHandler(filters.Regex("^📅 Дата старта$"), button_start_date))
+    application.add_handler(MessageHandler(filters.Regex("^🗑️ Удалить запись$"), button_delete))
+
+    # Добавить callback handlers
+    application.add_handler(CallbackQueryHandler(graph_period_callback, pattern='^graph_'))
+    application.add_handler(CallbackQueryHandler(delete_callback, pattern='^delete_'))
+    application.add_handler(CallbackQueryHandler(set_start_date_callback, pattern='^setstart_'))
+
 
 def main():
     """
@@ -47,54 +91,107 @@ def main():
         logger.error("OWNER_USER_ID=your_telegram_user_id")
         return
 
-    # Получить user ID владельца (опционально для напоминаний)
+    # Получить user ID владельца (ему напоминания включаются автоматически)
     owner_user_id_str = os.getenv('OWNER_USER_ID')
     owner_user_id = None
     if owner_user_id_str:
         try:
             owner_user_id = int(owner_user_id_str)
         except ValueError:
-            logger.warning("⚠️  OWNER_USER_ID некорректный, напоминания отключены")
+            logger.warning("⚠️  OWNER_USER_ID некорректный, напоминания владельцу не включены")
+
+    # Метрики Prometheus (METRICS_PORT, по умолчанию выключены)
+    if metrics.start():
+        metrics.instrument_engine(engine)
+        metrics.watch_render_pool(render_pool)
 
     # Создать приложение
     logger.info("Инициализация бота...")
-    application = Application.builder().token(token).build()
-
-    # Добавить command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(add_conversation_handler)  # Conversation для /add (включает кнопку "📊 Внести данные")
-    application.add_handler(CommandHandler("set_start", set_start_date_command))
-    application.add_handler(CommandHandler("graph", graph))
-    application.add_handler(CommandHandler("delete", delete))
-
-    # Добавить handlers для кнопок клавиатуры
-    application.add_handler(MessageHandler(filters.Regex("^📈 График$"), button_graph))
-    application.add_handler(MessageHandler(filters.Regex("^📅 Дата старта$"), button_start_date))
-    application.add_handler(MessageHandler(filters.Regex("^🗑️ Удалить запись$"), button_delete))
-
-    # Добавить callback handlers
-    application.add_handler(CallbackQueryHandler(graph_period_callback, pattern='^graph_'))
-    application.add_handler(CallbackQueryHandler(delete_callback, pattern='^delete_'))
-    application.add_handler(CallbackQueryHandler(set_start_date_callback, pattern='^setstart_'))
-
-    # Настроить напоминания (если указан OWNER_USER_ID)
+    # Обновления разных пользователей - параллельно, одного пользователя - по порядку;
+    # user_data и состояние /add сохраняются в БД
+    persistence = SQLitePersistence()
+    builder = (
+        Application.builder()
+        .token(token)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .concurrent_updates(PerUserUpdateProcessor())
+        .persistence(persistence)
+    )
+    if metrics.enabled:
+        # Задержки и статусы ответов Bot API (в том числе 429)
+        builder = (
+            builder
+            .request(InstrumentedRequest(connection_pool_size=BOT_CONNECTION_POOL_SIZE))
+            .get_updates_request(InstrumentedRequest())
+        )
+    application = builder.build()
+
+    add_handlers(application)
     if owner_user_id:
-        scheduler = setup_scheduler(application.bot, owner_user_id)
-        scheduler.start()
-        logger.info("✅ Напоминания настроены (9:00 МСК ежедневно)")
-    else:
-        logger.warning("⚠️  Напоминания отключены (не указан OWNER_USER_ID в .env)")
+        # Профилирование медленных обновлений (monitoring/profiler.py) - только владельцу
+        application.add_handler(
+            CommandHandler("profile", profile_command, filters=filters.User(user_id=owner_user_id))
+        )
+    metrics.instrument_handlers(application)
+    metrics.watch_conversations(persistence.conversation_counts, STATE_NAMES)
+
+    # Настроить напоминания (время и часовой пояс - в профиле каждого пользователя)
+    scheduler = setup_scheduler()
 
     # Убрать bot menu button (чтобы не показывать список команд)
     async def post_init(app: Application):
         await app.bot.delete_my_commands()
         logger.info("✅ Bot menu отключен")
 
-    application.post_init = post_init
+        # Логировать блокирующие вызовы в event loop (со стеком)
+        loop_lag_monitor.start()
 
-    # Запустить бота
-    logger.info("✅ Бот запущен и готов к работе!")
-    application.run_polling(allowed_updates=['message', 'callback_query'])
+        # Профили медленных обновлений (PROFILE_UPDATES или /profile on)
+        update_profiler.start()
+
+        # Запустить и прогреть процессы рендеринга графиков
+        render_pool.start()
+
+        # Очередь исходящих сообщений для рассылок
+        outbox.start(app.bot)
+
+        # Scheduler запускается внутри event loop бота (в обоих режимах)
+        scheduler.start()
+        logger.info("✅ Напоминания настроены (по умолчанию 9:00 МСК, /remind для изменения)")
+
+        # Владелец получает напоминания без /start (как раньше)
+        if owner_user_id:
+            await ensure_default_reminder(owner_user_id)
+
+    # Остановить рассылки, пока бот еще может отправлять сообщения
+    async def post_stop(app: Application):
+        scheduler.shutdown(wait=False)
+        await chart_warmup.stop()
+        await outbox.stop()
+        await loop_lag_monitor.stop()
+        await update_profiler.stop()
+
+    # Дождаться завершения запросов к БД при остановке
+    async def post_shutdown(app: Application):
+        render_pool.shutdown()
+        shutdown_db_executor()
+        logger.info("✅ Пулы рендеринга и БД остановлены")
+
+    application.post_init = post_init
+    application.post_stop = post_stop
+    application.post_shutdown = post_shutdown
+
+    # Запустить бота: long polling (по умолчанию) или webhook
+    allowed_updates = ['message', 'callback_query']
+    if BOT_MODE == 'webhook':
+        # aiohttp нужен только в режиме webhook
+        from bot.webhook import run_webhook
+        logger.info("✅ Бот запущен в режиме webhook")
+        asyncio.run(run_webhook(application, allowed_updates=allowed_updates))
+    else:
+        logger.info("✅ Бот запущен и готов к работе!")
+        application.run_polling(allowed_updates=allowed_updates)
 
 
 if __name__ == '__main__':
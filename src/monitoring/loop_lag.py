@@ -0,0 +1,189 @@
+"""
+Контроль задержек event loop и поиск блокирующих вызовов.
+
+Синхронный код внутри корутины (SQLAlchemy, matplotlib, тяжелые вычисления)
+останавливает весь event loop: в это время бот не отвечает никому. Монитор
+из двух частей находит такие места:
+- задача в event loop просыпается каждые LOOP_LAG_INTERVAL секунд и
+  записывает, насколько позже она проснулась (задержка loop)
+- сторожевой поток замечает, что задача давно не просыпалась, и, пока
+  loop заблокирован, снимает стек потока event loop (sys._current_frames)
+
+После зависания дольше LOOP_LAG_THRESHOLD в лог пишется его длительность и
+стек, а в метрики (monitoring.metrics) - задержка и функция проекта,
+в которой loop стоял чаще всего. В обычной работе это ~10 пробуждений
+в секунду и ни одного снятия стека, поэтому монитор включен по умолчанию.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional
+
+from monitoring.metrics import metrics as bot_metrics
+
+logger = logging.getLogger(__name__)
+
+# Включить контроль задержек event loop (1/0)
+LOOP_LAG_MONITOR = os.getenv('LOOP_LAG_MONITOR', '1') == '1'
+# Период проверки (сек)
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.1'))
+# Зависание дольше порога логируется со стеком (сек)
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.25'))
+
+# Сколько стеков снимать за одно зависание и какой глубины
+MAX_SAMPLES_PER_STALL = 50
+STACK_LIMIT = 40
+
+# Код проекта (src/) - по нему ищется виновная функция в стеке
+MONITORING_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(MONITORING_DIR)
+
+StackSample = List[traceback.FrameSummary]
+
+
+@dataclass
+class LagStats:
+    """Счетчики монитора с момента запуска."""
+    ticks: int = 0
+    stalls: int = 0
+    max_lag: float = 0.0
+
+
+def _is_project_frame(frame: traceback.FrameSummary) -> bool:
+    return frame.filename.startswith(SRC_DIR) and not frame.filename.startswith(MONITORING_DIR)
+
+
+def _culprit(stack: StackSample) -> str:
+    """Самая глубокая функция проекта в стеке ('bot/handlers.py:graph') или '' если ее нет."""
+    for frame in reversed(stack):
+        if _is_project_frame(frame):
+            return f"{os.path.relpath(frame.filename, SRC_DIR)}:{frame.name}"
+    return ''
+
+
+def _format_stack(stack: StackSample) -> str:
+    """Стек начиная с первой функции проекта (кадры asyncio и PTB выше нее не нужны)."""
+    start = next((i for i, frame in enumerate(stack) if _is_project_frame(frame)), 0)
+    return ''.join(traceback.format_list(stack[start:])).rstrip()
+
+
+class LoopLagMonitor:
+    """
+    Монитор задержек event loop со снятием стеков при зависаниях.
+
+    Args:
+        interval: Период проверки (сек)
+        threshold: Порог зависания (сек)
+        enabled: Включен ли монитор
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD,
+        enabled: bool = LOOP_LAG_MONITOR
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.enabled = enabled
+        self.stats = LagStats()
+
+        self._beat = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._samples: List[StackSample] = []
+
+    def start(self):
+        """Запустить монитор (вызывается внутри работающего event loop)."""
+        if not self.enabled or self._task is not None:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._tick(), name='loop-lag-monitor')
+        self._thread = threading.Thread(target=self._watch, name='loop-lag-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop lag monitor started: threshold {self.threshold * 1000:.0f} ms")
+
+    async def stop(self):
+        """Остановить монитор."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.to_thread(self._thread.join)
+        self._task = self._thread = None
+
+    async def _tick(self):
+        """Просыпаться каждые interval секунд и записывать опоздание."""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+
+            lag = max(0.0, now - started - self.interval)
+            self.stats.ticks += 1
+            self.stats.max_lag = max(self.stats.max_lag, lag)
+            bot_metrics.observe_loop_lag(lag)
+            if lag >= self.threshold:
+                self._report(lag)
+            elif self._samples:
+                # Стеки зависания, не дотянувшего до порога, не должны попасть
+                # в отчет о следующем (другом) зависании
+                with self._lock:
+                    self._samples = []
+
+    def _watch(self):
+        """
+        Сторожевой поток: пока loop не просыпается дольше порога, снимать его стек.
+        """
+        period = max(0.01, self.threshold / 2)
+        while not self._stopping.wait(period):
+            blocked = time.monotonic() - self._beat - self.interval
+            if blocked < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=STACK_LIMIT)
+            with self._lock:
+                if len(self._samples) < MAX_SAMPLES_PER_STALL:
+                    self._samples.append(stack)
+
+    def _report(self, lag: float):
+        """Залогировать зависание (вызывается в loop, когда он снова проснулся)."""
+        with self._lock:
+            samples, self._samples = self._samples, []
+        self.stats.stalls += 1
+
+        if not samples:
+            # Зависание закончилось раньше, чем поток успел снять стек
+            bot_metrics.observe_loop_stall('')
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms (no stack sampled)")
+            return
+
+        # Статистически: функция, в которой loop стоял в большинстве снимков
+        culprits = Counter(_culprit(stack) for stack in samples)
+        culprit, hits = culprits.most_common(1)[0]
+        stack = next(stack for stack in reversed(samples) if _culprit(stack) == culprit)
+        bot_metrics.observe_loop_stall(culprit)
+        logger.warning(
+            f"Event loop blocked for {lag * 1000:.0f} ms in {culprit or 'unknown'} "
+            f"({hits}/{len(samples)} samples):\n{_format_stack(stack)}"
+        )
+
+
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,358 @@
+"""
+Метрики Prometheus: обработчики, SQL, рендеринг графиков, Bot API, диалоги.
+
+Включаются переменной METRICS_PORT (по умолчанию выключены): метрики
+отдаются в текстовом формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics.
+Нужен пакет prometheus_client; без него бот работает как обычно, а в лог
+пишется предупреждение.
+
+Что измеряется:
+- deficit_handler_seconds{handler,trigger} - время обработчиков (команда,
+  pattern кнопки или фильтр сообщения), deficit_handler_exceptions_total
+- deficit_db_query_seconds{operation,table} - SQL-запросы (события engine)
+- deficit_chart_render_seconds, deficit_chart_queue_seconds - рендеринг в
+  процессе пула и ожидание свободного процесса, deficit_chart_png_bytes,
+  deficit_chart_requests_total{source} (cache, file_id, render, no_data, busy)
+- deficit_telegram_api_seconds{method}, deficit_telegram_api_responses_total{method,status}
+  (status="429" - flood control)
+- deficit_conversations{conversation,state} - незавершенные диалоги
+- deficit_event_loop_lag_seconds, deficit_event_loop_stalls_total{function} -
+  задержка event loop и зависания по функции проекта (monitoring.loop_lag)
+- deficit_render_pool_pending, стандартные метрики процесса (память, CPU, GC)
+
+Пока метрики выключены, все методы metrics ничего не делают.
+"""
+import functools
+import logging
+import os
+import re
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from telegram.ext import Application, BaseHandler, CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Порт HTTP-сервера метрик (0 - метрики выключены)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Адрес HTTP-сервера метрик (по умолчанию только локально)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Границы корзин гистограмм (сек / байты)
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+RENDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+PNG_BUCKETS = (16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_SQL_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+["`]?(\w+)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def _statement_labels(statement: str) -> Tuple[str, str]:
+    """
+    Операция и таблица SQL-запроса для меток (запросы SQLAlchemy повторяются - кэш).
+
+    Returns:
+        (operation, table), например ('select', 'measurements')
+    """
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].lower() if words else 'other'
+    match = _SQL_TABLE.search(statement)
+    return operation, match.group(1).lower() if match else ''
+
+
+def _trigger(handler: BaseHandler) -> str:
+    """Чем вызывается обработчик: /команда, pattern кнопки или фильтр сообщения."""
+    if isinstance(handler, CommandHandler):
+        return ','.join(f'/{command}' for command in sorted(handler.commands))
+    if isinstance(handler, CallbackQueryHandler):
+        pattern = handler.pattern
+        return getattr(pattern, 'pattern', None) or str(pattern)
+    if isinstance(handler, MessageHandler):
+        return str(handler.filters)
+    return type(handler).__name__
+
+
+class Metrics:
+    """
+    Набор метрик бота и HTTP-сервер для Prometheus.
+
+    Метрики создаются в start(): до этого (и если METRICS_PORT=0) методы
+    наблюдения сразу возвращаются.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.registry = None
+
+    def start(self, port: int = METRICS_PORT, host: str = METRICS_HOST) -> bool:
+        """
+        Создать метрики и запустить HTTP-сервер.
+
+        Args:
+            port: Порт (0 - не запускать)
+            host: Адрес
+
+        Returns:
+            True, если метрики включены
+        """
+        if self.enabled or not port:
+            return self.enabled
+
+        try:
+            import prometheus_client as prom
+        except ImportError:
+            logger.warning("METRICS_PORT задан, но prometheus_client не установлен - метрики выключены")
+            return False
+
+        registry = self.registry = prom.CollectorRegistry()
+        prom.ProcessCollector(registry=registry)
+        prom.GCCollector(registry=registry)
+
+        self.handler_seconds = prom.Histogram(
+            'deficit_handler_seconds', 'Время обработчика',
+            ['handler', 'trigger'], buckets=HANDLER_BUCKETS, registry=registry)
+        self.handler_exceptions = prom.Counter(
+            'deficit_handler_exceptions_total', 'Исключения, вышедшие из обработчика',
+            ['handler', 'trigger'], registry=registry)
+        self.db_query_seconds = prom.Histogram(
+            'deficit_db_query_seconds', 'Время SQL-запроса',
+            ['operation', 'table'], buckets=DB_BUCKETS, registry=registry)
+        self.chart_render_seconds = prom.Histogram(
+            'deficit_chart_render_seconds', 'Рендеринг графика в процессе пула',
+            ['period'], buckets=RENDER_BUCKETS, registry=registry)
+        self.chart_queue_seconds = prom.Histogram(
+            'deficit_chart_queue_seconds', 'Ожидание свободного процесса рендеринга',
+            buckets=RENDER_BUCKETS, registry=registry)
+        self.chart_png_bytes = prom.Histogram(
+            'deficit_chart_png_bytes', 'Размер PNG графика',
+            buckets=PNG_BUCKETS, registry=registry)
+        self.chart_requests = prom.Counter(
+            'deficit_chart_requests_total', 'Запросы графика по источнику',
+            ['source'], registry=registry)
+        self.api_seconds = prom.Histogram(
+            'deficit_telegram_api_seconds', 'Время запроса к Bot API',
+            ['method'], buckets=HANDLER_BUCKETS, registry=registry)
+        self.api_responses = prom.Counter(
+            'deficit_telegram_api_responses_total', 'Ответы Bot API по HTTP-статусу (error - сетевая ошибка)',
+            ['method', 'status'], registry=registry)
+        self.render_pool_pending = prom.Gauge(
+            'deficit_render_pool_pending', 'Рендеринги в работе и в очереди', registry=registry)
+        self.loop_lag_seconds = prom.Histogram(
+            'deficit_event_loop_lag_seconds', 'Опоздание пробуждения задачи в event loop',
+            buckets=LOOP_LAG_BUCKETS, registry=registry)
+        self.loop_stalls = prom.Counter(
+            'deficit_event_loop_stalls_total', 'Зависания event loop по функции проекта в стеке',
+            ['function'], registry=registry)
+
+        # Сервер в daemon-потоке, останавливается вместе с процессом
+        prom.start_http_server(port, addr=host, registry=registry)
+        self.enabled = True
+        logger.info(f"Prometheus metrics on http://{host}:{port}/metrics")
+        return True
+
+    # Обработчики
+
+    def instrument_handlers(self, application: Application):
+        """
+        Обернуть обработчики Application (включая шаги диалогов) замером времени.
+
+        Вызывается после регистрации всех обработчиков.
+
+        Args:
+            application: Telegram Application
+        """
+        if not self.enabled:
+            return
+
+        def walk(handlers):
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler):
+                    walk(handler.entry_points)
+                    for state_handlers in handler.states.values():
+                        walk(state_handlers)
+                    walk(handler.fallbacks)
+                else:
+                    handler.callback = self._timed_callback(handler.callback, _trigger(handler))
+
+        for handlers in application.handlers.values():
+            walk(handlers)
+
+    def _timed_callback(self, callback: Callable, trigger: str) -> Callable:
+        name = getattr(callback, '__name__', type(callback).__name__)
+        seconds = self.handler_seconds.labels(name, trigger)
+        exceptions = self.handler_exceptions.labels(name, trigger)
+
+        @functools.wraps(callback)
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                exceptions.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - started)
+
+        return timed
+
+    # SQL
+
+    def instrument_engine(self, engine):
+        """
+        Замер SQL-запросов через события SQLAlchemy engine.
+
+        Args:
+            engine: sqlalchemy.Engine
+        """
+        if not self.enabled:
+            return
+
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['query_started'].pop()
+            self.db_query_seconds.labels(*_statement_labels(statement)).observe(elapsed)
+
+        @event.listens_for(engine, 'handle_error')
+        def _error(exception_context):
+            # after_cursor_execute не вызывается при ошибке - снять отметку времени
+            started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+            if started:
+                started.pop()
+
+    # Графики
+
+    def observe_chart_request(self, source: str):
+        """
+        Засчитать запрос графика.
+
+        Args:
+            source: cache, file_id, render, no_data или busy
+        """
+        if self.enabled:
+            self.chart_requests.labels(source).inc()
+
+    def observe_render(self, period_days: int, render_seconds: float, queue_seconds: float, png_bytes: int):
+        """
+        Записать рендеринг графика.
+
+        Args:
+            period_days: Период графика
+            render_seconds: Время рендеринга в процессе пула
+            queue_seconds: Ожидание свободного процесса (и передача данных)
+            png_bytes: Размер PNG (0 - нет данных)
+        """
+        if not self.enabled:
+            return
+        self.chart_render_seconds.labels(str(period_days)).observe(render_seconds)
+        self.chart_queue_seconds.observe(max(0.0, queue_seconds))
+        if png_bytes:
+            self.chart_png_bytes.observe(png_bytes)
+
+    def watch_render_pool(self, pool):
+        """
+        Отдавать текущую очередь пула рендеринга.
+
+        Args:
+            pool: ChartRenderPool
+        """
+        if self.enabled:
+            self.render_pool_pending.set_function(lambda: pool.pending)
+
+    # Event loop
+
+    def observe_loop_lag(self, seconds: float):
+        """Записать задержку event loop."""
+        if self.enabled:
+            self.loop_lag_seconds.observe(seconds)
+
+    def observe_loop_stall(self, function: str):
+        """
+        Засчитать зависание event loop.
+
+        Args:
+            function: Функция проекта, в которой стоял loop ('' - не определена)
+        """
+        if self.enabled:
+            self.loop_stalls.labels(function or 'unknown').inc()
+
+    # Bot API
+
+    def observe_api(self, method: str, status: str, seconds: float):
+        """
+        Записать запрос к Bot API.
+
+        Args:
+            method: Метод Bot API (sendMessage, ...)
+            status: HTTP-статус ответа или 'error'
+            seconds: Время запроса
+        """
+        if not self.enabled:
+            return
+        self.api_seconds.labels(method).observe(seconds)
+        self.api_responses.labels(method, status).inc()
+
+    # Диалоги
+
+    def watch_conversations(
+        self,
+        source: Callable[[], Dict[str, Dict[object, int]]],
+        state_names: Optional[Dict[object, str]] = None
+    ):
+        """
+        Отдавать количество незавершенных диалогов по состояниям (считается при запросе метрик).
+
+        Args:
+            source: Функция name → {state: количество} (SQLitePersistence.conversation_counts)
+            state_names: Имена состояний для меток
+        """
+        if self.enabled:
+            self.registry.register(_ConversationCollector(source, state_names or {}))
+
+
+class _ConversationCollector:
+    """Collector deficit_conversations: значения считаются при каждом запросе метрик."""
+
+    def __init__(self, source: Callable[[], Dict[str, Dict[object, int]]], state_names: Dict[object, str]):
+        self.source = source
+        self.state_names = state_names
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        family = GaugeMetricFamily(
+            'deficit_conversations', 'Незавершенные диалоги по состояниям',
+            labels=['conversation', 'state']
+        )
+        for name, states in self.source().items():
+            for state, number in states.items():
+                family.add_metric([name, self.state_names.get(state, str(state))], number)
+        yield family
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """
+    HTTPXRequest с замером времени и статусов ответов Bot API (в metrics).
+    """
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            metrics.observe_api(api_method, 'error', time.perf_counter() - started)
+            raise
+        metrics.observe_api(api_method, str(code), time.perf_counter() - started)
+        return code, payload
+
+
+metrics = Metrics()
@@ -0,0 +1,385 @@
+"""
+Профилирование медленных обновлений в работающем боте.
+
+Когда у конкретного пользователя медленно строится /graph, метрики
+показывают только, что обработчик медленный, но не почему. Профилировщик
+включается без перезапуска (PROFILE_UPDATES=1 или /profile on у владельца)
+и оборачивает обработку каждого обновления (bot/concurrency.py):
+- поток-сэмплер каждые PROFILE_INTERVAL секунд снимает стек каждого
+  обновления в обработке: выполняющегося - стек потока event loop
+  (sys._current_frames), ожидающего - цепочку await его корутины
+  (ожидание БД или процесса рендеринга видно как '[await Future]')
+- обновления дольше PROFILE_THRESHOLD_MS, доля PROFILE_SAMPLE_RATE
+  остальных и все обновления выбранных пользователей сохраняются в
+  PROFILE_DIR, хранятся последние PROFILE_KEEP профилей
+
+Профиль - два файла с общим именем:
+- .folded - стеки в формате "a;b;c count" (flamegraph.pl, speedscope)
+- .json - обновление, обработчик, пользователь, размер его истории,
+  длительность и самые горячие функции
+
+cProfile здесь не подходит: он профилирует весь поток, а обновления разных
+пользователей выполняются в одном event loop вперемешку. Сэмплы относятся
+к обновлению по его корутине, поэтому параллельные обновления не смешиваются,
+а время считается по часам (включая ожидание), как его видит пользователь.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import CodeType, FrameType
+from typing import Any, Awaitable, Dict, List, Optional, Set, Tuple
+
+from telegram import Update
+
+from database.async_queries import get_user_stats
+
+logger = logging.getLogger(__name__)
+
+# Включить профилирование при запуске (1/0), во время работы - /profile on|off
+PROFILE_UPDATES = os.getenv('PROFILE_UPDATES', '0') == '1'
+# Сохранять профиль обновлений дольше порога (мс)
+PROFILE_THRESHOLD_MS = float(os.getenv('PROFILE_THRESHOLD_MS', '1000'))
+# Доля остальных обновлений, профиль которых сохраняется (0..1)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+# Период снятия стеков (сек)
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+# Каталог профилей и сколько последних профилей хранить
+PROFILE_DIR = os.getenv('PROFILE_DIR', './data/profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+
+# Сколько самых горячих функций записывать в .json
+TOP_FUNCTIONS = 20
+
+# Код проекта (src/): обработчики - в bot/
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLER_PREFIX = 'bot/'
+PROCESSOR_LABEL_PREFIX = 'bot/concurrency.py:'
+
+Stack = Tuple[str, ...]
+
+
+@dataclass(eq=False)
+class _Profile:
+    """Сэмплы одного обновления в обработке."""
+    update: object
+    coroutine: Any
+    started: float
+    reason: str
+    concurrent: int
+    samples: Counter = field(default_factory=Counter)
+
+
+@dataclass
+class ProfilerStats:
+    """Счетчики профилировщика с момента запуска."""
+    profiled: int = 0
+    saved: int = 0
+    last_path: str = ''
+
+
+def describe_update(update: object) -> str:
+    """
+    Краткое описание обновления: команда, данные кнопки или тип сообщения.
+
+    Args:
+        update: Обновление
+
+    Returns:
+        '/graph', 'callback:graph_month', 'text' и т.п.
+    """
+    if not isinstance(update, Update):
+        return type(update).__name__
+    if update.callback_query is not None:
+        return f"callback:{update.callback_query.data}"
+    message = update.effective_message
+    if message is not None and message.text:
+        return message.text.split()[0] if message.text.startswith('/') else 'text'
+    return 'update'
+
+
+def _summarize(samples: Counter) -> Tuple[str, List[dict]]:
+    """
+    Обработчик и самые горячие функции профиля.
+
+    Returns:
+        (обработчик - самая частая первая функция из bot/, список функций
+        с числом сэмплов на вершине стека (self) и в стеке (total))
+    """
+    total_samples = sum(samples.values())
+    handlers: Counter = Counter()
+    own: Counter = Counter()
+    inclusive: Counter = Counter()
+    for stack, count in samples.items():
+        handler = next(
+            (label for label in stack
+             if label.startswith(HANDLER_PREFIX) and not label.startswith(PROCESSOR_LABEL_PREFIX)),
+            ''
+        )
+        handlers[handler] += count
+        own[stack[-1]] += count
+        for label in set(stack):
+            inclusive[label] += count
+
+    top = [
+        {
+            'function': label,
+            'self': count,
+            'total': inclusive[label],
+            'self_percent': round(count * 100 / total_samples, 1),
+        }
+        for label, count in own.most_common(TOP_FUNCTIONS)
+    ]
+    return handlers.most_common(1)[0][0], top
+
+
+class UpdateProfiler:
+    """
+    Сэмплирующий профилировщик обработки обновлений.
+
+    Args:
+        threshold_ms: Порог медленного обновления (мс)
+        sample_rate: Доля остальных обновлений для сохранения
+        interval: Период снятия стеков (сек)
+        directory: Каталог профилей
+        keep: Сколько последних профилей хранить
+        enabled: Включить при запуске бота
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = PROFILE_THRESHOLD_MS,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        interval: float = PROFILE_INTERVAL,
+        directory: str = PROFILE_DIR,
+        keep: int = PROFILE_KEEP,
+        enabled: bool = PROFILE_UPDATES
+    ):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.directory = directory
+        self.keep = keep
+        self.enabled = enabled
+        self.users: Set[int] = set()
+        self.stats = ProfilerStats()
+
+        self._profiles: Dict[FrameType, _Profile] = {}
+        self._labels: Dict[CodeType, str] = {}
+        self._dumps: Set[asyncio.Task] = set()
+        self._random = random.Random()
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """Работает ли сэмплер."""
+        return self._thread is not None
+
+    def start(self):
+        """Запустить сэмплер, если профилирование включено (вызывается внутри event loop)."""
+        if not self.enabled or self._thread is not None:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sample, name='update-profiler', daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Update profiler started: threshold {self.threshold_ms:.0f} ms, "
+            f"sample rate {self.sample_rate:g}, dumps in {self.directory}"
+        )
+
+    async def stop(self):
+        """Остановить сэмплер и дождаться записи профилей."""
+        if self._thread is not None:
+            self._stopping.set()
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        with self._lock:
+            self._profiles.clear()
+        if self._dumps:
+            await asyncio.gather(*self._dumps, return_exceptions=True)
+
+    def wrap(self, update: object, coroutine: Awaitable[Any]) -> Awaitable[Any]:
+        """
+        Обернуть обработку обновления профилированием (если сэмплер работает).
+
+        Args:
+            update: Обновление
+            coroutine: Корутина обработки (от Application)
+
+        Returns:
+            Корутина, которую нужно дождаться вместо исходной
+        """
+        if self._thread is None or getattr(coroutine, 'cr_frame', None) is None:
+            return coroutine
+        return self._run(update, coroutine)
+
+    async def _run(self, update: object, coroutine: Any) -> Any:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is not None and user.id in self.users:
+            reason = 'user'
+        elif self.sample_rate > 0 and self._random.random() < self.sample_rate:
+            reason = 'sampled'
+        else:
+            reason = ''
+
+        # Ключ - кадр корутины: по нему сэмплер узнает обновление в стеке потока
+        frame = coroutine.cr_frame
+        with self._lock:
+            profile = _Profile(update, coroutine, time.monotonic(), reason, len(self._profiles))
+            self._profiles[frame] = profile
+        try:
+            return await coroutine
+        finally:
+            elapsed_ms = (time.monotonic() - profile.started) * 1000
+            with self._lock:
+                self._profiles.pop(frame, None)
+            self.stats.profiled += 1
+
+            if elapsed_ms >= self.threshold_ms:
+                profile.reason = 'slow'
+            if profile.reason and profile.samples:
+                # Запись профиля не задерживает ответ пользователю
+                task = asyncio.create_task(self._dump(profile, elapsed_ms))
+                self._dumps.add(task)
+                task.add_done_callback(self._dumps.discard)
+
+    def _label(self, code: CodeType) -> str:
+        """'bot/handlers.py:graph' - путь относительно src/ или каталога из sys.path."""
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            roots = [SRC_DIR] + sorted((path for path in sys.path if path), key=len, reverse=True)
+            root = next((root for root in roots if filename.startswith(root + os.sep)), None)
+            if root is not None:
+                filename = os.path.relpath(filename, root)
+            label = self._labels[code] = f"{filename}:{code.co_qualname}"
+        return label
+
+    def _await_stack(self, coroutine: Any) -> Stack:
+        """Стек приостановленной корутины по цепочке await (как Task.get_stack)."""
+        labels = []
+        awaitable = coroutine
+        frame = None
+        while awaitable is not None:
+            awaiting = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+            if awaiting is None:
+                # Future, Task и т.п.: корутина ждет результата не в event loop
+                # (поток БД, процесс рендеринга, сеть) - строка await в ее кадре
+                name = 'Future' if type(awaitable).__name__ == 'FutureIter' else type(awaitable).__name__
+                if frame is not None:
+                    labels[-1] = f"{labels[-1]}:{frame.f_lineno}"
+                labels.append(f"[await {name}]")
+                break
+            frame = awaiting
+            labels.append(self._label(frame.f_code))
+            awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+        return tuple(labels)
+
+    def _running_stack(self) -> Tuple[Optional[_Profile], Stack]:
+        """Обновление, которое сейчас выполняется в event loop, и его стек."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            profile = self._profiles.get(frame)
+            if profile is not None:
+                return profile, tuple(self._label(code) for code in reversed(codes))
+            frame = frame.f_back
+        return None, ()
+
+    def _sample(self):
+        """Поток-сэмплер: стек каждого обновления в обработке раз в interval секунд."""
+        while not self._stopping.wait(self.interval):
+            with self._lock:
+                if not self._profiles:
+                    continue
+                running, stack = self._running_stack()
+                if running is not None:
+                    running.samples[stack] += 1
+                for profile in self._profiles.values():
+                    if profile is not running:
+                        profile.samples[self._await_stack(profile.coroutine)] += 1
+
+    async def _dump(self, profile: _Profile, elapsed_ms: float):
+        """Сохранить профиль обновления с описанием."""
+        update = profile.update
+        user = update.effective_user if isinstance(update, Update) else None
+        try:
+            history_size = None
+            if user is not None:
+                stats = await get_user_stats(user.id)
+                history_size = stats.weight_count if stats else 0
+
+            handler, top = _summarize(profile.samples)
+            meta = {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'reason': profile.reason,
+                'update_id': getattr(update, 'update_id', None),
+                'update': describe_update(update),
+                'handler': handler,
+                'user_id': user.id if user else None,
+                'history_size': history_size,
+                'elapsed_ms': round(elapsed_ms, 1),
+                'threshold_ms': self.threshold_ms,
+                'concurrent_updates': profile.concurrent,
+                'interval_ms': self.interval * 1000,
+                'samples': sum(profile.samples.values()),
+                'top': top,
+            }
+            path = await asyncio.to_thread(self._write, meta, profile.samples)
+        except Exception:
+            logger.exception("Failed to save update profile")
+            return
+
+        self.stats.saved += 1
+        self.stats.last_path = path
+        hottest = f"{top[0]['function']} ({top[0]['self_percent']:.0f}%)" if top else 'unknown'
+        log = logger.warning if profile.reason == 'slow' else logger.info
+        log(
+            f"Profiled {meta['update']} from user {meta['user_id']} ({profile.reason}): "
+            f"{elapsed_ms:.0f} ms in {handler or 'unknown'}, "
+            f"history {history_size}, hottest {hottest} → {path}.folded"
+        )
+
+    def _write(self, meta: dict, samples: Counter) -> str:
+        """
+        Записать .folded и .json профиля и удалить старые профили.
+
+        Returns:
+            Путь профиля без расширения
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r'[^\w-]+', '_', meta['update']).strip('_') or 'update'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{meta['update_id']}-{meta['user_id']}-{slug}"
+        path = os.path.join(self.directory, name)
+
+        with open(f"{path}.folded", 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        with open(f"{path}.json", 'w') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        # Имена начинаются со времени: старые профили - первые по алфавиту
+        names = sorted(entry[:-len('.json')] for entry in os.listdir(self.directory) if entry.endswith('.json'))
+        for old in names[:max(0, len(names) - self.keep)]:
+            for extension in ('.json', '.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, old + extension))
+                except FileNotFoundError:
+                    pass
+        return path
+
+
+update_profiler = UpdateProfiler()
@@ -0,0 +1,269 @@
+"""
+Сглаженная статистика веса: EMA, тренд и оценка TDEE.
+
+Сырые ежедневные взвешивания шумят на ±0.5-1 кг (вода, соль, время
+взвешивания), поэтому прогресс оценивается по сглаженным величинам:
+- EMA веса (экспоненциальное скользящее среднее, по умолчанию 7 дней)
+- тренд: наклон линейной регрессии веса за последние 28 дней (кг/нед)
+- TDEE: средние калории за то же окно минус энергия изменения веса
+  (KCAL_PER_KG на килограмм)
+
+Все вычисления векторные: данные раскладываются в сетку пользователи × дни
+(NaN для пропусков), и одна пачка пользователей считается одними и теми же
+операциями NumPy. Длина истории на стоимость не влияет: используется только
+хвост в ANALYTICS_LOOKBACK_DAYS дней (EMA за это время полностью забывает
+более ранние значения).
+
+Модуль импортирует numpy - обработчики бота импортируют его лениво.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from visualization.series import Columns, rows_to_columns
+
+# Период EMA веса (дней)
+EMA_SPAN_DAYS = 7
+# Окно регрессии тренда и оценки TDEE (дней)
+TREND_WINDOW_DAYS = 28
+# Сколько последних дней истории нужно для расчета (вклад более ранних в EMA < 1e-10)
+ANALYTICS_LOOKBACK_DAYS = 90
+# Минимум взвешиваний в окне для тренда
+MIN_TREND_POINTS = 7
+# Минимум дней с калориями в окне для TDEE
+MIN_CALORIE_DAYS = 7
+# Энергетический эквивалент 1 кг массы тела (ккал)
+KCAL_PER_KG = 7700
+# Сколько пользователей обрабатывается одной сеткой (ограничивает память)
+BATCH_CHUNK_USERS = 2048
+
+
+@dataclass
+class TrendSummary:
+    """
+    Сглаженная статистика пользователя на дату.
+
+    Поля:
+    - weight_ema: EMA веса на последний день (None - нет взвешиваний)
+    - trend_kg_per_week: Наклон тренда веса, кг/нед (None - мало данных)
+    - tdee: Оценка суточного расхода энергии, ккал (None - мало данных)
+    - avg_calories: Средние калории за окно тренда (None - нет данных)
+    - weight_points: Взвешиваний в окне тренда
+    - calorie_days: Дней с калориями в окне тренда
+    """
+    weight_ema: Optional[float] = None
+    trend_kg_per_week: Optional[float] = None
+    tdee: Optional[float] = None
+    avg_calories: Optional[float] = None
+    weight_points: int = 0
+    calorie_days: int = 0
+
+
+def ema(grid: np.ndarray, span: int = EMA_SPAN_DAYS) -> np.ndarray:
+    """
+    EMA по дням для каждой строки сетки.
+
+    День без значения не меняет EMA; EMA начинается с первого значения строки.
+
+    Args:
+        grid: Сетка пользователи × дни (NaN для пропусков)
+        span: Период EMA в днях (alpha = 2 / (span + 1))
+
+    Returns:
+        Сетка того же размера (NaN до первого значения строки)
+    """
+    alpha = 2.0 / (span + 1)
+    result = np.empty_like(grid)
+    current = np.full(grid.shape[0], np.nan)
+
+    # Рекуррентность по дням, векторно по всем пользователям сразу
+    with np.errstate(invalid='ignore'):
+        for day in range(grid.shape[1]):
+            values = grid[:, day]
+            current = np.where(np.isnan(current), values, current)
+            current = np.where(np.isnan(values), current, current + alpha * (values - current))
+            result[:, day] = current
+    return result
+
+
+def regression_slope(grid: np.ndarray, min_points: int = MIN_TREND_POINTS) -> np.ndarray:
+    """
+    Наклон линейной регрессии значения по номеру дня для каждой строки.
+
+    Args:
+        grid: Сетка пользователи × дни (NaN для пропусков)
+        min_points: Минимум значений в строке
+
+    Returns:
+        Наклон в единицах за день (NaN, если значений меньше min_points)
+    """
+    present = ~np.isnan(grid)
+    x = np.arange(grid.shape[1], dtype=float)
+    y = np.where(present, grid, 0.0)
+
+    n = present.sum(axis=1)
+    sum_x = present @ x
+    sum_xx = present @ (x * x)
+    sum_y = y.sum(axis=1)
+    sum_xy = y @ x
+
+    denominator = n * sum_xx - sum_x * sum_x
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / denominator
+    slope[(n < min_points) | (denominator <= 0)] = np.nan
+    return slope
+
+
+def analyze_grid(weights: np.ndarray, calories: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Посчитать статистику по сеткам веса и калорий (последний столбец - дата расчета).
+
+    Args:
+        weights: Сетка веса пользователи × дни
+        calories: Сетка калорий той же формы
+
+    Returns:
+        dict с массивами по пользователям: weight_ema, trend_kg_per_week,
+        tdee, avg_calories (NaN - нет данных), weight_points, calorie_days
+    """
+    window = slice(max(0, weights.shape[1] - TREND_WINDOW_DAYS), None)
+    window_weights = weights[:, window]
+    window_calories = calories[:, window]
+
+    slope_per_day = regression_slope(window_weights)
+    calorie_days = (~np.isnan(window_calories)).sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        avg_calories = np.nansum(window_calories, axis=1) / calorie_days
+    avg_calories[calorie_days == 0] = np.nan
+
+    # Дефицит калорий уходит на снижение веса: расход = потребление - изменение запасов
+    tdee = avg_calories - slope_per_day * KCAL_PER_KG
+    tdee[calorie_days < MIN_CALORIE_DAYS] = np.nan
+
+    return {
+        'weight_ema': ema(weights)[:, -1] if weights.shape[1] else np.full(weights.shape[0], np.nan),
+        'trend_kg_per_week': slope_per_day * 7,
+        'tdee': tdee,
+        'avg_calories': avg_calories,
+        'weight_points': (~np.isnan(window_weights)).sum(axis=1),
+        'calorie_days': calorie_days,
+    }
+
+
+def _summaries(result: Dict[str, np.ndarray]) -> list:
+    """Преобразовать массивы analyze_grid в список TrendSummary."""
+
+    def optional(value) -> Optional[float]:
+        return None if np.isnan(value) else float(value)
+
+    return [
+        TrendSummary(
+            weight_ema=optional(result['weight_ema'][i]),
+            trend_kg_per_week=optional(result['trend_kg_per_week'][i]),
+            tdee=optional(result['tdee'][i]),
+            avg_calories=optional(result['avg_calories'][i]),
+            weight_points=int(result['weight_points'][i]),
+            calorie_days=int(result['calorie_days'][i]),
+        )
+        for i in range(len(result['tdee']))
+    ]
+
+
+def _day_index(dates: np.ndarray, as_of: date, days: int) -> np.ndarray:
+    """Номер дня в сетке из days дней, заканчивающейся as_of (вне сетки - -1)."""
+    start = np.datetime64(as_of - timedelta(days=days - 1), 'D')
+    index = (dates - start).astype(int)
+    index[(index < 0) | (index >= days)] = -1
+    return index
+
+
+def analyze_columns(
+    columns: Columns,
+    as_of: date,
+    days: int = ANALYTICS_LOOKBACK_DAYS
+) -> TrendSummary:
+    """
+    Статистика одного пользователя.
+
+    Args:
+        columns: Колонки данных (см. visualization.series.rows_to_columns)
+        as_of: Дата расчета (последний день сетки)
+        days: Сколько последних дней истории использовать
+
+    Returns:
+        TrendSummary
+    """
+    if len(columns['dates']) == 0:
+        return TrendSummary()
+    return analyze_batch(np.zeros(len(columns['dates']), dtype=np.int64), columns, as_of, days)[0]
+
+
+def analyze_batch(
+    user_ids: Sequence[int],
+    columns: Columns,
+    as_of: date,
+    days: int = ANALYTICS_LOOKBACK_DAYS,
+    chunk_users: int = BATCH_CHUNK_USERS
+) -> Dict[int, TrendSummary]:
+    """
+    Статистика многих пользователей за один проход.
+
+    Колонки содержат строки всех пользователей подряд (например, результат
+    одного запроса для еженедельного отчета); user_ids - пользователь каждой
+    строки. Сетки строятся пачками по chunk_users пользователей одним
+    присваиванием по индексам, без цикла по пользователям.
+
+    Args:
+        user_ids: ID пользователя для каждой строки колонок
+        columns: Колонки данных (см. visualization.series.rows_to_columns)
+        as_of: Дата расчета (последний день сетки)
+        days: Сколько последних дней истории использовать
+        chunk_users: Пользователей в одной сетке
+
+    Returns:
+        user_id → TrendSummary (для всех пользователей из user_ids)
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    day_index = _day_index(columns['dates'], as_of, days)
+    in_window = day_index >= 0
+
+    summaries = {}
+    for chunk_start in range(0, len(users), chunk_users):
+        chunk_end = min(chunk_start + chunk_users, len(users))
+        rows = in_window & (user_index >= chunk_start) & (user_index < chunk_end)
+        grid_rows = user_index[rows] - chunk_start
+        grid_days = day_index[rows]
+
+        weights = np.full((chunk_end - chunk_start, days), np.nan)
+        calories = np.full_like(weights, np.nan)
+        weights[grid_rows, grid_days] = columns['weight'][rows]
+        calories[grid_rows, grid_days] = columns['calories'][rows]
+
+        result = analyze_grid(weights, calories)
+        summaries.update(zip(users[chunk_start:chunk_end].tolist(), _summaries(result)))
+    return summaries
+
+
+def analyze_rows(
+    rows: Iterable[tuple],
+    as_of: date,
+    days: int = ANALYTICS_LOOKBACK_DAYS
+) -> Dict[int, TrendSummary]:
+    """
+    Статистика многих пользователей по строкам одного запроса.
+
+    Args:
+        rows: Строки (user_id, date, weight, waist, neck, calories)
+            (см. queries.get_measurement_rows_for_users)
+        as_of: Дата расчета
+        days: Сколько последних дней истории использовать
+
+    Returns:
+        user_id → TrendSummary
+    """
+    rows = list(rows)
+    user_ids = [row[0] for row in rows]
+    return analyze_batch(user_ids, rows_to_columns(row[1:] for row in rows), as_of, days)
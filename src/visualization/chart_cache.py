@@ -0,0 +1,216 @@
+"""
+Кэш отрендеренных графиков.
+
+Ключ - (user_id, period_days, дата рендеринга, версия данных). Версия данных
+увеличивается при каждом изменении замеров (см. queries.bump_data_version),
+поэтому устаревшие графики никогда не отдаются и просто вытесняются по LRU.
+
+Два уровня:
+- память: LRU с ограничением по суммарному размеру PNG и числу записей
+  (записи только с file_id весят 0 байт, но копятся с новыми датами и версиями)
+- диск (опционально, CHART_CACHE_DIR): переживает рестарты бота; файлы
+  лежат в подкаталоге пользователя, поэтому поиск старых версий при записи
+  не зависит от общего числа файлов в кэше
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Максимальный суммарный размер PNG в памяти (байт)
+CHART_CACHE_MAX_BYTES = int(os.getenv('CHART_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Максимальное число записей в памяти (в том числе без PNG)
+CHART_CACHE_MAX_ENTRIES = int(os.getenv('CHART_CACHE_MAX_ENTRIES', '10000'))
+# Директория для дискового кэша (пусто - отключен)
+CHART_CACHE_DIR = os.getenv('CHART_CACHE_DIR', '')
+
+# (user_id, period_days, render_date, data_version)
+ChartKey = Tuple[int, int, date, int]
+
+
+@dataclass
+class CachedChart:
+    """
+    Отрендеренный график.
+
+    Поля:
+    - png: PNG-изображение (None, если график известен только по file_id)
+    - metrics: Метрики прогресса (см. render_progress_chart)
+    - series_hash: Хэш данных графика (см. series.series_hash)
+    - file_id: Telegram file_id после первой отправки (если известен)
+    """
+    png: Optional[bytes]
+    metrics: dict
+    series_hash: Optional[str] = None
+    file_id: Optional[str] = None
+
+    @property
+    def nbytes(self) -> int:
+        """Размер PNG в байтах (0 если PNG нет)."""
+        return len(self.png) if self.png else 0
+
+
+class ChartCache:
+    """
+    Двухуровневый кэш графиков: LRU в памяти и опциональный диск.
+
+    Args:
+        max_bytes: Лимит суммарного размера PNG в памяти
+        max_entries: Лимит числа записей в памяти
+        disk_dir: Директория дискового кэша (None - без диска)
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = CHART_CACHE_MAX_BYTES,
+        max_entries: int = CHART_CACHE_MAX_ENTRIES,
+        disk_dir: Optional[str] = None
+    ):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[ChartKey, CachedChart]" = OrderedDict()
+        self._size = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._remove_flat_files()
+
+    @property
+    def size(self) -> int:
+        """Суммарный размер PNG в памяти (байт)."""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: ChartKey) -> Optional[CachedChart]:
+        """
+        Получить график из кэша (сначала память, потом диск).
+
+        Args:
+            key: (user_id, period_days, render_date, data_version)
+
+        Returns:
+            CachedChart или None
+        """
+        chart = self._entries.get(key)
+        if chart is not None:
+            self._entries.move_to_end(key)
+            return chart
+
+        if not self.disk_dir:
+            return None
+
+        chart = await asyncio.to_thread(self._read_disk, key)
+        if chart is not None:
+            self._store(key, chart)
+        return chart
+
+    async def put(self, key: ChartKey, chart: CachedChart) -> CachedChart:
+        """
+        Сохранить график в кэш.
+
+        Args:
+            key: (user_id, period_days, render_date, data_version)
+            chart: График
+
+        Returns:
+            Сохраненный CachedChart
+        """
+        self._store(key, chart)
+
+        if self.disk_dir and chart.png:
+            try:
+                await asyncio.to_thread(self._write_disk, key, chart)
+            except OSError as e:
+                logger.warning(f"Failed to write chart cache file: {e}")
+
+        return chart
+
+    def discard_user(self, user_id: int):
+        """
+        Удалить из памяти все графики пользователя.
+
+        Args:
+            user_id: Telegram user ID
+        """
+        for key in [k for k in self._entries if k[0] == user_id]:
+            self._size -= self._entries.pop(key).nbytes
+
+    def _store(self, key: ChartKey, chart: CachedChart):
+        """Положить в память и вытеснить старые записи сверх лимита."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old.nbytes
+
+        if chart.nbytes > self.max_bytes:
+            return
+
+        self._entries[key] = chart
+        self._size += chart.nbytes
+
+        while self._size > self.max_bytes or len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.nbytes
+
+    def _disk_path(self, key: ChartKey) -> str:
+        """Базовый путь файла (без расширения) для ключа: <disk_dir>/<user_id>/<period>_<date>_<version>."""
+        user_id, period_days, render_date, version = key
+        return os.path.join(
+            self.disk_dir,
+            str(user_id),
+            f"{period_days}_{render_date:%Y%m%d}_{version}"
+        )
+
+    def _remove_flat_files(self):
+        """Удалить файлы старого формата (все пользователи в одном каталоге)."""
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(('.png', '.json')):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def _read_disk(self, key: ChartKey) -> Optional[CachedChart]:
+        """Прочитать график с диска."""
+        path = self._disk_path(key)
+        try:
+            with open(path + '.png', 'rb') as f:
+                png = f.read()
+            with open(path + '.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            return CachedChart(png=png, metrics=meta['metrics'], series_hash=meta.get('series_hash'))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key: ChartKey, chart: CachedChart):
+        """Записать график на диск и удалить старые версии для того же периода."""
+        path = self._disk_path(key)
+        user_dir = os.path.dirname(path)
+        prefix = f"{key[1]}_"
+        current = os.path.basename(path)
+
+        # В каталоге пользователя - несколько файлов на период, а не весь кэш
+        os.makedirs(user_dir, exist_ok=True)
+        for name in os.listdir(user_dir):
+            if name.startswith(prefix) and os.path.splitext(name)[0] != current:
+                try:
+                    os.remove(os.path.join(user_dir, name))
+                except OSError:
+                    pass
+
+        # JSON пишем последним: без него запись на диске не считается валидной
+        with open(path + '.png', 'wb') as f:
+            f.write(chart.png)
+        with open(path + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'metrics': chart.metrics, 'series_hash': chart.series_hash}, f)
+
+
+chart_cache = ChartCache(disk_dir=CHART_CACHE_DIR or None)
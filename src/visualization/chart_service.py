@@ -0,0 +1,217 @@
+"""
+Получение графика прогресса: кэш → запрос данных → file_id → рендеринг.
+
+Здесь же - сглаженная статистика (visualization.analytics) для подписи
+к графику, с кэшем по версии данных пользователя.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from functools import partial
+from datetime import date
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from database.async_queries import (
+    get_data_version,
+    get_measurement_rows_by_period,
+    get_chart_file,
+    save_chart_file,
+    delete_chart_file
+)
+from monitoring.metrics import metrics as bot_metrics
+from visualization.chart_cache import CachedChart, ChartKey, chart_cache
+from visualization.render_pool import RenderPoolBusy, render_pool
+
+if TYPE_CHECKING:
+    from visualization.analytics import TrendSummary
+    from visualization.series import Columns
+
+logger = logging.getLogger(__name__)
+
+# Период графика по умолчанию (дней), пока пользователь не выбрал другой
+DEFAULT_PERIOD_DAYS = 30
+
+# Рендеринги в процессе: повторный запрос того же графика ждет их, а не рендерит заново
+_renders: Dict[ChartKey, asyncio.Task] = {}
+
+# Сколько статистик хранить в памяти (LRU)
+TREND_CACHE_SIZE = 1024
+
+# (user_id, дата расчета, data_version) → TrendSummary
+_trends: "OrderedDict[Tuple[int, date, int], TrendSummary]" = OrderedDict()
+
+
+async def get_progress_chart(
+    user_id: int,
+    period_days: int,
+    allow_file_id: bool = True
+) -> Optional[CachedChart]:
+    """
+    Получить график прогресса пользователя за период.
+
+    1. Кэш по версии данных пользователя.
+    2. Сохраненный Telegram file_id, если хэш данных совпадает -
+       тогда график не рендерится вовсе (png=None, отправка по file_id).
+    3. Рендеринг в пуле процессов (один на ключ: одновременные запросы
+       того же графика, например прогрев и нажатие "График", ждут его).
+
+    Args:
+        user_id: Telegram user ID
+        period_days: Период в днях
+        allow_file_id: Разрешить шаг 2 (False - всегда получить PNG)
+
+    Returns:
+        CachedChart или None если нет данных за период
+
+    Raises:
+        RenderPoolBusy: Если очередь рендеринга переполнена
+    """
+    version = await get_data_version(user_id)
+    key = (user_id, period_days, date.today(), version)
+
+    chart = await chart_cache.get(key)
+    if chart is not None and (allow_file_id or chart.png):
+        bot_metrics.observe_chart_request('cache')
+        return chart
+
+    rows = await get_measurement_rows_by_period(user_id, period_days)
+    if not rows:
+        bot_metrics.observe_chart_request('no_data')
+        return None
+
+    # numpy загружается при первом построении графика, а не при старте бота
+    from visualization.series import rows_to_columns, compute_progress_metrics, series_hash
+
+    columns = rows_to_columns(rows)
+    chart_hash = series_hash(columns, period_days)
+
+    if allow_file_id:
+        stored = await get_chart_file(user_id, period_days)
+        if stored is not None and stored.series_hash == chart_hash:
+            chart = CachedChart(
+                png=None,
+                metrics=compute_progress_metrics(columns),
+                series_hash=chart_hash,
+                file_id=stored.file_id
+            )
+            bot_metrics.observe_chart_request('file_id')
+            return await chart_cache.put(key, chart)
+
+    render = _renders.get(key)
+    if render is None:
+        render = asyncio.ensure_future(_render(key, columns, period_days, chart_hash))
+        _renders[key] = render
+        render.add_done_callback(partial(_render_done, key))
+
+    # shield: отмена одного ожидающего (например, прогрева) не отменяет рендеринг для остальных
+    try:
+        chart = await asyncio.shield(render)
+    except RenderPoolBusy:
+        bot_metrics.observe_chart_request('busy')
+        raise
+    bot_metrics.observe_chart_request('render')
+    return chart
+
+
+def _render_done(key: ChartKey, render: asyncio.Future):
+    """
+    Убрать завершенный рендеринг и забрать его исключение.
+
+    Если все ожидавшие отменены (например, по таймауту обработчика), исключение
+    иначе никто не заберет и asyncio напишет "Task exception never retrieved".
+    """
+    if _renders.get(key) is render:
+        del _renders[key]
+    if render.cancelled():
+        return
+    error = render.exception()
+    if error is not None and not isinstance(error, RenderPoolBusy):
+        logger.error(f"Chart render failed for user {key[0]}, {key[1]} days: {error!r}")
+
+
+async def _render(
+    key: ChartKey,
+    columns: "Columns",
+    period_days: int,
+    chart_hash: str
+) -> Optional[CachedChart]:
+    """
+    Отрендерить график в пуле процессов и положить в кэш.
+    """
+    png, metrics = await render_pool.render(columns, period_days)
+    if png is None:
+        return None
+
+    chart = CachedChart(png=png, metrics=metrics, series_hash=chart_hash)
+    return await chart_cache.put(key, chart)
+
+
+async def get_trend_summary(user_id: int) -> "TrendSummary":
+    """
+    Получить сглаженную статистику пользователя (EMA, тренд, TDEE) на сегодня.
+
+    Пересчитывается только после изменения данных (ключ кэша включает
+    data_version) и по последним ANALYTICS_LOOKBACK_DAYS дням истории.
+
+    Args:
+        user_id: Telegram user ID
+
+    Returns:
+        TrendSummary
+    """
+    version = await get_data_version(user_id)
+    today = date.today()
+    key = (user_id, today, version)
+
+    summary = _trends.get(key)
+    if summary is not None:
+        _trends.move_to_end(key)
+        return summary
+
+    # numpy загружается при первом расчете, а не при старте бота
+    from visualization.analytics import ANALYTICS_LOOKBACK_DAYS, analyze_columns
+    from visualization.series import rows_to_columns
+
+    rows = await get_measurement_rows_by_period(user_id, ANALYTICS_LOOKBACK_DAYS - 1)
+    summary = analyze_columns(rows_to_columns(rows), today)
+
+    _trends[key] = summary
+    while len(_trends) > TREND_CACHE_SIZE:
+        _trends.popitem(last=False)
+    return summary
+
+
+async def remember_file_id(user_id: int, period_days: int, chart: CachedChart, sent_message) -> None:
+    """
+    Запомнить file_id отправленного графика, чтобы повторно не загружать PNG.
+
+    file_id сохраняется в памяти (в записи кэша) и в БД вместе с хэшем данных.
+
+    Args:
+        user_id: Telegram user ID
+        period_days: Период графика в днях
+        chart: Отправленный график
+        sent_message: Message, возвращенный reply_photo
+    """
+    if sent_message is None or not sent_message.photo:
+        return
+
+    file_id = sent_message.photo[-1].file_id
+    if file_id == chart.file_id:
+        return
+
+    chart.file_id = file_id
+    if chart.series_hash:
+        await save_chart_file(user_id, period_days, chart.series_hash, file_id)
+
+
+async def forget_file_id(user_id: int, period_days: int) -> None:
+    """
+    Забыть file_id графика (Telegram отклонил его), чтобы отправить PNG заново.
+
+    Args:
+        user_id: Telegram user ID
+        period_days: Период графика в днях
+    """
+    chart_cache.discard_user(user_id)
+    await delete_chart_file(user_id, period_days)
@@ -0,0 +1,122 @@
+"""
+Прогрев графика после ввода данных.
+
+После сохранения записи пользователь почти всегда сразу нажимает
+"📈 График". Поэтому график за его период по умолчанию рендерится
+заранее, в фоне, и к нажатию уже лежит в кэше (chart_cache) под новой
+версией данных.
+
+Прогрев - низкоприоритетная работа:
+- стартует с небольшой задержкой, после ответа пользователю
+- пропускается, если все процессы рендеринга заняты запросами пользователей
+- отменяется новой записью того же пользователя (график устарел бы)
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict
+
+from visualization.chart_service import get_progress_chart, get_trend_summary
+from visualization.render_pool import RenderPoolBusy, render_pool
+
+logger = logging.getLogger(__name__)
+
+# Включить прогрев графика после записи (1/0)
+CHART_WARMUP = os.getenv('CHART_WARMUP', '1') == '1'
+# Задержка перед прогревом (сек)
+CHART_WARMUP_DELAY = float(os.getenv('CHART_WARMUP_DELAY', '0.3'))
+
+
+@dataclass
+class WarmupStats:
+    """Счетчики прогрева с момента запуска."""
+    scheduled: int = 0
+    warmed: int = 0
+    superseded: int = 0
+    skipped: int = 0
+
+
+class ChartWarmup:
+    """
+    Фоновый прогрев графиков: не больше одной задачи на пользователя.
+
+    Args:
+        delay: Задержка перед прогревом (сек)
+        enabled: Включен ли прогрев
+    """
+
+    def __init__(self, delay: float = CHART_WARMUP_DELAY, enabled: bool = CHART_WARMUP):
+        self.delay = delay
+        self.enabled = enabled
+        self.stats = WarmupStats()
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    @property
+    def pending(self) -> int:
+        """Количество запланированных и выполняющихся прогревов."""
+        return len(self._tasks)
+
+    def schedule(self, user_id: int, period_days: int):
+        """
+        Запланировать прогрев графика пользователя (вызывается после записи).
+
+        Предыдущий прогрев того же пользователя отменяется.
+
+        Args:
+            user_id: Telegram user ID
+            period_days: Период графика в днях
+        """
+        if not self.enabled:
+            return
+
+        previous = self._tasks.pop(user_id, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.stats.superseded += 1
+
+        task = asyncio.create_task(self._warm(user_id, period_days), name=f'chart-warmup-{user_id}')
+        self._tasks[user_id] = task
+        task.add_done_callback(partial(self._forget, user_id))
+        self.stats.scheduled += 1
+
+    async def stop(self):
+        """Отменить все запланированные прогревы."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _forget(self, user_id: int, task: asyncio.Task):
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+
+    async def _warm(self, user_id: int, period_days: int):
+        """Отрендерить график в кэш, если есть свободный процесс рендеринга."""
+        await asyncio.sleep(self.delay)
+
+        # Не занимать воркеры, которые нужны запросам пользователей
+        if render_pool.pending >= render_pool.workers:
+            self.stats.skipped += 1
+            logger.debug(f"Chart warmup skipped for user {user_id}: render pool busy")
+            return
+
+        try:
+            chart = await get_progress_chart(user_id, period_days)
+            # Статистика для подписи к графику - тоже заранее
+            await get_trend_summary(user_id)
+        except RenderPoolBusy:
+            self.stats.skipped += 1
+            return
+        except Exception:
+            logger.exception(f"Chart warmup failed for user {user_id}")
+            return
+
+        if chart is not None:
+            self.stats.warmed += 1
+            logger.debug(f"Chart warmed for user {user_id}, period {period_days}")
+
+
+chart_warmup = ChartWarmup()
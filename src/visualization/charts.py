@@ -1,15 +1,216 @@
 """
 Генерация графиков с помощью matplotlib.
+
+Используется объектный API (Figure + FigureCanvasAgg) без pyplot: у каждого
+потока свой заранее построенный шаблон фигуры (оси, оформление, легенда)
+для каждого размера графика, и при рендеринге в нем меняются только данные
+линий, границы осей и заголовок. Глобального состояния pyplot нет, поэтому
+рендеринг из разных потоков безопасен.
 """
 import io
-from datetime import date, timedelta
+import threading
 from typing import List, Tuple, Optional
 import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
+from matplotlib.ticker import AutoLocator
 
 from database.models import Measurement
+from visualization.formatting import format_metrics_message  # noqa: F401 (совместимость)
+from visualization.series import (
+    Columns,
+    rows_to_columns,
+    measurements_to_columns,
+    compute_progress_metrics,
+    weight_axis_limits
+)
+
+# Размер графика по умолчанию (дюймы) и разрешение PNG
+CHART_SIZE = (12, 7)
+CHART_DPI = 100
+
+# Цвета показателей
+COLOR_WEIGHT = '#2E86AB'
+COLOR_SECONDARY = '#666666'  # Серый цвет для правой оси
+COLOR_WAIST = '#A23B72'
+COLOR_NECK = '#F18F01'
+COLOR_CALORIES = '#06A77D'
+
+# Шаблоны фигур: отдельные для каждого потока, по одному на размер
+_thread_local = threading.local()
+
+
+class ChartTemplate:
+    """
+    Заранее построенная фигура графика прогресса.
+
+    Оси, подписи, сетка, линии и легенда создаются один раз,
+    render() только подставляет данные.
+
+    Args:
+        figsize: Размер фигуры в дюймах
+    """
+
+    def __init__(self, figsize: Tuple[float, float] = CHART_SIZE):
+        self.figure = Figure(figsize=figsize, facecolor='white')
+        self.canvas = FigureCanvasAgg(self.figure)
+
+        # Основная ось Y (слева) - для веса
+        ax1 = self.figure.add_subplot()
+        ax1.set_xlabel('Дата', fontsize=12)
+        ax1.set_ylabel('Вес (кг)', color=COLOR_WEIGHT, fontsize=12, fontweight='bold')
+        self.weight_line, = ax1.plot([], [], color=COLOR_WEIGHT, linewidth=2.5,
+                                     marker='o', markersize=6, label='Вес', alpha=0.9)
+        ax1.tick_params(axis='y', labelcolor=COLOR_WEIGHT)
+        ax1.grid(True, alpha=0.3, linestyle='--')
+
+        # Вторичная ось Y (справа) - для талии, шеи, калорий
+        ax2 = ax1.twinx()
+        self.waist_line, = ax2.plot([], [], color=COLOR_WAIST, linewidth=2,
+                                    marker='s', markersize=5, label='Талия (см)', alpha=0.8)
+        self.neck_line, = ax2.plot([], [], color=COLOR_NECK, linewidth=2,
+                                   marker='^', markersize=5, label='Шея (см)', alpha=0.8)
+        # Калории делим на 30 для приближения к масштабу см
+        self.calories_line, = ax2.plot([], [], color=COLOR_CALORIES, linewidth=2,
+                                       marker='D', markersize=4, label='Калории (×30)',
+                                       alpha=0.8, linestyle='--')
+        ax2.set_ylabel('Объемы (см) / Калории (×30)', color=COLOR_SECONDARY, fontsize=12, fontweight='bold')
+        ax2.tick_params(axis='y', labelcolor=COLOR_SECONDARY)
+
+        # Форматирование оси X (даты)
+        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+
+        # Заголовок
+        self.title = self.figure.suptitle('', fontsize=16, fontweight='bold')
+
+        # Объединенная легенда
+        lines = [self.weight_line, self.waist_line, self.neck_line, self.calories_line]
+        ax1.legend(lines, [line.get_label() for line in lines],
+                   loc='upper left', framealpha=0.9, fontsize=10)
+
+        self.ax1 = ax1
+        self.ax2 = ax2
+
+        # Поля фигуры до tight_layout (см. layout)
+        params = self.figure.subplotpars
+        self._subplot_params = dict(
+            left=params.left, right=params.right, bottom=params.bottom,
+            top=params.top, wspace=params.wspace, hspace=params.hspace
+        )
+
+    def render(self, columns: Columns, period_days: int) -> bytes:
+        """
+        Отрендерить график по колонкам данных.
+
+        Args:
+            columns: Колонки данных (см. visualization.series.rows_to_columns)
+            period_days: Период для отображения
+
+        Returns:
+            PNG-изображение
+        """
+        self.populate(columns, period_days)
+        self.layout()
+        return self.encode()
+
+    def populate(self, columns: Columns, period_days: int):
+        """
+        Подставить данные линий, границы осей и заголовок.
+        """
+        ax1, ax2 = self.ax1, self.ax2
+
+        # NaN в колонках - пропуски в линиях
+        x = mdates.date2num(columns['dates'])
+        self.weight_line.set_data(x, columns['weight'])
+        self.waist_line.set_data(x, columns['waist'])
+        self.neck_line.set_data(x, columns['neck'])
+        self.calories_line.set_data(x, columns['calories'] / 30)
+
+        # set_ylim предыдущего рендера отключает автомасштаб - включаем обратно
+        for ax in (ax1, ax2):
+            ax.set_autoscale_on(True)
+            ax.relim()
+            ax.autoscale_view()
+
+        # Установить шаг оси веса (0.5 кг = 500 грамм)
+        limits = weight_axis_limits(columns['weight'])
+        if limits is not None:
+            weight_min, weight_max = limits
+            ax1.set_yticks(np.arange(weight_min, weight_max + 0.1, 0.5))
+            ax1.set_ylim(weight_min, weight_max)
+        else:
+            # Нет веса за период - нейтральная шкала (иначе остались бы границы прошлого рендера)
+            ax1.yaxis.set_major_locator(AutoLocator())
+            ax1.set_ylim(0, 1)
+
+        # Нет талии, шеи и калорий - тоже нейтральная шкала: relim() без данных
+        # оставляет границы прошлого рендера, и одинаковые данные давали бы разные PNG
+        secondary = np.concatenate((columns['waist'], columns['neck'], columns['calories']))
+        if not np.isfinite(secondary).any():
+            ax2.set_ylim(0, 1)
+
+        # Меньше двух дат со значениями - автомасштаб оси дат вырожден (годы вокруг
+        # точки или границы прошлого рендера): ставим границы явно
+        values = np.vstack((columns['weight'], columns['waist'], columns['neck'], columns['calories']))
+        dated = x[np.isfinite(values).any(axis=0)]
+        if len(np.unique(dated)) < 2 and len(x):
+            around = dated if len(dated) else x
+            ax1.set_xlim(around.min() - 1, around.max() + 1)
+
+        ax1.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, len(x) // 10)))
+        for label in ax1.xaxis.get_majorticklabels():
+            label.set_rotation(45)
+            label.set_horizontalalignment('right')
+
+        # Заголовок
+        title = f'Прогресс за {period_days} дней'
+        if period_days == 7:
+            title = 'Прогресс за неделю'
+        elif period_days == 60:
+            title = 'Прогресс за 2 месяца'
+        self.title.set_text(title)
+
+    def layout(self):
+        """
+        Плотная компоновка (зависит от подписей осей, поэтому на каждый рендер).
+        """
+        # tight_layout считает от текущих полей: без сброса результат зависел бы
+        # (в последних знаках) от предыдущего рендера этого шаблона
+        self.figure.subplots_adjust(**self._subplot_params)
+        self.figure.tight_layout()
+
+    def encode(self, dpi: int = CHART_DPI, bbox_inches: Optional[str] = 'tight') -> bytes:
+        """
+        Сохранить фигуру в PNG через Agg canvas.
+
+        Args:
+            dpi: Разрешение PNG
+            bbox_inches: 'tight' - обрезать поля по содержимому, None - весь холст
+        """
+        buf = io.BytesIO()
+        self.figure.savefig(buf, format='png', dpi=dpi, bbox_inches=bbox_inches)
+        return buf.getvalue()
+
+
+def get_chart_template(figsize: Tuple[float, float] = CHART_SIZE) -> ChartTemplate:
+    """
+    Получить шаблон графика текущего потока (создается при первом обращении).
+
+    Args:
+        figsize: Размер фигуры в дюймах
+
+    Returns:
+        ChartTemplate
+    """
+    templates = getattr(_thread_local, 'templates', None)
+    if templates is None:
+        templates = _thread_local.templates = {}
+
+    template = templates.get(figsize)
+    if template is None:
+        template = templates[figsize] = ChartTemplate(figsize)
+    return template
 
 
 def generate_progress_chart(
@@ -28,153 +229,51 @@ def generate_progress_chart(
             - BytesIO с PNG-изображением
             - dict с метриками прогресса (начальный → текущий) или None если нет данных
     """
-    if not measurements:
+    png, metrics = render_progress_chart(measurements_to_columns(measurements), period_days)
+    if png is None:
         return None, None
+    return io.BytesIO(png), metrics
 
-    # Извлечь данные (с фильтрацией None)
-    dates = [m.date for m in measurements]
-
-    # Для графика нужны параллельные списки (date, value), None заменяем на пропуски
-    weights = [m.weight if m.weight is not None else None for m in measurements]
-    waists = [m.waist if m.waist is not None else None for m in measurements]
-    necks = [m.neck if m.neck is not None else None for m in measurements]
-    calories_list = [m.calories if m.calories is not None else None for m in measurements]
 
-    # Для метрик берем только не-None значения
-    weights_filtered = [m.weight for m in measurements if m.weight is not None]
-    waists_filtered = [m.waist for m in measurements if m.waist is not None]
-    necks_filtered = [m.neck for m in measurements if m.neck is not None]
-
-    # Вычислить метрики прогресса (только если есть данные)
-    metrics = {}
-    if weights_filtered:
-        metrics['weight_start'] = weights_filtered[0]
-        metrics['weight_current'] = weights_filtered[-1]
-        metrics['weight_diff'] = weights_filtered[-1] - weights_filtered[0]
-
-    if waists_filtered:
-        metrics['waist_start'] = waists_filtered[0]
-        metrics['waist_current'] = waists_filtered[-1]
-        metrics['waist_diff'] = waists_filtered[-1] - waists_filtered[0]
-
-    if necks_filtered:
-        metrics['neck_start'] = necks_filtered[0]
-        metrics['neck_current'] = necks_filtered[-1]
-        metrics['neck_diff'] = necks_filtered[-1] - necks_filtered[0]
-
-    # Создать фигуру
-    fig, ax1 = plt.subplots(figsize=(12, 7))
-    fig.patch.set_facecolor('white')
-
-    # Основная ось Y (слева) - для веса
-    color_weight = '#2E86AB'
-    color_secondary = '#666666'  # Серый цвет для правой оси
-
-    ax1.set_xlabel('Дата', fontsize=12)
-    ax1.set_ylabel('Вес (кг)', color=color_weight, fontsize=12, fontweight='bold')
-    ax1.plot(dates, weights, color=color_weight, linewidth=2.5,
-             marker='o', markersize=6, label='Вес', alpha=0.9)
-    ax1.tick_params(axis='y', labelcolor=color_weight)
-    ax1.grid(True, alpha=0.3, linestyle='--')
-
-    # Установить шаг оси веса (0.5 кг = 500 грамм)
-    if weights_filtered:
-        min_weight = min(weights_filtered)
-        max_weight = max(weights_filtered)
-        # Округлить границы до 0.5 кг
-        weight_min = (min_weight // 0.5) * 0.5 - 0.5  # На 0.5 кг ниже
-        weight_max = (max_weight // 0.5 + 1) * 0.5 + 0.5  # На 0.5 кг выше
-        ax1.set_yticks(np.arange(weight_min, weight_max + 0.1, 0.5))
-        ax1.set_ylim(weight_min, weight_max)
-
-    # Вторичная ось Y (справа) - для талии, шеи, калорий
-    ax2 = ax1.twinx()
-
-    # Цвета для остальных показателей
-    color_waist = '#A23B72'
-    color_neck = '#F18F01'
-    color_calories = '#06A77D'
-
-    ax2.plot(dates, waists, color=color_waist, linewidth=2,
-             marker='s', markersize=5, label='Талия (см)', alpha=0.8)
-    ax2.plot(dates, necks, color=color_neck, linewidth=2,
-             marker='^', markersize=5, label='Шея (см)', alpha=0.8)
-
-    # Калории на отдельной шкале (нормализуем для визуализации)
-    # Делим калории на 30 для приближения к масштабу см (пропускаем None)
-    calories_scaled = [c / 30 if c is not None else None for c in calories_list]
-    ax2.plot(dates, calories_scaled, color=color_calories, linewidth=2,
-             marker='D', markersize=4, label='Калории (×30)', alpha=0.8, linestyle='--')
-
-    ax2.set_ylabel('Объемы (см) / Калории (×30)', color=color_secondary, fontsize=12, fontweight='bold')
-    ax2.tick_params(axis='y', labelcolor=color_secondary)
-
-    # Форматирование оси X (даты)
-    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
-    ax1.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, len(dates) // 10)))
-    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=45, ha='right')
-
-    # Заголовок
-    title = f'Прогресс за {period_days} дней'
-    if period_days == 7:
-        title = 'Прогресс за неделю'
-    elif period_days == 60:
-        title = 'Прогресс за 2 месяца'
-
-    fig.suptitle(title, fontsize=16, fontweight='bold')
-
-    # Объединенная легенда
-    lines1, labels1 = ax1.get_legend_handles_labels()
-    lines2, labels2 = ax2.get_legend_handles_labels()
-    ax1.legend(lines1 + lines2, labels1 + labels2,
-               loc='upper left', framealpha=0.9, fontsize=10)
-
-    # Плотная компоновка
-    fig.tight_layout()
-
-    # Сохранить в BytesIO
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-    buf.seek(0)
-    plt.close(fig)
-
-    return buf, metrics
-
-
-def format_metrics_message(metrics: dict) -> str:
+def render_progress_chart(
+    columns: Columns,
+    period_days: int = 30,
+    figsize: Tuple[float, float] = CHART_SIZE
+) -> Tuple[Optional[bytes], Optional[dict]]:
     """
-    Форматирует метрики прогресса в текстовое сообщение.
+    Рендерит PNG-график с 4 показателями из колонок данных.
 
     Args:
-        metrics: Словарь с метриками (поля опциональны)
+        columns: Колонки данных (см. visualization.series.rows_to_columns)
+        period_days: Период для отображения (по умолчанию 30 дней)
+        figsize: Размер фигуры в дюймах
 
     Returns:
-        Отформатированная строка с метриками
+        Tuple[bytes, dict]:
+            - PNG-изображение
+            - dict с метриками прогресса (начальный → текущий) или None если нет данных
     """
-    message_parts = ["📊 Прогресс:\n"]
-
-    # Вес
-    if 'weight_diff' in metrics:
-        weight_emoji = "📉" if metrics['weight_diff'] < 0 else "📈" if metrics['weight_diff'] > 0 else "➡️"
-        message_parts.append(
-            f"{weight_emoji} Вес: {metrics['weight_start']:.1f}кг → {metrics['weight_current']:.1f}кг "
-            f"({metrics['weight_diff']:+.1f}кг)\n"
-        )
+    if len(columns['dates']) == 0:
+        return None, None
 
-    # Талия
-    if 'waist_diff' in metrics:
-        waist_emoji = "📉" if metrics['waist_diff'] < 0 else "📈" if metrics['waist_diff'] > 0 else "➡️"
-        message_parts.append(
-            f"{waist_emoji} Талия: {metrics['waist_start']:.1f}см → {metrics['waist_current']:.1f}см "
-            f"({metrics['waist_diff']:+.1f}см)\n"
-        )
+    # Вычислить метрики прогресса (только если есть данные)
+    metrics = compute_progress_metrics(columns)
 
-    # Шея
-    if 'neck_diff' in metrics:
-        neck_emoji = "📉" if metrics['neck_diff'] < 0 else "📈" if metrics['neck_diff'] > 0 else "➡️"
-        message_parts.append(
-            f"{neck_emoji} Шея: {metrics['neck_start']:.1f}см → {metrics['neck_current']:.1f}см "
-            f"({metrics['neck_diff']:+.1f}см)\n"
-        )
+    png = get_chart_template(figsize).render(columns, period_days)
+    return png, metrics
 
-    return "".join(message_parts)
+
+def warm_up():
+    """
+    Прогреть matplotlib: загрузить шрифты и построить шаблон графика,
+    отрендерив его на минимальных данных.
+    Вызывается при старте процесса рендеринга.
+    """
+    from datetime import date, timedelta
+
+    today = date.today()
+    columns = rows_to_columns([
+        (today - timedelta(days=1), 80.0, 90.0, None, 2000),
+        (today, 79.5, None, 40.0, None),
+    ])
+    render_progress_chart(columns, 7)
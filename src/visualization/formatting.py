@@ -0,0 +1,105 @@
+"""
+Текстовое представление метрик прогресса.
+
+Модуль без тяжелых зависимостей (matplotlib, numpy), чтобы обработчики
+бота могли импортировать его при старте.
+"""
+
+
+def format_metrics_message(metrics: dict, title: str = "📊 Прогресс:") -> str:
+    """
+    Форматирует метрики прогресса в текстовое сообщение.
+
+    Args:
+        metrics: Словарь с метриками (поля опциональны)
+        title: Заголовок сообщения
+
+    Returns:
+        Отформатированная строка с метриками
+    """
+    message_parts = [f"{title}\n"]
+
+    # Вес
+    if 'weight_diff' in metrics:
+        weight_emoji = "📉" if metrics['weight_diff'] < 0 else "📈" if metrics['weight_diff'] > 0 else "➡️"
+        message_parts.append(
+            f"{weight_emoji} Вес: {metrics['weight_start']:.1f}кг → {metrics['weight_current']:.1f}кг "
+            f"({metrics['weight_diff']:+.1f}кг)\n"
+        )
+
+    # Талия
+    if 'waist_diff' in metrics:
+        waist_emoji = "📉" if metrics['waist_diff'] < 0 else "📈" if metrics['waist_diff'] > 0 else "➡️"
+        message_parts.append(
+            f"{waist_emoji} Талия: {metrics['waist_start']:.1f}см → {metrics['waist_current']:.1f}см "
+            f"({metrics['waist_diff']:+.1f}см)\n"
+        )
+
+    # Шея
+    if 'neck_diff' in metrics:
+        neck_emoji = "📉" if metrics['neck_diff'] < 0 else "📈" if metrics['neck_diff'] > 0 else "➡️"
+        message_parts.append(
+            f"{neck_emoji} Шея: {metrics['neck_start']:.1f}см → {metrics['neck_current']:.1f}см "
+            f"({metrics['neck_diff']:+.1f}см)\n"
+        )
+
+    return "".join(message_parts)
+
+
+def _format_trend(trend_kg_per_week: float) -> str:
+    """Строка тренда веса с эмодзи направления."""
+    trend_emoji = "📉" if trend_kg_per_week < -0.05 else "📈" if trend_kg_per_week > 0.05 else "➡️"
+    return f"{trend_emoji} Тренд: {trend_kg_per_week:+.2f} кг/нед"
+
+
+def format_trend_message(summary) -> str:
+    """
+    Форматирует сглаженную статистику (тренд и TDEE) для подписи к графику.
+
+    Args:
+        summary: visualization.analytics.TrendSummary
+
+    Returns:
+        Строки с трендом и TDEE или пустая строка, если данных мало
+    """
+    message_parts = []
+
+    if summary.trend_kg_per_week is not None:
+        message_parts.append(
+            f"{_format_trend(summary.trend_kg_per_week)} (сглаженный вес {summary.weight_ema:.1f}кг)\n"
+        )
+
+    if summary.tdee is not None:
+        message_parts.append(f"🔥 Расход (TDEE): ~{summary.tdee:.0f} ккал/день\n")
+
+    return "".join(message_parts)
+
+
+def format_weekly_report(summary) -> str:
+    """
+    Форматирует еженедельный отчет пользователя.
+
+    Args:
+        summary: visualization.analytics.TrendSummary
+
+    Returns:
+        Текст отчета
+    """
+    message_parts = ["📅 Итоги недели\n\n"]
+
+    if summary.weight_ema is not None:
+        message_parts.append(f"⚖️ Сглаженный вес: {summary.weight_ema:.1f}кг\n")
+    if summary.trend_kg_per_week is not None:
+        message_parts.append(f"{_format_trend(summary.trend_kg_per_week)}\n")
+    if summary.tdee is not None:
+        message_parts.append(f"🔥 Расход (TDEE): ~{summary.tdee:.0f} ккал/день\n")
+
+    if summary.avg_calories is not None:
+        message_parts.append(f"🍽 Средние калории: {summary.avg_calories:.0f} ккал/день\n")
+    if summary.tdee is not None and summary.avg_calories is not None:
+        balance = summary.avg_calories - summary.tdee
+        label = "Дефицит" if balance < 0 else "Профицит"
+        message_parts.append(f"⚖️ {label}: ~{abs(balance):.0f} ккал/день\n")
+
+    message_parts.append(f"\nВзвешиваний за 4 недели: {summary.weight_points}")
+    return "".join(message_parts)
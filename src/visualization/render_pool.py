@@ -0,0 +1,185 @@
+"""
+Пул процессов для рендеринга графиков.
+
+matplotlib рендерит PNG 150-400 мс и держит GIL, поэтому графики строятся
+в отдельных процессах. Воркеры заранее импортируют matplotlib и прогревают
+шрифты, а очередь ограничена: при перегрузке вызывающий получает
+RenderPoolBusy и может сразу ответить пользователю.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from monitoring.metrics import metrics as bot_metrics
+
+# numpy/matplotlib импортируются только в воркерах и при первом графике
+if TYPE_CHECKING:
+    from visualization.series import Columns
+
+logger = logging.getLogger(__name__)
+
+# Количество процессов рендеринга
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', str(min(2, os.cpu_count() or 1))))
+# Сколько запросов может ждать в очереди сверх занятых воркеров
+CHART_QUEUE_SIZE = int(os.getenv('CHART_QUEUE_SIZE', '8'))
+
+
+class RenderPoolBusy(Exception):
+    """Очередь рендеринга переполнена."""
+
+
+def _init_worker():
+    """
+    Инициализация процесса рендеринга: backend Agg и прогрев шрифтов.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from visualization.charts import warm_up
+    warm_up()
+
+
+def _render_in_worker(columns: "Columns", period_days: int) -> Tuple[Optional[bytes], Optional[dict], float]:
+    """
+    Рендеринг графика внутри процесса пула.
+
+    Returns:
+        PNG, метрики прогресса и время рендеринга в процессе (сек)
+    """
+    from visualization.charts import render_progress_chart
+    started = time.perf_counter()
+    png, metrics = render_progress_chart(columns, period_days)
+    return png, metrics, time.perf_counter() - started
+
+
+def _noop() -> None:
+    """Пустая задача для запуска воркеров при старте пула."""
+
+
+class ChartRenderPool:
+    """
+    Ограниченный пул процессов для рендеринга графиков.
+
+    Args:
+        workers: Количество процессов
+        queue_size: Максимум ожидающих запросов сверх занятых воркеров
+    """
+
+    def __init__(self, workers: int = CHART_WORKERS, queue_size: int = CHART_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.max_pending = self.workers + max(0, queue_size)
+        self._pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pending(self) -> int:
+        """Количество запросов в работе и в очереди."""
+        return self._pending
+
+    def start(self):
+        """
+        Запустить процессы и прогреть их.
+
+        Используется forkserver: воркеры форкаются из чистого процесса
+        с уже импортированным matplotlib, а не из процесса бота с потоками.
+        Предзагружается только visualization.charts: с __main__ forkserver
+        выполнял бы импорты main.py (dotenv, обработчики, persistence, мониторинг).
+        """
+        if self._executor is not None:
+            return
+
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['visualization.charts'])
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_worker
+        )
+        for _ in range(self.workers):
+            self._executor.submit(_noop)
+
+        logger.info(f"Chart render pool started: {self.workers} workers, {self.max_pending} max pending")
+
+    async def render(
+        self,
+        columns: "Columns",
+        period_days: int
+    ) -> Tuple[Optional[bytes], Optional[dict]]:
+        """
+        Отрендерить график в пуле процессов.
+
+        Args:
+            columns: Колонки данных (см. visualization.series.rows_to_columns)
+            period_days: Период для отображения
+
+        Returns:
+            Tuple[bytes, dict]: PNG-изображение и метрики (см. render_progress_chart)
+
+        Raises:
+            RenderPoolBusy: Если очередь рендеринга переполнена
+            BrokenProcessPool: Если процесс рендеринга упал и при повторе
+        """
+        if self._pending >= self.max_pending:
+            raise RenderPoolBusy()
+
+        self.start()
+        self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            try:
+                png, metrics, render_seconds = await self._submit(columns, period_days)
+            except BrokenProcessPool:
+                # Пул уже пересоздан - повторяем один раз
+                png, metrics, render_seconds = await self._submit(columns, period_days)
+        finally:
+            self._pending -= 1
+
+        # Остальное время - ожидание свободного процесса и передача данных
+        queue_seconds = time.perf_counter() - submitted - render_seconds
+        bot_metrics.observe_render(period_days, render_seconds, queue_seconds, len(png) if png else 0)
+        return png, metrics
+
+    async def _submit(self, columns: "Columns", period_days: int) -> Tuple[Optional[bytes], Optional[dict], float]:
+        """
+        Выполнить рендеринг в текущем пуле; сломанный пул пересоздается.
+
+        Raises:
+            BrokenProcessPool: Если процесс пула упал
+        """
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, _render_in_worker, columns, period_days)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """
+        Заменить сломанный пул новым.
+
+        После падения процесса (OOM, segfault) ProcessPoolExecutor больше
+        не принимает задачи. Пересоздается только если пул еще не заменили
+        из-за другого рендеринга, упавшего одновременно.
+        """
+        if self._executor is not broken:
+            return
+        logger.error("Chart render worker died, restarting render pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.start()
+
+    def shutdown(self):
+        """
+        Остановить процессы рендеринга.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+render_pool = ChartRenderPool()
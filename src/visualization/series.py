@@ -0,0 +1,130 @@
+"""
+Подготовка данных для графиков.
+
+Преобразует записи в колоночный вид (NumPy массивы), который можно
+передать в процесс рендеринга без ORM-объектов, и векторно считает
+по нему метрики без импорта matplotlib.
+
+Формат колонок:
+- 'dates': datetime64[D]
+- 'weight', 'waist', 'neck', 'calories': float64, NaN для пропусков
+"""
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from database.models import Measurement
+
+# Колонки со значениями показателей
+VALUE_COLUMNS = ('weight', 'waist', 'neck', 'calories')
+
+# Версия оформления графика: увеличить при изменении charts.py,
+# чтобы сохраненные file_id старых графиков перестали использоваться
+CHART_STYLE_VERSION = 1
+
+Columns = Dict[str, np.ndarray]
+
+
+def rows_to_columns(rows: Iterable[tuple]) -> Columns:
+    """
+    Преобразовать строки (date, weight, waist, neck, calories) в колонки за один проход.
+
+    Args:
+        rows: Строки, отсортированные по дате
+
+    Returns:
+        dict с колонками (см. описание модуля)
+    """
+    rows = list(rows)
+    if not rows:
+        columns = {'dates': np.empty(0, dtype='datetime64[D]')}
+        for name in VALUE_COLUMNS:
+            columns[name] = np.empty(0, dtype=float)
+        return columns
+
+    dates, *values = zip(*rows)
+    columns = {'dates': np.array(dates, dtype='datetime64[D]')}
+    for name, column in zip(VALUE_COLUMNS, values):
+        # None → NaN
+        columns[name] = np.array(column, dtype=float)
+    return columns
+
+
+def measurements_to_columns(measurements: List[Measurement]) -> Columns:
+    """
+    Преобразовать список Measurement в колонки.
+
+    Args:
+        measurements: Список записей Measurement (отсортированных по дате)
+
+    Returns:
+        dict с колонками (см. описание модуля)
+    """
+    return rows_to_columns(
+        (m.date, m.weight, m.waist, m.neck, m.calories) for m in measurements
+    )
+
+
+def compute_progress_metrics(columns: Columns) -> dict:
+    """
+    Вычислить метрики прогресса (начальный → текущий) по колонкам.
+
+    Args:
+        columns: Колонки данных (см. rows_to_columns)
+
+    Returns:
+        dict с полями <metric>_start/_current/_diff для веса, талии и шеи
+        (только для показателей, по которым есть данные)
+    """
+    metrics = {}
+    for name in ('weight', 'waist', 'neck'):
+        values = columns[name]
+        present = np.flatnonzero(~np.isnan(values))
+        if present.size:
+            start = float(values[present[0]])
+            current = float(values[present[-1]])
+            metrics[f'{name}_start'] = start
+            metrics[f'{name}_current'] = current
+            metrics[f'{name}_diff'] = current - start
+    return metrics
+
+
+def weight_axis_limits(weights: np.ndarray, step: float = 0.5) -> Optional[Tuple[float, float]]:
+    """
+    Границы оси веса, округленные до шага, с запасом в один шаг.
+
+    Args:
+        weights: Колонка веса (NaN для пропусков)
+        step: Шаг оси (по умолчанию 0.5 кг)
+
+    Returns:
+        (min, max) или None если нет ни одного значения
+    """
+    if np.isnan(weights).all():
+        return None
+
+    min_weight = np.nanmin(weights)
+    max_weight = np.nanmax(weights)
+    weight_min = (min_weight // step) * step - step  # На шаг ниже
+    weight_max = (max_weight // step + 1) * step + step  # На шаг выше
+    return float(weight_min), float(weight_max)
+
+
+def series_hash(columns: Columns, period_days: int) -> str:
+    """
+    Хэш содержимого графика: одинаковые данные дают одинаковую картинку.
+
+    Args:
+        columns: Колонки данных (см. rows_to_columns)
+        period_days: Период для отображения
+
+    Returns:
+        SHA-256 в hex
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{CHART_STYLE_VERSION}|{period_days}".encode())
+    for name in ('dates',) + VALUE_COLUMNS:
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(columns[name]).tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,67 @@
+"""
+Тесты шаблона графика: рендер не зависит от того, что шаблон рисовал раньше.
+
+Запуск: python -m pytest -q tests
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from visualization.charts import CHART_SIZE, ChartTemplate  # noqa: E402
+from visualization.series import rows_to_columns  # noqa: E402
+
+
+def make_rows(days: int, waist: bool = True, neck: bool = True, calories: bool = True, weight: bool = True):
+    """Строки (date, weight, waist, neck, calories) за days дней до сегодня."""
+    today = date.today()
+    return [
+        (
+            today - timedelta(days=offset),
+            round(80 - offset * 0.1, 1) if weight else None,
+            90.0 if waist else None,
+            40.0 if neck else None,
+            2000 if calories else None,
+        )
+        for offset in range(days - 1, -1, -1)
+    ]
+
+
+SERIES = {
+    'full': (make_rows(10), 30),
+    'weight_only': (make_rows(10, waist=False, neck=False, calories=False), 30),
+    'calories_only': (make_rows(5, weight=False, waist=False, neck=False), 7),
+    'single_point': (make_rows(1), 7),
+    'empty_values': (make_rows(3, weight=False, waist=False, neck=False, calories=False), 7),
+}
+
+
+def render(template: ChartTemplate, name: str) -> bytes:
+    rows, period_days = SERIES[name]
+    return template.render(rows_to_columns(rows), period_days)
+
+
+@pytest.mark.parametrize('previous', sorted(SERIES))
+@pytest.mark.parametrize('current', sorted(SERIES))
+def test_reused_template_renders_same_png(previous, current):
+    if previous == current:
+        pytest.skip('same series')
+
+    reused = ChartTemplate(CHART_SIZE)
+    render(reused, previous)
+
+    assert render(reused, current) == render(ChartTemplate(CHART_SIZE), current)
+
+
+def test_secondary_axis_reset_without_data():
+    reused = ChartTemplate(CHART_SIZE)
+    render(reused, 'full')
+    render(reused, 'weight_only')
+
+    fresh = ChartTemplate(CHART_SIZE)
+    render(fresh, 'weight_only')
+
+    assert reused.ax2.get_ylim() == fresh.ax2.get_ylim()
@@ -0,0 +1,110 @@
+"""
+Планы запросов к measurements.
+
+Временная БД создается миграциями Alembic, реальные функции из
+database.queries выполняются на ней, их SQL перехватывается и проверяется
+EXPLAIN QUERY PLAN: каждый запрос должен искать по индексу
+uix_measurements_user_date (без полного сканирования таблицы и без
+сортировки во временном B-tree).
+
+Запуск: python -m pytest -q tests/test_query_plans.py
+(или python scripts/check_query_plans.py)
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+from migrate import run_migrations  # noqa: E402
+from database import queries  # noqa: E402
+
+INDEX_NAME = 'uix_measurements_user_date'
+USER_ID = 1
+
+CHECKS = {
+    'get_measurements_by_period': (USER_ID, 30),
+    'get_measurement_rows_by_period': (USER_ID, 30),
+    'get_last_measurements': (USER_ID, 5),
+    'get_measurement_by_date': (USER_ID, date.today()),
+}
+
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    """БД по миграциям с замерами двух пользователей за 60 дней."""
+    db_path = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # DB_PATH читают migrate.py и alembic/env.py
+        monkeypatch.setenv('DB_PATH', db_path)
+        assert run_migrations() == 0
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    db = sessionmaker(bind=engine)()
+    try:
+        today = date.today()
+        for offset in range(60):
+            queries.create_measurement(db, USER_ID, today - timedelta(days=offset), weight=80.0 + offset / 10)
+            queries.create_measurement(db, USER_ID + 1, today - timedelta(days=offset), weight=90.0)
+    finally:
+        db.close()
+
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    yield engine
+    engine.dispose()
+
+
+def capture_statements(engine, func, *args) -> list:
+    """
+    Выполнить func(db, *args) и вернуть выполненные SELECT к measurements.
+
+    Returns:
+        Список (sql, parameters)
+    """
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM measurements' in statement:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    db = sessionmaker(bind=engine)()
+    try:
+        func(db, *args)
+    finally:
+        db.close()
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return captured
+
+
+def query_plan(engine, statement: str, parameters) -> list:
+    """
+    Получить строки EXPLAIN QUERY PLAN для запроса.
+
+    Returns:
+        Список описаний шагов плана (колонка detail)
+    """
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+@pytest.mark.parametrize('name', sorted(CHECKS))
+def test_measurement_query_uses_index(engine, name):
+    statements = capture_statements(engine, getattr(queries, name), *CHECKS[name])
+    assert statements, f"{name}: no SELECT captured"
+
+    for statement, parameters in statements:
+        plan = query_plan(engine, statement, parameters)
+        details = '\n'.join(plan)
+        assert any(INDEX_NAME in step and step.startswith('SEARCH') for step in plan), \
+            f"{name} does not search by {INDEX_NAME}:\n{details}"
+        assert not any(step.startswith('SCAN') for step in plan), f"{name} scans a table:\n{details}"
+        assert not any('TEMP B-TREE' in step for step in plan), f"{name} sorts in a temp B-tree:\n{details}"